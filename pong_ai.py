@@ -0,0 +1,199 @@
+from __future__ import print_function
+
+import random
+import numpy as np
+from pong_model import *
+
+''' Computer player. A predictor plays a paddle by working out where the
+ball will cross the paddle's line. It follows the ball through bounces off
+the walls and the other paddle, portal jumps and gravity, using only what
+a player can see: where the ball is, where it is going and the field. The
+prediction is kept until game.trajectory_changes says the path of the
+ball has changed, so most ticks cost nothing. A reaction delay and an
+aiming error make it beatable.'''
+
+NOT_WALLS = ["paddleA", "paddleB", "monster"] # moving, not followed
+
+def entry_time(box, x, y, vx, vy):
+	# time when a point at x, y moving with vx, vy is first inside box
+	# (left, top, right, bottom), 0 if it is inside, inf if never
+	# inside is strict, like piece.check_inscreen
+	start = 0.0
+	end = float("inf")
+	for p, v, low, high in ((x, vx, box[0], box[2]), (y, vy, box[1], box[3])):
+		if v == 0:
+			if p <= low or p >= high:
+				return float("inf")
+			continue
+		first = (low - p)/v
+		last = (high - p)/v
+		if first > last:
+			first, last = last, first
+		start = max(start, first)
+		end = min(end, last)
+	return start if start < end else float("inf")
+
+def inside(box, x, y):
+	return box[0] < x < box[2] and box[1] < y < box[3]
+
+class predictor:
+	''' Policy (see pong_headless) moving a paddle to where the ball is
+	predicted to cross the paddle's line. delay is the number of ticks
+	before the paddle reacts to a new prediction, and error the standard
+	deviation in pixels of where it aims. seed is for the error only: the
+	game's own random generator is never used, so the game plays out the
+	same as with any other policy giving the same moves.'''
+	def __init__(self, delay=10, error=8.0, seed=None, max_ticks=2000,
+			max_bounces=16):
+		self.delay = delay
+		self.error = error
+		self.rng = random.Random(seed)
+		self.max_ticks = max_ticks # how far ahead the ball is followed
+		self.max_bounces = max_bounces
+		self.deadzone = 4 # pixels from the aim where the paddle stays still
+		self.match = None
+		self.changes = None # trajectory_changes of the cached prediction
+		self.tick = 0
+		self.pending = [] # (tick it is used from, aim), in tick order
+		self.aim = None # y the paddle moves to, None for the middle
+		self.predictions = 0
+
+	def __call__(self, match, paddle):
+		if match is not self.match or match.trajectory_changes != self.changes:
+			self.match = match
+			self.changes = match.trajectory_changes
+			aim = self.predict(match, paddle)
+			if aim is not None and self.error:
+				aim += self.rng.gauss(0, self.error)
+			self.pending.append((self.tick + self.delay, aim))
+			self.predictions += 1
+		while self.pending and self.pending[0][0] <= self.tick:
+			self.aim = self.pending.pop(0)[1]
+		self.tick += 1
+
+		aim = self.aim if self.aim is not None else 150.0
+		gap = aim - match.parts[paddle].coords[1]
+		if gap < -self.deadzone:
+			return -1
+		elif gap > self.deadzone:
+			return 1
+		return 0
+
+	def predict(self, match, paddle):
+		# y where the ball crosses the line of paddle, None if it does not
+		# within max_ticks
+		# the ball is followed from one event to the next (a wall or the
+		# other paddle, a portal, the gravity field); in the gravity field
+		# it is followed tick by tick, as the model moves it
+		own = match.parts[paddle]
+		other = match.parts["paddleA" if paddle == "paddleB" else "paddleB"]
+		ball = match.ball
+		half = ball.dimensions[0]
+		side = 1 if own.coords[0] > other.coords[0] else -1 # own on the right
+		target_x = own.coords[0] - side*(own.dimensions[0] + half)
+		other_x = other.coords[0] + side*(other.dimensions[0] + half)
+
+		# lines of the walls that stay still, without broken out ones
+		rows = [np.arange(match.wall_rows[key].start, match.wall_rows[key].stop)
+			for key in match.wall_keys if key not in NOT_WALLS]
+		lines = match.segments[np.concatenate(rows)] if rows else np.zeros((0, 4))
+		direction = lines[:, 2:4] - lines[:, 0:2]
+		lines = lines[(direction**2).sum(1) > 0]
+
+		# portals: box the ball jumps from and the jump, as in
+		# Portal.transport; a portal with random exits is expected to use
+		# its most likely one
+		portals = []
+		if "portal1" in match.parts or "portal2" in match.parts:
+			gate = match.gate
+			if not gate.compiled:
+				gate.compile()
+			for box, (targets, jumps, bounds) in zip(gate.box_list, gate.exits):
+				weights = np.diff([0.0] + bounds)
+				portals.append((box, jumps[int(np.argmax(weights))]))
+		field = None
+		if "planet" in match.parts:
+			field = match.planet.positions[[0, 1, 2, 5]]
+			gx, gy = match.planet.gravity
+
+		x, y = ball.coords.tolist()
+		vx, vy = ball.velocity.tolist()
+		elapsed = 0.0
+		for bounce in range(self.max_bounces):
+			if field is not None and inside(field, x, y):
+				# gravity: velocity changes, then the ball moves, each tick
+				while inside(field, x, y) and elapsed < self.max_ticks:
+					vx += gx
+					vy += gy
+					x += vx
+					y += vy
+					elapsed += 1
+					if (x - target_x)*side >= 0:
+						return y
+				continue
+
+			# time to the next event of each kind
+			events = [float("inf")]*5
+			if vx*side > 0:
+				events[0] = (target_x - x)/vx
+			elif vx*side < 0:
+				events[1] = (other_x - x)/vx
+			if len(lines):
+				times = segment_contacts(lines, [x, y], [vx, vy], ball.radius)
+				wall = np.argmin(times)
+				events[2] = times[wall]
+			if portals:
+				portal_times = [entry_time(box, x, y, vx, vy) for box, jump in portals]
+				portal = int(np.argmin(portal_times))
+				events[3] = portal_times[portal]
+			if field is not None:
+				events[4] = entry_time(field, x, y, vx, vy)
+			event = int(np.argmin(events))
+			t = events[event]
+			if elapsed + t > self.max_ticks:
+				return None
+			x += vx*t
+			y += vy*t
+			elapsed += t
+
+			if event == 0:
+				return y
+			elif event == 1:
+				vx = -vx # the other paddle is expected to return the ball
+			elif event == 2:
+				# reflected off the wall line, like piece.reflect2
+				dx, dy = lines[wall, 2:4] - lines[wall, 0:2]
+				length = np.sqrt(dx*dx + dy*dy)
+				nx, ny = dy/length, -dx/length
+				along = vx*nx + vy*ny
+				vx -= 2*along*nx
+				vy -= 2*along*ny
+			elif event == 3:
+				jx, jy = portals[portal][1]
+				x += jx
+				y += jy
+			else:
+				# one step into the field, then followed tick by tick
+				x += vx*1e-6
+				y += vy*1e-6
+		return None
+
+if __name__ == "__main__":
+	import sys
+	import time
+	from pong_headless import headless, track_ball
+	# the predictor against the ball tracker, one game per obstacle
+	ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	for obstacle in ["bumper", "switcheroo", "planet", "gate", "monster"]:
+		match = game(seed=1)
+		match.fixed_obstacle = obstacle
+		match.reset_pieces(new_game=1)
+		player = predictor(seed=1)
+		runner = headless(match, policyA=track_ball, policyB=player)
+		start = time.time()
+		runner.run(ticks)
+		elapsed = time.time() - start
+		# score_player2 is the points of paddleA (see update_score)
+		print("%-10s predictor %3d - %3d track_ball, %5d predictions in %d "
+			"ticks, %.0f ticks/s" % (obstacle, match.score_player1,
+			match.score_player2, player.predictions, ticks, ticks/elapsed))
@@ -0,0 +1,285 @@
+import numpy as np
+from pong_model import segment_hits
+
+''' Batched version of the model. A world holds K independent games as
+arrays (struct of arrays) instead of one set of piece objects per game, so
+one call to step moves, collides, applies obstacles and scores every game.
+The rules are the ones in pong_model: hit_check, reflect2, gravity_field,
+chaotic_field, Portal and creature.'''
+
+# obstacle numbers, in the same order as game.init_obstacles
+BUMPER, SWITCHEROO, PLANET, GATE, MONSTER = range(5)
+OBSTACLES = ["bumper", "switcheroo", "planet", "gate", "monster"]
+
+# bodies that own wall segments
+BORDER, PADDLE_A, PADDLE_B, WALL_BUMPER, WALL_MONSTER = range(5)
+
+# segment slots of each body: border 4, paddles 5 (pentagon), bumper 4, monster 4
+SLOTS = [4, 5, 5, 4, 4]
+OWNER = np.repeat(np.arange(5), SLOTS)
+FIRST = np.concatenate([[0], np.cumsum(SLOTS)[:-1]])
+
+# bodies in the order game.collide visits their walls: the paddles and the
+# border (init_main_pieces), then the obstacle's wall (choose_obstacle)
+WALL_ORDER = [PADDLE_A, PADDLE_B, BORDER, WALL_BUMPER, WALL_MONSTER]
+RANK = np.argsort(WALL_ORDER) # place of each body in WALL_ORDER
+
+# the first body (in WALL_ORDER) that the mover hits gets the reflection
+# within a body the last hit line is used, like hit_check
+PRIORITY = (len(WALL_ORDER) - RANK[OWNER]) * len(OWNER) + np.arange(len(OWNER))
+
+BALL_START = np.array([300., 150.])
+BALL_VELOCITY = np.array([-1., 1.])
+PADDLE_START = np.array([[50., 150.], [550., 250.]])
+PADDLE_SIZE = np.array([10., 25.])
+MONSTER_START = np.array([120., 200.])
+MONSTER_VELOCITY = np.array([1., -1.])
+MONSTER_SIZE = np.array([15., 15.])
+BUMPER_SIZE = np.array([3., 50.])
+SWITCHEROO_BOX = np.array([270., 75., 330., 225.])
+PLANET_SIZE = np.array([50., 50.])
+PORTALS = np.array([[400., 250.], [200., 250.]])
+PORTAL_SIZE = np.array([20., 3.])
+
+def box_lines(size):
+	# line offsets of a rectangle centered on zero, same order as get_lines
+	w, h = size
+	positions = [-w, -h, w, -h, w, h, -w, h, -w, -h]
+	return np.array([positions[i-4:i] for i in range(4, 11, 2)])
+
+def paddle_lines(size, change):
+	# line offsets of a paddle, with the pentagon point of change_profile
+	w, h = size
+	positions = [-w, -h, w, -h, w, h, -w, h, -w, -h]
+	if change > 0:
+		positions[4:4] = [20, 0]
+	elif change < 0:
+		positions[8:8] = [-20, 0]
+	return np.array([positions[i-4:i] for i in range(4, len(positions)+1, 2)])
+
+def reflect(velocity, lines):
+	# vectorized reflect2: mirrors (N, 2) velocities in (N, 4) lines
+	x = lines[:, 2] - lines[:, 0]
+	y = lines[:, 3] - lines[:, 1]
+	line_norm = np.sqrt(x**2 + y**2)
+	line_orth = np.stack([y, -x], axis=1) / line_norm[:, None]
+	new_direction = (velocity*line_orth).sum(1)[:, None]*line_orth
+	return velocity - 2*new_direction
+
+class world:
+	''' This class holds K games as arrays. Bodies (border, paddles, bumper and
+	monster) have centers and velocities in (K, 5, 2) arrays, and their wall
+	segments are offsets from the body center in a (K, S, 4) array. The ball
+	has (K, 2) coords and velocity. step() advances every game one tick.'''
+	def __init__(self, count, seed=None):
+		self.count = count
+		self.rng = np.random.RandomState(seed)
+
+		self.ball_coords = np.tile(BALL_START, (count, 1))
+		self.ball_velocity = np.tile(BALL_VELOCITY, (count, 1))
+
+		self.centers = np.zeros((count, 5, 2))
+		self.velocities = np.zeros((count, 5, 2))
+		self.centers[:, BORDER] = [300, 150]
+		self.centers[:, PADDLE_A:PADDLE_B+1] = PADDLE_START
+		self.centers[:, WALL_MONSTER] = MONSTER_START
+		self.velocities[:, WALL_MONSTER] = MONSTER_VELOCITY
+		self.monster_count = np.zeros(count, dtype=int)
+
+		# wall segments are stored as offsets from the center of their body
+		self.offsets = np.zeros((count, len(OWNER), 4))
+		self.active = np.zeros((count, len(OWNER)), dtype=bool)
+		self.set_lines(slice(None), BORDER, box_lines([300, 150]))
+		self.set_lines(slice(None), WALL_BUMPER, box_lines(BUMPER_SIZE))
+		self.set_lines(slice(None), WALL_MONSTER, box_lines(MONSTER_SIZE))
+		self.bumper_alive = np.ones(count, dtype=bool)
+
+		self.obstacle = np.zeros(count, dtype=int)
+		self.planet = np.tile([300., 150.], (count, 1))
+		self.gravity = np.tile([0, 0.05], (count, 1))
+		self.switcheroo_count = np.ones(count, dtype=int)
+		# optional pong_forces.force_grid acting on every ball
+		self.forces = None
+
+		self.counter = np.ones(count, dtype=int)
+		self.hits = np.zeros(count, dtype=int)
+		self.scores = np.zeros((count, 2), dtype=int)
+
+		self.choose_obstacle(np.arange(count))
+
+	def set_lines(self, which, body, lines):
+		# writes the line offsets of a body into its segment slots
+		first = FIRST[body]
+		self.offsets[which, first:first+SLOTS[body]] = 0
+		self.offsets[which, first:first+len(lines)] = lines
+		self.active[which, first:first+SLOTS[body]] = False
+		self.active[which, first:first+len(lines)] = True
+
+	def paddle_shapes(self, which, change):
+		# switches paddles of the given games to pentagons or back to boxes
+		self.set_lines(which, PADDLE_A, paddle_lines(PADDLE_SIZE, change))
+		self.set_lines(which, PADDLE_B, paddle_lines(PADDLE_SIZE, -change))
+
+	def choose_obstacle(self, which):
+		# same as game.choose_obstacle for every game index in which
+		n = len(which)
+		if n == 0:
+			return
+		lottery = self.rng.randint(0, len(OBSTACLES), n)
+		self.obstacle[which] = lottery
+		even = lottery%2 == 0
+		self.paddle_shapes(which[even], 1)
+		self.paddle_shapes(which[~even], 0)
+
+		bumper = which[lottery == BUMPER]
+		self.centers[bumper, WALL_BUMPER] = np.stack(
+			[self.rng.randint(200, 401, len(bumper)), np.full(len(bumper), 150)], 1)
+		self.bumper_alive[bumper] = True
+
+		planet = which[lottery == PLANET]
+		x = self.rng.randint(200, 401, len(planet))
+		y = self.rng.randint(100, 201, len(planet))
+		self.planet[planet] = np.stack([x, y], 1)
+		# like gravity_field the sign flip is kept for later rounds
+		self.gravity[planet[y%2 == 1], 1] = -0.05
+
+		self.active[:, OWNER == WALL_BUMPER] = (
+			(self.obstacle == BUMPER) & self.bumper_alive)[:, None]
+		self.active[:, OWNER == WALL_MONSTER] = (self.obstacle == MONSTER)[:, None]
+
+	def reset(self, which, new_game=False):
+		# same as game.reset_pieces for every game index in which
+		# pieces are reset then moved one step, like move(reset=1)
+		self.ball_coords[which] = BALL_START + BALL_VELOCITY
+		self.ball_velocity[which] = BALL_VELOCITY
+		self.centers[which, PADDLE_A:PADDLE_B+1] = PADDLE_START
+		self.velocities[which, PADDLE_A:PADDLE_B+1] = 0
+		if new_game:
+			self.scores[which] = 0
+		self.choose_obstacle(which)
+
+	def segments(self):
+		# absolute segment coordinates of every game
+		centers = self.centers[:, OWNER]
+		return self.offsets + np.concatenate([centers, centers], axis=2)
+
+	def collide(self):
+		# collision step of game.update_pieces for the ball then the monster
+		segments = self.segments()
+		wall_velocity = self.velocities[:, OWNER]
+		monster = self.obstacle == MONSTER
+		# like game.update_pieces the counter only goes back to zero when the
+		# last wall checked (last in the walls dictionary) was not hit
+		last_body = np.where(self.obstacle == BUMPER, WALL_BUMPER,
+			np.where(monster, WALL_MONSTER, BORDER))
+		last_hit = np.zeros(self.count, dtype=bool)
+
+		movers = [(self.ball_coords, self.ball_velocity, 10, self.active, None),
+			(self.centers[:, WALL_MONSTER], self.velocities[:, WALL_MONSTER], 20,
+				self.active & (OWNER != WALL_MONSTER) & monster[:, None], monster)]
+		for coords, velocity, radius, active, mask in movers:
+			hits = segment_hits(segments, wall_velocity, coords, velocity,
+				radius) & active
+			found = hits.any(1)
+			body_hit = np.logical_or.reduceat(hits, FIRST, axis=1)
+			if mask is None:
+				last_hit = body_hit[np.arange(self.count), last_body]
+			else:
+				found &= mask
+				last_hit[mask] = body_hit[mask, BORDER]
+			games = np.nonzero(found & (self.counter < 1))[0]
+			if len(games) == 0:
+				continue
+			self.counter[games] += 1
+			slot = np.where(hits[games], PRIORITY, -1).argmax(1)
+			body = OWNER[slot]
+			velocity[games] = reflect(velocity[games], segments[games, slot])
+			self.velocities[games, body] = 0
+
+			if velocity is self.ball_velocity:
+				paddle = games[(body == PADDLE_A) | (body == PADDLE_B)]
+				self.hits[paddle] += 1
+				fast = paddle[self.hits[paddle] == 5]
+				self.hits[fast] = 0
+				self.ball_velocity[fast] *= 1.5
+			broken = games[body == WALL_BUMPER]
+			self.bumper_alive[broken] = False
+			self.active[broken[:, None], OWNER == WALL_BUMPER] = False
+
+		self.counter[~last_hit] = 0
+
+	def apply_obstacles(self):
+		# obstacle effects on the ball (chaotic field, portals and gravity)
+		x, y = self.ball_coords.T
+
+		left, top, right, bottom = SWITCHEROO_BOX
+		inside = ((self.obstacle == SWITCHEROO) & (y > top) & (y < bottom) &
+			(x > left) & (x < right))
+		self.switcheroo_count[inside] += 1
+		change = np.nonzero(inside & (self.switcheroo_count%20 == 0))[0]
+		self.ball_velocity[change] = self.rng.uniform(-3, 3, (len(change), 2))
+
+		gate = self.obstacle == GATE
+		for i in range(len(PORTALS)):
+			line1 = PORTALS[i]
+			line2 = PORTALS[i-1]
+			left, top = line1 - PORTAL_SIZE
+			right = line1[0] + PORTAL_SIZE[0]
+			bottom = line2[1] + PORTAL_SIZE[1]
+			x, y = self.ball_coords.T
+			inside = gate & (y > top) & (y < bottom) & (x > left) & (x < right)
+			new_coords = line2 - line1
+			new_coords = new_coords*(1+2*np.sqrt((PORTAL_SIZE**2).sum())/
+				np.sqrt((new_coords**2).sum()))
+			# the ball also takes a step, like move(reset=2)
+			self.ball_coords[inside] += new_coords + self.ball_velocity[inside]
+
+		x, y = self.ball_coords.T
+		left, top = (self.planet - PLANET_SIZE).T
+		right, bottom = (self.planet + PLANET_SIZE).T
+		inside = ((self.obstacle == PLANET) & (y > top) & (y < bottom) &
+			(x > left) & (x < right))
+		self.ball_velocity[inside] += self.gravity[inside]
+
+		if self.forces is not None:
+			self.ball_velocity += self.forces.sample_many(self.ball_coords)
+
+	def move(self):
+		# moves the ball, paddles and monster (only where it is chosen)
+		self.ball_coords += self.ball_velocity
+		self.centers[:, PADDLE_A:PADDLE_B+1] += self.velocities[:, PADDLE_A:PADDLE_B+1]
+
+		monster = np.nonzero(self.obstacle == MONSTER)[0]
+		self.centers[monster, WALL_MONSTER] += self.velocities[monster, WALL_MONSTER]
+		self.monster_count[monster] += 1
+		change = monster[self.monster_count[monster]%200 == 0]
+		self.velocities[change, WALL_MONSTER] = self.rng.randint(-5, 6,
+			(len(change), 2))
+
+	def steer(self, actions):
+		# same as game.steer_paddle for (K, 2) actions of -1 (up), 0 or 1 (down)
+		y = self.centers[:, PADDLE_A:PADDLE_B+1, 1]
+		height = PADDLE_SIZE[1]
+		up = (actions < 0) & (y > height)
+		down = ~up & (actions > 0) & (y < 300-height)
+		self.velocities[:, PADDLE_A:PADDLE_B+1, 1] = np.where(up, -2,
+			np.where(down, 2, 0))
+
+	def update_score(self):
+		# returns (K,) array: 0 no score, 1 player 1 scored, 2 player 2 scored
+		x = self.ball_coords[:, 0]
+		scored = np.where(x < 30, 1, np.where(x > 570, 2, 0))
+		self.scores[:, 0] += scored == 1
+		self.scores[:, 1] += scored == 2
+		return scored
+
+	def step(self, actions=None):
+		# one tick of every game, in the same order as the headless runner
+		self.collide()
+		self.apply_obstacles()
+		self.move()
+		if actions is not None:
+			self.steer(np.asarray(actions))
+		scored = self.update_score()
+		self.reset(np.nonzero(scored)[0])
+		return scored
@@ -0,0 +1,152 @@
+from __future__ import print_function
+
+import cProfile
+import json
+import os
+import pstats
+import time
+from pong_model import *
+from pong_headless import headless, track_ball, script
+
+try:
+	import tracemalloc # python 3 only
+except ImportError:
+	tracemalloc = None
+
+''' Benchmarks of the model. Each scenario plays a seeded game with one
+obstacle kept for every point, so it always measures the same thing. For
+each scenario we record ticks per second (with both math backends of the
+model), time spent in the model's functions and memory allocated per
+tick. Results are saved as JSON so runs can be compared over time.
+--update-golden stores the ball's path in each scenario as its golden
+trace; test_pong_model.py checks the ball still follows it and that both
+backends play the same game.'''
+
+# name: (obstacle kept in play, pentagon paddles)
+SCENARIOS = [
+	("bumper", "bumper", False),
+	("switcheroo", "switcheroo", False),
+	("planet", "planet", False),
+	("gate", "gate", False),
+	("monster", "monster", False),
+	("pentagon", "bumper", True),
+]
+SEED = 2015
+TICKS = 3000
+TRACE_EVERY = 10 # ticks between trace points kept in the golden file
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	"pong_bench_golden.json")
+
+def make_runner(obstacle, pentagon, seed=SEED, backend="scalar"):
+	# seeded game keeping one obstacle, with scripted paddles
+	match = game(seed=seed)
+	match.backend = backend
+	match.fixed_obstacle = obstacle
+	match.fixed_pentagon = pentagon
+	match.reset_pieces(new_game=1)
+	return headless(match, policyA=track_ball,
+		policyB=script([1]*30 + [-1]*33 + [0]*5))
+
+def trace(obstacle, pentagon, ticks=TICKS):
+	# ball coords every TRACE_EVERY ticks
+	runner = make_runner(obstacle, pentagon)
+	points = []
+	for tick in range(ticks):
+		runner.tick()
+		if tick % TRACE_EVERY == 0:
+			points.append([float(x) for x in runner.match.ball.coords])
+	return points
+
+def speed(obstacle, pentagon, ticks=TICKS, backend="scalar"):
+	runner = make_runner(obstacle, pentagon, backend=backend)
+	return runner.run(ticks)["ticks_per_second"]
+
+def profile(obstacle, pentagon, ticks=TICKS):
+	# seconds spent in each model function (including what it calls)
+	runner = make_runner(obstacle, pentagon)
+	profiler = cProfile.Profile()
+	profiler.runcall(runner.run, ticks)
+	stats = pstats.Stats(profiler).stats
+	times = {}
+	for (filename, line, name), (calls, primitive, total, cumulative,
+			callers) in stats.items():
+		if os.path.basename(filename) == "pong_model.py":
+			times[name] = times.get(name, 0) + cumulative
+	return times
+
+def allocations(obstacle, pentagon, ticks=TICKS):
+	# bytes allocated per tick: peak during the tick and kept after it
+	if tracemalloc is None:
+		return None
+	runner = make_runner(obstacle, pentagon)
+	tracemalloc.start()
+	start = tracemalloc.get_traced_memory()[0]
+	peak = 0
+	for tick in range(ticks):
+		before = tracemalloc.get_traced_memory()[0]
+		tracemalloc.reset_peak()
+		runner.tick()
+		peak += tracemalloc.get_traced_memory()[1] - before
+	kept = tracemalloc.get_traced_memory()[0] - start
+	tracemalloc.stop()
+	return {"peak_bytes_per_tick": peak/float(ticks),
+		"kept_bytes_per_tick": kept/float(ticks)}
+
+def run(update_golden=False):
+	# runs every scenario, returns results as a dictionary
+	golden = {}
+	if os.path.exists(GOLDEN):
+		with open(GOLDEN) as f:
+			golden = json.load(f)
+
+	results = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "ticks": TICKS,
+		"seed": SEED, "scenarios": {}}
+	for name, obstacle, pentagon in SCENARIOS:
+		if update_golden:
+			golden[name] = trace(obstacle, pentagon)
+		results["scenarios"][name] = {
+			"ticks_per_second": speed(obstacle, pentagon),
+			"numpy_ticks_per_second": speed(obstacle, pentagon, backend="numpy"),
+			"function_seconds": profile(obstacle, pentagon),
+			"allocations": allocations(obstacle, pentagon),
+		}
+
+	if update_golden:
+		with open(GOLDEN, "w") as f:
+			json.dump(golden, f)
+	return results
+
+def compare(old, new):
+	# speed ratio new/old of each scenario found in both results
+	ratios = {}
+	for name, result in new["scenarios"].items():
+		if name in old["scenarios"]:
+			ratios[name] = (result["ticks_per_second"] /
+				old["scenarios"][name]["ticks_per_second"])
+	return ratios
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(description="Benchmarks of the model")
+	parser.add_argument("--output", default="bench_results.json",
+		help="file to save the results to")
+	parser.add_argument("--compare", help="earlier results to compare with")
+	parser.add_argument("--update-golden", action="store_true",
+		help="store the traces of this run as the golden traces")
+	args = parser.parse_args()
+
+	results = run(update_golden=args.update_golden)
+	with open(args.output, "w") as f:
+		json.dump(results, f, indent=1, sort_keys=True)
+
+	for name, result in sorted(results["scenarios"].items()):
+		allocated = result["allocations"]
+		print("%-10s %8.0f ticks/s (numpy %5.0f)  %s" % (name,
+			result["ticks_per_second"], result["numpy_ticks_per_second"],
+			"%.0f bytes/tick" % allocated["peak_bytes_per_tick"]
+			if allocated else ""))
+	if args.compare:
+		with open(args.compare) as f:
+			old = json.load(f)
+		for name, ratio in sorted(compare(old, results).items()):
+			print("%-10s %.2fx" % (name, ratio))
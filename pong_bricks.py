@@ -0,0 +1,169 @@
+from __future__ import print_function
+
+import numpy as np
+
+''' Breakout bricks. A brick_field is a grid of bricks where which bricks
+are still standing is one byte per brick, so breaking a brick is one write
+and putting the whole field back is one copy. The ball is only tested
+against the cells its path covers in a tick, so the cost of a tick does
+not depend on how many bricks there are.'''
+
+def slab_times(p, v, low, high):
+	# times (in ticks) when a point at p moving by v per tick is between
+	# low and high, as (enter, leave), or None if it never is
+	if v == 0:
+		if p < low or p > high:
+			return None
+		return -float("inf"), float("inf")
+	first = (low - p)/v
+	last = (high - p)/v
+	if first > last:
+		return last, first
+	return first, last
+
+STANDING = b"\x01" # byte of a standing brick, for bytearray.find
+
+class brick_field:
+	''' columns x rows bricks of size [w, h], the top left one at origin.
+	alive says which bricks stand, row after row; layout is what the field
+	starts as and goes back to with reset(). alive is a numpy view of the
+	bytearray cells, which the ball test reads (indexing a bytearray is
+	much faster than indexing an array). Broken bricks are listed in
+	broken until the view takes them (take_broken), and resets counts the
+	times the whole field was put back, so the view knows to draw it all.'''
+	def __init__(self, origin=(150, 0), columns=60, rows=50, size=(5, 6),
+			layout=None):
+		self.left, self.top = float(origin[0]), float(origin[1])
+		self.columns = columns
+		self.rows = rows
+		self.width, self.height = float(size[0]), float(size[1])
+		if layout is None:
+			layout = np.ones(columns*rows, dtype=bool)
+		self.layout = np.array(layout, dtype=bool).reshape(-1)
+		self.cells = bytearray(self.layout.tobytes())
+		self.alive = np.frombuffer(self.cells, dtype=bool)
+		self.standing = int(self.alive.sum())
+		self.broken = []
+		self.resets = 0
+
+	def restore(self, alive):
+		# puts back a saved alive array in one copy
+		np.copyto(self.alive, alive)
+		self.standing = int(self.alive.sum())
+		self.broken = []
+		self.resets += 1
+
+	def reset(self):
+		self.restore(self.layout)
+
+	def take_broken(self):
+		# bricks broken since the last call
+		broken = self.broken
+		self.broken = []
+		return broken
+
+	def boxes(self, indices=None):
+		# (N, 4) boxes [left, top, right, bottom] of the given bricks,
+		# the standing ones by default, and their indices
+		if indices is None:
+			indices = np.nonzero(self.alive)[0]
+		rows, columns = np.divmod(indices, self.columns)
+		left = self.left + columns*self.width
+		top = self.top + rows*self.height
+		return np.stack([left, top, left + self.width, top + self.height],
+			axis=1), indices
+
+	def bounce(self, x, y, vx, vy, radius):
+		# finds the first standing brick a ball of radius (half its size)
+		# at x, y meets while moving by vx, vy, and breaks it
+		# returns the axis (0 for x, 1 for y) of the velocity to turn
+		# round, or None if no brick is met
+		# only the cells covered by the ball's path in this tick are
+		# looked at: the path's bounding box, grown by radius
+		if self.standing == 0:
+			return None
+		low = (x + vx if vx < 0 else x) - radius - self.left
+		high = (x if vx < 0 else x + vx) + radius - self.left
+		c0 = max(int(low//self.width), 0)
+		c1 = min(int(high//self.width), self.columns - 1)
+		low = (y + vy if vy < 0 else y) - radius - self.top
+		high = (y if vy < 0 else y + vy) + radius - self.top
+		r0 = max(int(low//self.height), 0)
+		r1 = min(int(high//self.height), self.rows - 1)
+		if c0 > c1 or r0 > r1:
+			return None
+
+		# a brick (grown by radius) is entered when the ball is within both
+		# its column and its row, so the times are worked out per column
+		# and per row, and each brick only takes the later and the earlier
+		cells = self.cells
+		columns = None
+		best = None
+		for row in range(r0, r1 + 1):
+			first = row*self.columns + c0
+			if cells.find(STANDING, first, first + c1 - c0 + 1) < 0:
+				continue # nothing standing in this row of the box
+			times = slab_times(y, vy, self.top + row*self.height - radius,
+				self.top + (row + 1)*self.height + radius)
+			if times is None:
+				continue
+			enter_y, leave_y = times
+			if columns is None:
+				columns = [slab_times(x, vx, self.left + column*self.width - radius,
+					self.left + (column + 1)*self.width + radius)
+					for column in range(c0, c1 + 1)]
+			for number, times in enumerate(columns):
+				if times is None or not cells[first + number]:
+					continue
+				enter_x, leave_x = times
+				enter = enter_x if enter_x >= enter_y else enter_y
+				leave = leave_x if leave_x <= leave_y else leave_y
+				if enter > leave or enter > 1 or leave < 0:
+					continue
+				if best is None or enter < best[0]:
+					# the side it comes through is the later of the two
+					best = (enter, 0 if enter_x >= enter_y else 1, first + number)
+		if best is None:
+			return None
+		index = best[2]
+		cells[index] = 0
+		self.standing -= 1
+		self.broken.append(index)
+		return best[1]
+
+def checkered(columns=60, rows=50, gap=4):
+	# a layout: the full wall with a gap every few rows and columns
+	grid = np.ones((rows, columns), dtype=bool)
+	grid[gap-1::gap, :] = False
+	grid[:, gap-1::gap] = False
+	return grid
+
+if __name__ == "__main__":
+	import time
+	from pong_model import game
+	from pong_headless import headless
+	# cost of a ball test and of a game tick against the number of bricks,
+	# with bricks of the same size
+	rng = np.random.RandomState(0)
+	for columns, rows in [(10, 10), (40, 40), (75, 75)]:
+		field = brick_field(columns=columns, rows=rows, size=(4, 4))
+		# balls over the bricks, the field put back after each test
+		points = rng.uniform([150, 0, -3, -3], [150 + 4*columns, 4*rows, 3, 3],
+			(20000, 4)).tolist()
+		start = time.time()
+		for x, y, vx, vy in points:
+			if field.bounce(x, y, vx, vy, 5) is not None:
+				field.alive[field.broken.pop()] = True
+				field.standing += 1
+		tested = (time.time() - start)/len(points)
+
+		match = game(seed=1)
+		field = brick_field(columns=columns, rows=rows, size=(4, 4))
+		match.set_bricks(field)
+		match.reset_pieces(new_game=1)
+		runner = headless(match)
+		start = time.time()
+		runner.run(5000)
+		elapsed = time.time() - start
+		print("%5d bricks: %.1f us per ball test, game %.0f ticks/s, %d "
+			"standing" % (columns*rows, tested*1e6, 5000/elapsed, field.standing))
@@ -1,5 +1,9 @@
 
-from Tkinter import *
+try:
+    from Tkinter import *
+except ImportError: # python 3
+    from tkinter import *
+from pong_input import input_pipeline, keyboard_source, bot_source
 
 class controls(Frame):
     ''' This class takes user input from keys that control the paddles and it
@@ -9,16 +13,21 @@ class controls(Frame):
         self.game = game # reference to game instance to access model info
         self.running = False # used when user presses start or pause buttons
         self.startover = False # used to indicate when user presses restart
+        self.on_start = None # called when user presses start to wake the loop
 
         # Bind keys so players can move paddle
-        self.buttons = set()
-        self.parent.bind_all("<KeyPress>", lambda e: self.buttons.add(e.keysym))
-        self.parent.bind_all("<KeyRelease>", lambda e: self.buttons.discard(e.keysym))
+        # keys are [up-button, down-button] for paddleA then paddleB
+        # key events are stamped and queued in a pipeline (see pong_input),
+        # which gives each one to the tick it happened in
+        self.keys = [["e", "s"], ["Up", "Down"]]
+        self.pipeline = input_pipeline()
+        self.keyboard = self.pipeline.add(keyboard_source(self.keys))
+        self.keyboard.bind(self.parent)
 
         # Make start and puase buttons
         # Commands are lambda that uses setattr to change self.running and self.startover
         self.start_button = Button(self.parent, text="Start", 
-                    command = lambda e=self: setattr(e, "running", True))
+                    command = self.start)
         self.start_button.grid(row=2, column = 0, columnspan = 1)
 
         self.pause_button = Button(self.parent, text= "Pause", 
@@ -33,31 +42,26 @@ class controls(Frame):
                     command=self.parent.quit)
         self.quit.grid(row=2, column=7, columnspan = 1)
 
-    def set_paddle(self, paddle, button, velocity):
-        # called by get_input method
-        # updates paddle based on what buttons are pressed
-        # paddle argument is a key in the dictionary of game pieces
-        # button = [up-button, down-button]
+    def start(self):
+        # called by start button
+        self.running = True
+        if self.on_start is not None:
+            self.on_start()
 
+    def add_player(self, paddle, policy):
+        # a policy (like pong_ai.predictor) plays paddle instead of the keys
+        self.keyboard.set_paddles([name for name in self.keyboard.paddles
+                    if name != paddle])
+        self.pipeline.add(bot_source(policy, paddle))
 
-        # uses paddle center and height to check if paddle is on screen
-        y = self.game.parts[paddle].coords[1]
-        height = self.game.parts[paddle].dimensions[1]
+    def get_mask(self, until=None):
+        # input mask of the tick ending at until, now by default
+        # (see INPUT_BITS in model)
+        return self.pipeline.next_mask(self.game, until)
 
-
-        if button[0] in self.buttons and y>(0+height):
-            self.game.parts[paddle].velocity = [0, -velocity]
-
-        elif button[1] in self.buttons and y<(300-height):
-            self.game.parts[paddle].velocity = [0, velocity]
-
-        else:
-            self.game.parts[paddle].velocity = [0, 0]
-
-    def get_input(self):
-        # maps paddles, buttons and paddle velocities to set_paddle
-        paddles = ["paddleA", "paddleB"] # keys of paddles in game piece dictionary
-        buttons = [["e", "s"], ["Up", "Down"]]
-        velocities = [2] * 2 # all velocities are 2 in the y direction
-        # velocity sign is changed depending on which button is pressed.
-        map(self.set_paddle, paddles, buttons, velocities)
\ No newline at end of file
+    def get_input(self, until=None):
+        # sets paddles from the buttons held down at the end of the tick
+        # returns the input mask so it can be recorded
+        mask = self.get_mask(until)
+        self.game.apply_input(mask)
+        return mask
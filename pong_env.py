@@ -0,0 +1,167 @@
+from __future__ import print_function
+
+import random
+import numpy as np
+from pong_model import *
+from pong_batch import world, PADDLE_A, PADDLE_B, OBSTACLES
+
+''' Environment for training paddle agents, in the style of OpenAI Gym.
+One vector_env runs many games at once. step() takes one action per paddle
+per game (-1 up, 0 still, 1 down) and returns observation, reward and done
+arrays. An episode is one point: when a game is scored (or runs for too
+long) it is reset at once and the observation returned is the first one
+of the next point.'''
+
+# what each column of an observation holds
+OBSERVATION = ["ball_x", "ball_y", "ball_vx", "ball_vy", "paddleA_y",
+	"paddleA_vy", "paddleB_y", "paddleB_vy", "obstacle"]
+PADDLES = ["paddleA", "paddleB"] # columns of actions and rewards
+
+class vector_env:
+	''' count games stepped together. With batched=True (the default) the
+	games are a pong_batch.world, so a step is a few array operations for
+	all games and there is no per game Python work. With batched=False
+	every game is a pong_model.game stepped in turn, using update_score and
+	reset_pieces (slower, but the reference rules).
+
+	Observations, rewards and dones are arrays made once and filled in
+	place by every step, so keep a copy if you need them later.'''
+	def __init__(self, count, batched=True, max_ticks=5000, seed=None):
+		self.count = count
+		self.batched = batched
+		self.max_ticks = max_ticks # ticks after which a point is cut short
+
+		self.observations = np.zeros((count, len(OBSERVATION)), dtype=np.float32)
+		self.rewards = np.zeros((count, len(PADDLES)), dtype=np.float32)
+		self.dones = np.zeros(count, dtype=bool)
+		self.truncated = np.zeros(count, dtype=bool)
+		# last observation of the points that just ended
+		self.final_observations = np.zeros_like(self.observations)
+		self.ticks = np.zeros(count, dtype=int)
+		self.reset(seed)
+
+	def reset(self, seed=None):
+		# starts every game again, returns the observations
+		if seed is None:
+			seed = random.randrange(2**32)
+		self.seed = seed
+		if self.batched:
+			self.world = world(self.count, seed)
+		else:
+			rng = random.Random(seed)
+			self.games = [game(seed=rng.randrange(2**32))
+				for i in range(self.count)]
+		self.ticks[:] = 0
+		self.observe()
+		return self.observations
+
+	def observe(self):
+		# fills self.observations from the games
+		out = self.observations
+		if self.batched:
+			w = self.world
+			out[:, 0:2] = w.ball_coords
+			out[:, 2:4] = w.ball_velocity
+			out[:, 4] = w.centers[:, PADDLE_A, 1]
+			out[:, 5] = w.velocities[:, PADDLE_A, 1]
+			out[:, 6] = w.centers[:, PADDLE_B, 1]
+			out[:, 7] = w.velocities[:, PADDLE_B, 1]
+			out[:, 8] = w.obstacle
+			return
+		for i, match in enumerate(self.games):
+			out[i] = [match.ball.coords[0], match.ball.coords[1],
+				match.ball.velocity[0], match.ball.velocity[1],
+				match.paddleA.coords[1], match.paddleA.velocity[1],
+				match.paddleB.coords[1], match.paddleB.velocity[1],
+				OBSTACLES.index(match.obstacle)]
+
+	def step(self, actions):
+		# actions is a (count, 2) array of -1, 0 or 1 for paddleA and paddleB
+		# returns observations, rewards, dones and an info dictionary
+		# rewards are +1 for the paddle that scored and -1 for the other
+		actions = np.asarray(actions)
+		if self.batched:
+			scored = self.step_world(actions)
+		else:
+			scored = self.step_games(actions)
+
+		# score 1 is the ball passing paddleA, so paddleB won the point
+		self.rewards[:, 0] = (scored == 2)
+		self.rewards[:, 0] -= (scored == 1)
+		np.negative(self.rewards[:, 0], out=self.rewards[:, 1])
+
+		self.ticks += 1
+		np.greater_equal(self.ticks, self.max_ticks, out=self.truncated)
+		self.truncated &= scored == 0
+		np.not_equal(scored, 0, out=self.dones)
+		self.dones |= self.truncated
+		done = np.nonzero(self.dones)[0]
+		self.ticks[done] = 0
+		self.final_observations[done] = self.observations[done]
+		if len(done):
+			# observations were taken before the reset, take them again
+			self.restart(np.nonzero(self.truncated)[0])
+			self.observe()
+		return self.observations, self.rewards, self.dones, {
+			"truncated": self.truncated, "final_observations": self.final_observations}
+
+	def step_world(self, actions):
+		# one tick of the batched games
+		# the world resets scored games itself, so the final observation
+		# is taken in between
+		w = self.world
+		w.collide()
+		w.apply_obstacles()
+		w.move()
+		w.steer(actions)
+		scored = w.update_score()
+		self.observe()
+		w.reset(np.nonzero(scored)[0])
+		return scored
+
+	def step_games(self, actions):
+		# one tick of every game object, like the headless runner
+		scored = np.zeros(self.count, dtype=int)
+		for i, match in enumerate(self.games):
+			match.update_pieces()
+			mask = 0
+			for paddle, move in zip(PADDLES, actions[i]):
+				up, down = INPUT_BITS[paddle]
+				if move < 0:
+					mask |= up
+				elif move > 0:
+					mask |= down
+			match.apply_input(mask)
+			before = match.score_player1
+			if match.update_score():
+				scored[i] = 1 if match.score_player1 > before else 2
+		self.observe()
+		for i in np.nonzero(scored)[0]:
+			self.games[i].reset_pieces()
+		return scored
+
+	def restart(self, which):
+		# resets the given games without anyone scoring
+		if self.batched:
+			self.world.reset(which)
+		else:
+			for i in which:
+				self.games[i].reset_pieces()
+
+if __name__ == "__main__":
+	import sys
+	import time
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+	steps = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+	for batched in [True, False]:
+		env = vector_env(count, batched=batched, seed=0)
+		rng = np.random.RandomState(0)
+		actions = rng.randint(-1, 2, (steps, count, 2))
+		points = 0
+		start = time.time()
+		for t in range(steps):
+			observations, rewards, dones, info = env.step(actions[t])
+			points += dones.sum()
+		elapsed = time.time() - start
+		print("%s: %d games, %.0f env steps/s, %d points" % (
+			"batched" if batched else "games", count, count*steps/elapsed, points))
@@ -0,0 +1,214 @@
+from __future__ import print_function
+
+import numpy as np
+
+''' Force fields made of any number of sources: constant pulls, point
+attractors and vortices, whose accelerations add up. A force_grid works
+out their sum once at the corners of a grid of cells over the field, and
+balls look it up with one bilinear interpolation per tick. The cost of a
+tick therefore does not depend on how many sources there are. The grid
+is worked out again only after a source has moved or sources have been
+added or taken away.'''
+
+class source(object):
+	''' Base of the force sources: a center and a strength. On its own it
+	pulls nowhere (a zero field), the kinds below give it a shape. Move
+	sources with force_grid.move so the grid knows it has to be worked out
+	again.'''
+	def __init__(self, coords, strength, softening=10.0):
+		self.coords = np.array(coords, dtype=float)
+		self.strength = strength
+		self.softening = softening # pixels, keeps the center finite
+
+	def acceleration(self, x, y):
+		# (ax, ay) arrays at the points x, y (arrays of the same shape)
+		return np.zeros(np.shape(x)), np.zeros(np.shape(y))
+
+class constant(source):
+	''' The same acceleration strength [ax, ay] everywhere, or only inside
+	a box of half size [w, h] around coords (like gravity_field).'''
+	def __init__(self, strength, coords=(300, 150), size=None):
+		source.__init__(self, coords, np.array(strength, dtype=float))
+		self.size = None if size is None else np.array(size, dtype=float)
+
+	def acceleration(self, x, y):
+		ax = np.full(np.shape(x), self.strength[0])
+		ay = np.full(np.shape(y), self.strength[1])
+		if self.size is not None:
+			inside = ((np.abs(x - self.coords[0]) < self.size[0]) &
+				(np.abs(y - self.coords[1]) < self.size[1]))
+			ax *= inside
+			ay *= inside
+		return ax, ay
+
+class attractor(source):
+	''' Pulls towards coords with strength/distance**2 (the distance
+	softened by softening). A negative strength pushes away.'''
+	def acceleration(self, x, y):
+		dx = self.coords[0] - x
+		dy = self.coords[1] - y
+		squared = dx*dx + dy*dy + self.softening**2
+		scale = self.strength/(squared*np.sqrt(squared))
+		return dx*scale, dy*scale
+
+class vortex(source):
+	''' Turns things around coords: the acceleration is at right angles to
+	the line to the center, strength/distance (softened by softening).
+	Positive strength turns clockwise on the screen (y points down).'''
+	def acceleration(self, x, y):
+		dx = x - self.coords[0]
+		dy = y - self.coords[1]
+		scale = self.strength/(dx*dx + dy*dy + self.softening**2)
+		return -dy*scale, dx*scale
+
+class force_grid:
+	''' Sum of the accelerations of sources at the corners of square cells
+	of cell pixels over a width x height field. sample() looks up one ball
+	in plain floats, sample_many() looks up (N, 2) positions at once.
+	Positions off the field use the nearest edge of the grid.'''
+	def __init__(self, sources=(), width=600, height=300, cell=5):
+		self.sources = list(sources)
+		self.cell = float(cell)
+		self.columns = int(np.ceil(width/self.cell)) + 1
+		self.rows = int(np.ceil(height/self.cell)) + 1
+		self.grid = np.zeros((self.rows, self.columns, 2))
+		self.values = None # grid as nested lists, for sample
+		self.stale = True # worked out again at the next lookup
+		self.builds = 0
+
+	def add(self, source):
+		self.sources.append(source)
+		self.stale = True
+
+	def remove(self, source):
+		self.sources.remove(source)
+		self.stale = True
+
+	def move(self, source, coords):
+		# moves a source, the grid is worked out again at the next lookup
+		source.coords = np.array(coords, dtype=float)
+		self.stale = True
+
+	def exact(self, x, y):
+		# (ax, ay) summed over every source, without the grid
+		x = np.asarray(x, dtype=float)
+		y = np.asarray(y, dtype=float)
+		ax = np.zeros(x.shape)
+		ay = np.zeros(y.shape)
+		for force in self.sources:
+			fx, fy = force.acceleration(x, y)
+			ax += fx
+			ay += fy
+		return ax, ay
+
+	def build(self):
+		# works out the grid from the sources
+		y, x = np.mgrid[0:self.rows, 0:self.columns]*self.cell
+		self.grid[..., 0], self.grid[..., 1] = self.exact(x, y)
+		self.values = self.grid.tolist()
+		self.stale = False
+		self.builds += 1
+
+	def sample(self, x, y):
+		# acceleration (ax, ay) at x, y, bilinear between the four corners
+		# of its cell, in plain floats
+		if self.stale:
+			self.build()
+		gx = x/self.cell
+		gy = y/self.cell
+		i = int(gx) if gx > 0 else 0
+		j = int(gy) if gy > 0 else 0
+		if i > self.columns - 2:
+			i = self.columns - 2
+		if j > self.rows - 2:
+			j = self.rows - 2
+		fx = gx - i
+		fy = gy - j
+		fx = 0.0 if fx < 0 else 1.0 if fx > 1 else fx
+		fy = 0.0 if fy < 0 else 1.0 if fy > 1 else fy
+		top = self.values[j]
+		bottom = self.values[j+1]
+		(ax, ay), (bx, by) = top[i], top[i+1]
+		(cx, cy), (dx, dy) = bottom[i], bottom[i+1]
+		return ((ax + (bx - ax)*fx)*(1-fy) + (cx + (dx - cx)*fx)*fy,
+			(ay + (by - ay)*fx)*(1-fy) + (cy + (dy - cy)*fx)*fy)
+
+	def sample_many(self, coords):
+		# (N, 2) accelerations at (N, 2) coords, same lookup as sample
+		if self.stale:
+			self.build()
+		cells = np.asarray(coords, dtype=float)/self.cell
+		gx = np.clip(cells[:, 0], 0, self.columns - 1)
+		gy = np.clip(cells[:, 1], 0, self.rows - 1)
+		i = np.minimum(gx.astype(int), self.columns - 2)
+		j = np.minimum(gy.astype(int), self.rows - 2)
+		fx = (gx - i)[:, None]
+		fy = (gy - j)[:, None]
+		# corners by flat index into the grid, one take each
+		flat = self.grid.reshape(-1, 2)
+		corner = j*self.columns + i
+		a = flat.take(corner, axis=0)
+		b = flat.take(corner + 1, axis=0)
+		c = flat.take(corner + self.columns, axis=0)
+		d = flat.take(corner + self.columns + 1, axis=0)
+		b -= a
+		b *= fx
+		a += b # top edge
+		d -= c
+		d *= fx
+		c += d # bottom edge
+		c -= a
+		c *= fy
+		a += c
+		return a
+
+def swirl_level(count=6, seed=None):
+	# a field level: attractors and vortices at random places, pulling
+	# the ball towards the middle of the field, and a slight drift down
+	rng = np.random.RandomState(seed)
+	sources = [constant([0, 0.002])]
+	for i in range(count):
+		coords = [rng.uniform(150, 450), rng.uniform(50, 250)]
+		if i % 2:
+			sources.append(vortex(coords, rng.uniform(-0.3, 0.3)))
+		else:
+			sources.append(attractor(coords, rng.uniform(5, 20)))
+	return force_grid(sources)
+
+if __name__ == "__main__":
+	import sys
+	import time
+	from pong_model import game
+	from pong_headless import headless
+	# cost of a lookup against the number of sources, and the error of
+	# the grid against summing the sources
+	balls = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+	rng = np.random.RandomState(0)
+	coords = rng.uniform([0, 0], [600, 300], (balls, 2))
+	for count in [1, 10, 100, 1000]:
+		field = swirl_level(count, seed=count)
+		start = time.time()
+		field.build()
+		built = time.time() - start
+		start = time.time()
+		for i in range(100):
+			field.sample_many(coords)
+		grid_time = (time.time() - start)/100
+		start = time.time()
+		for i in range(10):
+			ax, ay = field.exact(coords[:, 0], coords[:, 1])
+		exact_time = (time.time() - start)/10
+		start = time.time()
+		for x, y in coords[:1000].tolist():
+			field.sample(x, y)
+		one_time = (time.time() - start)/1000
+		error = np.abs(field.sample_many(coords) - np.stack([ax, ay], 1)).max()
+		print("%4d sources: build %.1f ms, %d balls %.3f ms (summing %.3f ms), "
+			"one ball %.1f us, largest error %.4f" % (count, built*1000, balls,
+			grid_time*1000, exact_time*1000, one_time*1e6, error))
+
+	match = game(seed=1)
+	match.set_forces(swirl_level(seed=1))
+	result = headless(match).run(5000)
+	print("game with a field: %(ticks_per_second).0f ticks/s, score "
+		"%(score_player1)d - %(score_player2)d" % result)
@@ -0,0 +1,86 @@
+from __future__ import print_function
+
+import time
+from pong_model import *
+
+def idle(match, paddle):
+	# policy that never moves the paddle
+	return 0
+
+def track_ball(match, paddle):
+	# simple scripted policy: moves paddle towards the ball height
+	# returns -1 for up, 1 for down and 0 to stay still
+	gap = match.parts["zball"].coords[1] - match.parts[paddle].coords[1]
+	if gap < -5:
+		return -1
+	elif gap > 5:
+		return 1
+	return 0
+
+class script:
+	''' Turns a list of paddle commands (-1, 0, 1) into a policy. The list
+	is replayed from the start once it runs out. Being a class (not a
+	closure) it can be sent to worker processes, see pong_tournament.'''
+	def __init__(self, moves):
+		self.moves = list(moves)
+		self.tick = 0
+
+	def __call__(self, match, paddle):
+		move = self.moves[self.tick % len(self.moves)]
+		self.tick += 1
+		return move
+
+class headless:
+	''' This class runs a game without Tkinter. It does the same steps as
+	top_level.run in pong_main but as fast as possible, and the paddles are
+	set by policies instead of the keyboard. A policy is a function taking
+	the game and a paddle key and returning -1 (up), 0 or 1 (down).'''
+	def __init__(self, match=None, policyA=track_ball, policyB=track_ball,
+			recorder=None):
+		if match is None:
+			match = game()
+		self.match = match
+		self.policies = {"paddleA": policyA, "paddleB": policyB}
+		self.recorder = recorder # optional pong_replay.recorder
+		self.ticks = 0
+		self.points = 0
+
+	def get_input(self):
+		# same job as controls.get_input but asks the policies
+		# returns the input mask, like controls.get_input
+		mask = 0
+		for paddle, policy in self.policies.items():
+			mask |= input_bits(paddle, policy(self.match, paddle))
+		self.match.apply_input(mask)
+		return mask
+
+	def tick(self):
+		# one step of the model, in the same order as top_level.run
+		self.match.update_pieces()
+		mask = self.get_input()
+		if self.recorder is not None:
+			self.recorder.record(mask)
+		self.ticks += 1
+		if self.match.update_score():
+			self.points += 1
+			self.match.reset_pieces()
+			return True
+		return False
+
+	def run(self, ticks):
+		# runs the given number of ticks and reports the speed
+		start = time.time()
+		for i in range(ticks):
+			self.tick()
+		elapsed = time.time() - start
+		return {"ticks": ticks, "seconds": elapsed,
+			"ticks_per_second": ticks/elapsed if elapsed > 0 else float("inf"),
+			"score_player1": self.match.score_player1,
+			"score_player2": self.match.score_player2}
+
+if __name__ == "__main__":
+	import sys
+	ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	result = headless().run(ticks)
+	print("%(ticks)d ticks in %(seconds).2f s (%(ticks_per_second).0f ticks/s), "
+		"score %(score_player1)d - %(score_player2)d" % result)
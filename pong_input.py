@@ -0,0 +1,307 @@
+from __future__ import print_function
+
+from collections import deque
+import numpy as np
+from pong_loop import clock
+from pong_model import INPUT_BITS, input_bits
+
+''' Input events. Sources (the keyboard, a computer player, a recording,
+the network) push what their paddles' keys are doing into an
+input_pipeline, stamped with the time it happened. Every tick takes the
+events that happened before that tick ended, in time order, so an input
+lands on the tick it belongs to even when the loop runs several ticks at
+once to catch up. The pipeline follows each input until the frame that
+shows the paddle move it caused has been drawn, and reports the input to
+photon latency (p50 and p99). It stops at the canvas: the time Tk and the
+screen then take to show the frame is not seen from here.'''
+
+PADDLES = ["paddleA", "paddleB"]
+
+def paddle_bits(paddles):
+	# the input mask bits of the given paddles
+	bits = 0
+	for paddle in paddles:
+		for bit in INPUT_BITS[paddle]:
+			bits |= bit
+	return bits
+
+class input_pipeline:
+	''' Events wait in a queue, in time order, until next_mask() takes the
+	ones that happened before the end of its tick. Each source holds some
+	bits down (an event says which, from its time on) and the mask of a
+	tick is the bits of all sources together. Each event that changed what
+	a measured source holds is followed until drawn() is told a frame
+	showing it was drawn: latencies are the seconds from such events to
+	their frame, waits the seconds from them to the end of their tick.'''
+	def __init__(self, window=1000, clock=clock):
+		self.clock = clock
+		self.sources = []
+		self.queue = deque() # (time, source, bits), oldest first
+		self.held = {} # source: bits it holds down
+		self.tick = 0 # ticks asked for so far
+		self.applied = deque() # (time, tick) of events not yet drawn
+		self.latencies = deque(maxlen=window)
+		self.waits = deque(maxlen=window)
+		self.events = 0 # events that changed the input
+		self.late = 0 # events pushed after a newer one
+
+	def add(self, source):
+		self.sources.append(source)
+		self.held[source] = 0
+		source.attach(self)
+		return source
+
+	def remove(self, source):
+		# the source's bits are let go at once, its queued events dropped
+		self.sources.remove(source)
+		del self.held[source]
+		self.queue = deque(event for event in self.queue if event[1] is not source)
+
+	def push(self, source, bits, time=None):
+		# source holds bits (only those of its paddles count) from time on,
+		# now by default
+		if time is None:
+			time = self.clock()
+		event = (time, source, bits & source.bits)
+		queue = self.queue
+		if not queue or queue[-1][0] <= time:
+			queue.append(event)
+			return
+		# an event older than the newest one (a network packet that was
+		# held up) goes in its place, counted from the end
+		self.late += 1
+		place = len(queue)
+		while place and queue[place - 1][0] > time:
+			place -= 1
+		queue.insert(place, event)
+
+	def next_mask(self, match, until=None):
+		# input mask of the next tick, which ends at until (now by default)
+		# sources that are asked every tick push their events first
+		if until is None:
+			until = self.clock()
+		for source in self.sources:
+			source.poll(match, until)
+		queue = self.queue
+		held = self.held
+		while queue and queue[0][0] <= until:
+			time, source, bits = queue.popleft()
+			if held.get(source, bits) == bits:
+				continue # nothing changes (or the source is gone)
+			held[source] = bits
+			self.events += 1
+			if source.measured:
+				self.applied.append((time, self.tick))
+				self.waits.append(until - time)
+		mask = 0
+		for bits in held.values():
+			mask |= bits
+		self.tick += 1
+		return mask
+
+	def drawn(self, now=None):
+		# called when a frame has been drawn, now by default
+		# the mask of a tick is applied after its update_pieces, so the
+		# paddle moves in the update of the next tick, which has run once
+		# the input of the tick after that is asked for
+		if now is None:
+			now = self.clock()
+		applied = self.applied
+		while applied and applied[0][1] + 2 <= self.tick:
+			time, tick = applied.popleft()
+			self.latencies.append(now - time)
+
+	def report(self):
+		# milliseconds p50 and p99 of the recent latencies and waits
+		result = {"events": self.events, "late": self.late}
+		for name, values in [("latency", self.latencies), ("wait", self.waits)]:
+			if values:
+				values = np.array(values)*1000
+				result[name + "_p50_ms"] = np.percentile(values, 50)
+				result[name + "_p99_ms"] = np.percentile(values, 99)
+		return result
+
+	def overlay_text(self):
+		# short text for the on-canvas overlay
+		if not self.latencies:
+			return ""
+		values = np.array(self.latencies)*1000
+		return "input %.0f ms  p99 %.0f ms" % (np.percentile(values, 50),
+			np.percentile(values, 99))
+
+class source(object):
+	''' Base of the input sources. bits are the mask bits it may set,
+	those of its paddles. Sources that push events as they come (keys,
+	packets) leave poll() alone, those that decide every tick (a computer
+	player, a recording) push from poll(). Only the events of measured
+	sources, the ones people make, count towards the latency.'''
+	measured = False
+	def __init__(self, paddles=PADDLES):
+		self.paddles = list(paddles)
+		self.bits = paddle_bits(self.paddles)
+		self.pipeline = None
+
+	def attach(self, pipeline):
+		self.pipeline = pipeline
+
+	def poll(self, match, until):
+		# called by next_mask before the events up to until are taken
+		pass
+
+class keyboard_source(source):
+	''' Key presses and releases from Tk, stamped when Tk hands them over.
+	keys are [up, down] key names for paddleA then paddleB, as in
+	controls. Held keys are pushed as one mask, so a key repeated by the
+	keyboard while held down changes nothing. bind() binds it to a Tk
+	widget, press() and release() can also be called by hand.'''
+	measured = True
+	def __init__(self, keys=(("e", "s"), ("Up", "Down")), paddles=PADDLES):
+		source.__init__(self, paddles)
+		self.keys = {} # key name: bit
+		for paddle, names in zip(PADDLES, keys):
+			for bit, name in zip(INPUT_BITS[paddle], names):
+				self.keys[name] = bit
+		self.down = 0 # bits of the keys held down
+
+	def bind(self, widget):
+		widget.bind_all("<KeyPress>", lambda e: self.press(e.keysym))
+		widget.bind_all("<KeyRelease>", lambda e: self.release(e.keysym))
+
+	def press(self, key, time=None):
+		bit = self.keys.get(key, 0) & self.bits
+		if bit and not self.down & bit:
+			self.down |= bit
+			self.pipeline.push(self, self.down, time)
+
+	def release(self, key, time=None):
+		bit = self.keys.get(key, 0) & self.bits
+		if self.down & bit:
+			self.down &= ~bit
+			self.pipeline.push(self, self.down, time)
+
+	def set_paddles(self, paddles):
+		# the keys only move these paddles from now on
+		self.paddles = list(paddles)
+		self.bits = paddle_bits(self.paddles)
+		if self.down & ~self.bits:
+			self.down &= self.bits
+			self.pipeline.push(self, self.down)
+
+class bot_source(source):
+	''' A policy (like pong_ai.predictor or the pong_headless ones) playing
+	paddle. It is asked every tick, as controls used to ask it, and its
+	move is pushed when it changes, stamped with the end of the tick.'''
+	def __init__(self, policy, paddle):
+		source.__init__(self, [paddle])
+		self.policy = policy
+		self.paddle = paddle
+		self.last = 0
+
+	def poll(self, match, until):
+		bits = input_bits(self.paddle, self.policy(match, self.paddle))
+		if bits != self.last:
+			self.last = bits
+			self.pipeline.push(self, bits, until)
+
+class replay_source(source):
+	''' The recorded masks of a pong_replay recording (the inputs array of
+	read_recording) played on the given paddles, one per tick from the
+	tick the pipeline is at when the source is added.'''
+	def __init__(self, inputs, paddles=PADDLES):
+		source.__init__(self, paddles)
+		self.inputs = inputs
+		self.first = 0
+		self.last = 0
+
+	def attach(self, pipeline):
+		source.attach(self, pipeline)
+		self.first = pipeline.tick
+
+	def poll(self, match, until):
+		tick = self.pipeline.tick - self.first
+		bits = int(self.inputs[tick]) & self.bits if tick < len(self.inputs) else 0
+		if bits != self.last:
+			self.last = bits
+			self.pipeline.push(self, bits, until)
+
+class remote_source(source):
+	''' Input of a player somewhere else: network code calls receive() with
+	the mask of each packet. Packets are stamped when they arrive, or with
+	the time given (the sender's time put on our clock), so one that was
+	held up on the way lands on the tick it was meant for if that tick has
+	not run yet.'''
+	measured = True
+	def __init__(self, paddle):
+		source.__init__(self, [paddle])
+		self.paddle = paddle
+
+	def receive(self, mask, time=None):
+		self.pipeline.push(self, mask, time)
+
+def simulate(seconds=10.0, tick=0.005, frame=1/60., rate=4.0, seed=0):
+	# plays seconds of a game the way top_level.run does, on a clock that
+	# moves by the loop's sleeps and by the real time its work takes,
+	# with key presses at random times (rate a second, held 50 to 300 ms)
+	# events that happen while the loop works are stamped when it is done,
+	# as Tk only hands them over between callbacks
+	# returns the pipeline's report
+	import time
+	from pong_loop import scheduler
+	from pong_model import game
+	from pong_render import framebuffer
+	rng = np.random.RandomState(seed)
+	now = [0.0]
+	virtual = lambda: now[0]
+	keys = ["e", "s", "Up", "Down"]
+	events = []
+	start = rng.exponential(1/rate)
+	while start < seconds:
+		key = keys[rng.randint(len(keys))]
+		events.append((start, True, key))
+		events.append((start + rng.uniform(0.05, 0.3), False, key))
+		start += rng.exponential(1/rate)
+	events.sort(key=lambda event: event[0])
+	events = deque(events)
+
+	match = game(seed=seed)
+	screen = framebuffer()
+	pipeline = input_pipeline(window=100000, clock=virtual)
+	keyboard = pipeline.add(keyboard_source())
+	loop = scheduler(tick=tick, frame=frame, clock=virtual)
+	idle = 0.0 # when the loop last went to sleep
+	while now[0] < seconds:
+		while events and events[0][0] <= now[0]:
+			happened, pressed, key = events.popleft()
+			stamp = max(happened, idle)
+			if pressed:
+				keyboard.press(key, stamp)
+			else:
+				keyboard.release(key, stamp)
+		began = time.time()
+		for until in loop.tick_ends(loop.advance()):
+			match.update_pieces()
+			match.apply_input(pipeline.next_mask(match, until))
+			if match.update_score():
+				match.reset_pieces()
+		now[0] += time.time() - began
+		if loop.frame_due():
+			began = time.time()
+			screen.draw(match)
+			now[0] += time.time() - began
+			pipeline.drawn()
+		idle = now[0]
+		now[0] += loop.next_delay()/1000.
+	return pipeline.report()
+
+if __name__ == "__main__":
+	import sys
+	# input to photon latency of the loop against the tick and the frame
+	# rate, with a framebuffer draw standing in for the canvas
+	seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+	for tick in [0.005, 0.01]:
+		for fps in [30, 60, 120]:
+			result = simulate(seconds, tick, 1./fps)
+			print("tick %2.0f ms, %3d fps: %4d inputs, latency p50 %5.1f ms p99 "
+				"%5.1f ms, to the tick p50 %4.1f ms p99 %4.1f ms" % (tick*1000, fps,
+				result["events"], result["latency_p50_ms"], result["latency_p99_ms"],
+				result["wait_p50_ms"], result["wait_p99_ms"]))
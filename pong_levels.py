@@ -0,0 +1,307 @@
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import numpy as np
+from pong_model import rectangle, Obstacle, chaotic_field, gravity_field, Portal
+from pong_bricks import brick_field
+
+''' Level files. A level is a JSON file listing walls, a chaotic field, a
+gravity field, portals with their links and bricks. It is compiled once
+into arrays (piece kinds, centers, sizes, outlines, links, brick layout),
+which are saved in a cache directory under the hash of the file as raw
+bytes behind a short header, so a file is only compiled again after it
+changes and loading it again is one read. Levels are loaded the first
+time they are picked, and each game makes a level's pieces only once (an
+arena); after that, putting a level in play copies its outlines back
+into the store and points the game's dictionaries at its pieces.
+
+A level file looks like this (every entry can be left out):
+
+	{"walls": [{"coords": [300, 60], "size": [80, 4], "breakable": false}],
+	 "chaotic": {"coords": [300, 150], "size": [30, 75]},
+	 "gravity": {"coords": [300, 150], "size": [50, 50], "pull": [0, 0.05]},
+	 "portals": [{"coords": [400, 250], "size": [20, 3]}, ...],
+	 "links": [[0, 1], [1, 0, 2.0]],
+	 "bricks": {"origin": [150, 0], "size": [5, 6], "rows": ["##.##", ...]}}
+
+coords are centers and size half widths and heights, as for the pieces.
+Links are [entry, exit] or [entry, exit, weight] portal numbers (see
+Portal.link); portals without links send the ball to the one before.'''
+
+FORMAT = 1 # version of the compiled arrays, part of the cache key
+WALL, BREAKABLE, CHAOTIC, GRAVITY, PORTAL = range(5)
+ENTRIES = ["walls", "chaotic", "gravity", "portals", "links", "bricks"]
+
+def write_arrays(f, arrays):
+	# a line of JSON naming each array with its dtype and shape, then the
+	# bytes of the arrays one after the other
+	names = sorted(arrays)
+	header = [[name, arrays[name].dtype.str, list(arrays[name].shape)]
+		for name in names]
+	f.write(json.dumps(header).encode("ascii") + b"\n")
+	for name in names:
+		f.write(np.ascontiguousarray(arrays[name]).tobytes())
+
+def read_arrays(data):
+	# arrays written by write_arrays, as read-only views of the bytes
+	end = data.index(b"\n")
+	offset = end + 1
+	arrays = {}
+	for name, dtype, shape in json.loads(data[:end].decode("ascii")):
+		dtype = np.dtype(dtype)
+		count = int(np.prod(shape))
+		arrays[name] = np.frombuffer(data, dtype, count, offset).reshape(shape)
+		offset += count*dtype.itemsize
+	return arrays
+
+def compile_level(data, name="level"):
+	# arrays of a level from the parsed JSON, see the module docstring
+	# raises ValueError for anything the game could not play
+	unknown = [key for key in data if key not in ENTRIES]
+	if unknown:
+		raise ValueError("%s: unknown entries %s" % (name, ", ".join(sorted(unknown))))
+	pieces = [] # (kind, entry)
+	for wall in data.get("walls", []):
+		pieces.append((BREAKABLE if wall.get("breakable") else WALL, wall))
+	if "chaotic" in data:
+		pieces.append((CHAOTIC, data["chaotic"]))
+	if "gravity" in data:
+		pieces.append((GRAVITY, data["gravity"]))
+	portals = data.get("portals", [])
+	if len(portals) == 1:
+		raise ValueError("%s: one portal has nowhere to send the ball" % name)
+	pieces.extend((PORTAL, portal) for portal in portals)
+
+	coords = np.zeros((len(pieces), 2))
+	sizes = np.zeros((len(pieces), 2))
+	for number, (kind, entry) in enumerate(pieces):
+		try:
+			if np.shape(entry["coords"]) != (2,) or np.shape(entry["size"]) != (2,):
+				raise ValueError
+			coords[number] = entry["coords"]
+			sizes[number] = entry["size"]
+		except (KeyError, TypeError, ValueError):
+			raise ValueError("%s: piece %d needs coords and size, two numbers "
+				"each" % (name, number))
+		if (sizes[number] <= 0).any():
+			raise ValueError("%s: piece %d has a size that is not positive" % (
+				name, number))
+	# closed rectangle outlines, as piece.get_positions makes them
+	x, y = coords.T
+	w, h = sizes.T
+	outlines = np.stack([[x-w, y-h], [x+w, y-h], [x+w, y+h], [x-w, y+h],
+		[x-w, y-h]]).transpose(2, 0, 1)
+
+	links = np.zeros((len(data.get("links", [])), 3))
+	for number, link in enumerate(data.get("links", [])):
+		entry, exit = int(link[0]), int(link[1])
+		if not (0 <= entry < len(portals) and 0 <= exit < len(portals)) or entry == exit:
+			raise ValueError("%s: link %d does not join two portals" % (name, number))
+		links[number] = [entry, exit, link[2] if len(link) > 2 else 1.0]
+
+	pull = np.array(data.get("gravity", {}).get("pull", [0, 0.05]), dtype=float)
+	level = {"kinds": np.array([kind for kind, entry in pieces], dtype=np.int8),
+		"coords": coords, "sizes": sizes, "outlines": outlines, "links": links,
+		"pull": pull}
+	if "bricks" in data:
+		bricks = data["bricks"]
+		rows = bricks.get("rows", [])
+		if not rows or len(set(len(row) for row in rows)) != 1:
+			raise ValueError("%s: brick rows must all be as long" % name)
+		level["brick_box"] = np.array(list(bricks.get("origin", [150, 0])) +
+			list(bricks.get("size", [5, 6])), dtype=float)
+		level["brick_layout"] = np.array([[cell == "#" for cell in row]
+			for row in rows])
+	return level
+
+class level_library:
+	''' The level files (*.json) of a directory, by name (the file name
+	without .json). Nothing is read until a level is first asked for.
+	level() then reads the file and takes its arrays from the cache when
+	the cache has the same file (by hash), or compiles it and saves them
+	there. loads counts both. Give it to a game as game.levels.'''
+	def __init__(self, directory="levels", cache=None):
+		self.directory = directory
+		if cache is None:
+			cache = os.path.join(directory, "cache")
+		self.cache = cache
+		self.names = sorted(file[:-5] for file in os.listdir(directory)
+			if file.endswith(".json"))
+		self.compiled = {}
+		self.loads = {"compiled": 0, "cached": 0}
+
+	def key(self, data):
+		# cache file name of the arrays of a level file's bytes
+		return hashlib.sha1(("%d:" % FORMAT).encode("ascii") + data).hexdigest()
+
+	def level(self, name):
+		# arrays of a level, read and compiled (or taken from the cache)
+		# the first time
+		if name not in self.compiled:
+			with open(os.path.join(self.directory, name + ".json"), "rb") as f:
+				data = f.read()
+			path = os.path.join(self.cache, self.key(data) + ".level")
+			if os.path.exists(path):
+				with open(path, "rb") as f:
+					level = read_arrays(f.read())
+				self.loads["cached"] += 1
+			else:
+				level = compile_level(json.loads(data.decode("utf-8")), name)
+				self.save(path, level)
+				self.loads["compiled"] += 1
+			self.compiled[name] = level
+		return self.compiled[name]
+
+	def save(self, path, level):
+		# writes the arrays under another name first, so a cache file is
+		# never seen half written
+		if not os.path.isdir(self.cache):
+			os.makedirs(self.cache)
+		partial = path + ".part"
+		with open(partial, "wb") as f:
+			write_arrays(f, level)
+		if os.path.exists(path):
+			os.remove(path)
+		os.rename(partial, path)
+
+	def arena(self, name, match):
+		# the pieces of a level for match (see game.choose_obstacle)
+		return arena(name, self.level(name), match)
+
+class arena:
+	''' The pieces of one level in one game, made once from its arrays.
+	apply() puts them in play: their centers and outlines are copied back
+	from the arrays in one go, which also mends broken walls, and the
+	game's dictionaries and its switcheroo, planet, gate and bricks are
+	pointed at them. No piece is made again. The game keeps the packed
+	walls and plan of its pieces in game.layouts under the arena itself,
+	as levels with the same file have pieces of their own.'''
+	def __init__(self, name, level, match):
+		self.name = name
+		self.level = level
+		store = match.store
+		self.parts = {}
+		self.walls = {}
+		self.switcheroo = None
+		self.planet = None
+		self.gate = None
+		self.bricks = None
+		self.breakable = []
+		pieces = []
+		for number, kind in enumerate(level["kinds"].tolist()):
+			coords = level["coords"][number]
+			size = level["sizes"][number]
+			if kind == WALL or kind == BREAKABLE:
+				if kind == BREAKABLE:
+					wall = Obstacle(coords, size, [0, 0], store=store)
+					self.breakable.append((wall, size))
+				else:
+					wall = rectangle(coords, size, [0, 0], store=store)
+				key = "%s.wall%d" % (name, number + 1)
+				self.parts[key] = wall
+				self.walls[key] = wall
+				pieces.append(wall)
+			elif kind == CHAOTIC:
+				self.switcheroo = chaotic_field(coords, size, [0, 0], store=store,
+					rng=match.random)
+				self.parts["switcheroo"] = self.switcheroo
+				pieces.append(self.switcheroo)
+			elif kind == GRAVITY:
+				self.planet = gravity_field(coords, size, [0, 0], level["pull"],
+					store=store)
+				self.parts["planet"] = self.planet
+				pieces.append(self.planet)
+			else:
+				if self.gate is None:
+					self.gate = Portal(store=store, rng=match.random)
+				pieces.append(self.gate.lines[self.gate.add_line(coords, size)])
+		if self.gate is not None:
+			for entry, exit, weight in level["links"].tolist():
+				self.gate.link(self.gate.line_list[int(entry)],
+					self.gate.line_list[int(exit)], weight)
+			self.parts.update(self.gate.lines)
+		if "brick_layout" in level:
+			x, y, w, h = level["brick_box"].tolist()
+			rows, columns = level["brick_layout"].shape
+			self.bricks = brick_field((x, y), columns, rows, (w, h),
+				level["brick_layout"])
+
+		self.indices = np.array([piece.index for piece in pieces], dtype=int)
+		slots = store.vertex_slots
+		self.vertex_rows = (self.indices[:, None]*slots + np.arange(5)).reshape(-1)
+		self.outlines = level["outlines"].reshape(-1, 2)
+
+	def apply(self, match):
+		# puts the level in play in match, called by choose_obstacle
+		store = match.store
+		store.coords[self.indices] = self.level["coords"]
+		store.velocity[self.indices] = 0
+		store.vertices[self.vertex_rows] = self.outlines
+		store.length[self.indices] = 5
+		store.touch(self.indices)
+		for wall, size in self.breakable:
+			wall.dimensions = size.copy()
+		if self.switcheroo is not None:
+			# counts from the start, like everything else of the level, so
+			# a snapshot taken while another level is in play covers it
+			self.switcheroo.count = 1
+		match.parts.update(self.parts)
+		match.walls.update(self.walls)
+		if self.switcheroo is not None:
+			match.switcheroo = self.switcheroo
+		if self.planet is not None:
+			match.planet = self.planet
+		if self.gate is not None:
+			match.gate = self.gate
+		if self.bricks is not None:
+			match.bricks = self.bricks
+
+if __name__ == "__main__":
+	import sys
+	import shutil
+	import tempfile
+	import time
+	from pong_model import game
+	from pong_headless import headless
+	# cost of loading each level with and without the cache, and of
+	# switching levels between points against picking an obstacle
+	directory = sys.argv[1] if len(sys.argv) > 1 else "levels"
+	cache = tempfile.mkdtemp()
+	try:
+		for name in level_library(directory).names:
+			times = []
+			for run in range(2):
+				library = level_library(directory, cache)
+				start = time.time()
+				library.level(name)
+				times.append(time.time() - start)
+			match = game(seed=1)
+			start = time.time()
+			pieces = library.arena(name, match)
+			built = time.time() - start
+			start = time.time()
+			for i in range(1000):
+				pieces.apply(match)
+			applied = (time.time() - start)/1000
+			print("%-12s compiled %.2f ms, from the cache %.2f ms, pieces made "
+				"%.2f ms, put in play %.1f us" % (name, times[0]*1000,
+				times[1]*1000, built*1000, applied*1e6))
+
+		for levels in [None, level_library(directory, cache)]:
+			match = game(seed=1)
+			match.levels = levels
+			for i in range(20): # every level picked and made at least once
+				match.reset_pieces()
+			start = time.time()
+			for i in range(1000):
+				match.reset_pieces()
+			switch = (time.time() - start)/1000
+			result = headless(match).run(5000)
+			print("%-8s reset %.1f us, game %.0f ticks/s, score %d - %d" % (
+				"levels" if levels else "obstacles", switch*1e6,
+				result["ticks_per_second"], result["score_player1"],
+				result["score_player2"]))
+	finally:
+		shutil.rmtree(cache)
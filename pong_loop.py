@@ -0,0 +1,60 @@
+import time
+
+# best clock available: perf_counter on python 3, time on python 2
+clock = getattr(time, "perf_counter", time.time)
+
+class scheduler:
+	''' This class decides when the model and the view should be updated.
+	It adds up the real time that has passed and hands it out as fixed model
+	ticks, so the game runs at the same speed on slow and fast machines.
+	When it falls behind it runs several ticks at once, up to max_steps, and
+	drops the rest. Redraws have their own (lower) rate.'''
+	def __init__(self, tick=0.005, frame=1/60., max_steps=10, clock=clock):
+		self.tick = tick # seconds of game time per model update
+		self.frame = frame # seconds between redraws
+		self.max_steps = max_steps # most model updates done in one go
+		self.clock = clock
+		self.dropped = 0 # ticks skipped because we were too far behind
+		self.reset()
+
+	def reset(self):
+		# forgets elapsed time, used when starting or after a pause
+		self.last = self.clock()
+		self.accumulator = 0.0
+		self.last_frame = self.last - self.frame
+
+	def advance(self):
+		# returns how many model ticks are due since the last call
+		now = self.clock()
+		self.accumulator += now - self.last
+		self.last = now
+		steps = int(self.accumulator / self.tick)
+		if steps > self.max_steps:
+			self.dropped += steps - self.max_steps
+			steps = self.max_steps
+			self.accumulator = 0.0
+		else:
+			self.accumulator -= steps * self.tick
+		return steps
+
+	def tick_ends(self, steps):
+		# clock times at which the steps ticks just due end, oldest first,
+		# so input can be given to the tick it happened in
+		# (after dropped ticks the last one ends now)
+		due = self.last - self.accumulator
+		return [due - (steps - 1 - i)*self.tick for i in range(steps)]
+
+	def frame_due(self):
+		# True when it is time to redraw, at most once per frame
+		now = self.clock()
+		if now - self.last_frame >= self.frame:
+			self.last_frame = now
+			return True
+		return False
+
+	def next_delay(self):
+		# milliseconds until the next tick or redraw is due (at least 1)
+		now = self.clock()
+		until_tick = self.tick - self.accumulator - (now - self.last)
+		until_frame = self.frame - (now - self.last_frame)
+		return max(1, int(1000 * min(until_tick, until_frame)))
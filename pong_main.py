@@ -1,15 +1,29 @@
 
-import Tkinter
+from __future__ import print_function
+
+import argparse
+try:
+	import Tkinter
+except ImportError: # python 3
+	import tkinter as Tkinter
 from pong_view import *
 from pong_model import *
 from pong_control import *
+from pong_loop import scheduler
+from pong_replay import recorder
+from pong_timing import timer
+from pong_ai import predictor
+from pong_multiball import ball_set
+from pong_levels import level_library
 
 class top_level(Frame):
 	'''This class makes instances of game, board and controls (model, view,
 	 controller). It also defines a tkinter frame shared by board and controls.
-	 The run method recursively calls the update methods. Its parent is the
-	 tkinter root widget'''
-	def __init__(self, parent):
+	 The run method recursively calls the update methods. A scheduler decides
+	 how many fixed model ticks to run and when to redraw, and the loop stops
+	 while the game is paused. Its parent is the tkinter root widget'''
+	def __init__(self, parent, record=None, timing=False, overlay=False,
+			cpu=None, balls=0, levels=None):
 		
 		# Creates frame to contain canvas from view and control buttons from controls
 		Frame.__init__(self, parent)
@@ -21,30 +35,142 @@ class top_level(Frame):
 		self.director = controls(self.parent, self.match)
 		self.field = board(self.parent, self.match) 
 
+		# optional computer player for paddleB (a pong_ai.predictor)
+		if cpu is not None:
+			self.director.add_player("paddleB", cpu)
+
+		# optional levels from a directory of level files, picked instead
+		# of the obstacles (such a match cannot be recorded, see recorder)
+		if levels is not None:
+			self.match.levels = level_library(levels)
+			self.match.reset_pieces(new_game=1)
+			self.field.initUI()
+
+		# optional multiball: this many extra balls kept in play
+		if balls:
+			self.match.set_balls(ball_set(keep=balls, seed=self.match.seed))
+
+		# optional recording of the match (seed and inputs) for replay
+		self.recorder = None
+		if record is not None:
+			self.recorder = recorder(record, self.match)
+
+		# optional timing of each phase of the loop (see pong_timing)
+		# nothing is timed unless it is turned on
+		self.timing = None
+		self.overlay = overlay
+		self.overlay_shown = 0
+		if timing or overlay:
+			self.timing = timer()
+			self.timing.instrument_loop(self, sub_phases=timing)
+
+		self.clock = scheduler()
+		self.polling = False
+		self.director.on_start = self.resume # start button wakes the loop
+
+	def resume(self):
+		# restarts the loop after a pause without catching up the paused time
+		if not self.polling:
+			self.polling = True
+			self.clock.reset()
+			self.run()
+
+	def step(self, until=None):
+		# one fixed model tick, ending at clock time until (now by default)
+		self.match.update_pieces() # update model
+		mask = self.director.get_input(until) # get user input fron keys to set paddles
+		
+		# tally score and reset if player has scored
+		if self.match.update_score(): 
+			self.match.reset_pieces() # resets game pieces in model
+			self.field.initUI() # resets canvas and canvas images
+		
+		# Restart game - does same as reset but also changes score to zero
+		if self.director.startover: # check if user has pushed restart button
+			self.match.reset_pieces(new_game=1) # resets game pieces in model and sets score to zero
+			self.field.initUI()
+			self.director.startover = False
+			self.director.running = False
+			mask |= RESTART
+
+		if self.recorder is not None:
+			self.recorder.record(mask)
+
 	def run(self):
 
-		if self.director.running: # check if user has pushed start button
-			self.match.update_pieces() # update model
-			self.field.update_UI() # update view
-			self.director.get_input() # get user input fron keys to set paddles
-			
-			# tally score and reset if player has scored
-			if self.match.update_score(): 
-				self.match.reset_pieces() # resets game pieces in model
-				self.field.initUI() # resets canvas and canvas images
-			
-			# Restart game - does same as reset but also changes score to zero
-			if self.director.startover: # check if user has pushed restart button
-				self.match.reset_pieces(new_game=1) # resets game pieces in model and sets score to zero
-				self.field.initUI()
-				self.director.startover = False
-				self.director.running = False
+		if not self.director.running: # stop polling while paused
+			self.polling = False
+			return
+
+		# fixed ticks due since last run, each given the input that
+		# happened before it ended
+		for until in self.clock.tick_ends(self.clock.advance()):
+			self.step(until)
+			if not self.director.running:
+				break
+
+		if self.clock.frame_due():
+			self.field.update_UI() # update view at its own rate
+			self.director.pipeline.drawn() # input to photon latency
+			if self.timing is not None:
+				self.timing.frame()
+				now = self.clock.clock()
+				if self.overlay and now - self.overlay_shown > 0.5:
+					self.field.show_overlay(self.timing.overlay_text() + "\n" +
+						self.director.pipeline.overlay_text())
+					self.overlay_shown = now
 		
-		root.after(5, self.run) # Recursive run after 5 millisecond delay
+		root.after(self.clock.next_delay(), self.run) # Recursive run when next tick is due
 
 
 root = Tkinter.Tk()
-main_window = top_level(root)
-main_window.run()
+# a file name on the command line records the match to that file
+# --trace FILE times each phase and saves a Chrome trace when quitting
+# --overlay shows frame rate and frame time on the canvas
+# --cpu lets the computer play paddleB
+# --balls N keeps N extra balls in play
+# --levels DIR plays the level files of DIR instead of the obstacles
+# --latency prints the input to photon latency when quitting
+parser = argparse.ArgumentParser(description="Pong with obstacles")
+parser.add_argument("record", nargs="?", help="file to record the match to")
+parser.add_argument("--trace", help="file to save a Chrome trace to")
+parser.add_argument("--overlay", action="store_true",
+	help="show frame rate and frame time")
+parser.add_argument("--cpu", action="store_true",
+	help="the computer plays paddleB")
+parser.add_argument("--cpu-delay", type=int, default=10,
+	help="ticks before the computer reacts")
+parser.add_argument("--cpu-error", type=float, default=8.0,
+	help="how far off the computer aims, in pixels")
+parser.add_argument("--balls", type=int, default=0,
+	help="number of extra balls kept in play (multiball)")
+parser.add_argument("--levels", help="directory of level files to play")
+parser.add_argument("--latency", action="store_true",
+	help="print the input to photon latency when quitting")
+args = parser.parse_args()
+# a recording keeps the seed and inputs only, so it could not play these
+if args.record is not None and (args.balls or args.levels is not None):
+	parser.error("a match with --balls or --levels cannot be recorded")
+
+cpu = None
+if args.cpu:
+	cpu = predictor(delay=args.cpu_delay, error=args.cpu_error)
+main_window = top_level(root, record=args.record, timing=args.trace is not None,
+	overlay=args.overlay, cpu=cpu, balls=args.balls,
+	levels=args.levels)
+main_window.resume()
 
-root.mainloop()
\ No newline at end of file
+root.mainloop()
+if main_window.recorder is not None:
+	main_window.recorder.close()
+if args.trace is not None:
+	main_window.timing.export(args.trace)
+	for name, stats in sorted(main_window.timing.summary().items()):
+		print("%-15s %6d calls  p50 %.3f ms  p99 %.3f ms  max %.3f ms" % (name,
+			stats["count"], stats["p50_ms"], stats["p99_ms"], stats["max_ms"]))
+if args.latency:
+	report = main_window.director.pipeline.report()
+	if "latency_p50_ms" in report:
+		print("%d inputs  latency p50 %.1f ms  p99 %.1f ms  to the tick p50 %.1f "
+			"ms  p99 %.1f ms" % (report["events"], report["latency_p50_ms"],
+			report["latency_p99_ms"], report["wait_p50_ms"], report["wait_p99_ms"]))
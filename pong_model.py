@@ -1,19 +1,326 @@
 
+import math
 import numpy as np
 from numpy.linalg import norm
 import random
 
-class piece:
+def segment_hits(segments, wall_velocity, coords, velocity, radius):
+	# Vectorized form of the projection test in rectangle.hit_check.
+	# segments is (..., M, 4) lines [x1, y1, x2, y2] and wall_velocity their
+	# (..., M, 2) velocities. coords and velocity (..., 2) belong to the mover.
+	# Returns (..., M) boolean array of lines the mover is about to hit.
+	coords = np.asarray(coords, dtype=float)[..., None, :]
+	velocity = np.asarray(velocity, dtype=float)[..., None, :]
+	with np.errstate(invalid="ignore", divide="ignore"):
+		# velocity of projectile relative to wall
+		relative = velocity - wall_velocity
+		p1 = segments[..., 0:2]
+		p2 = segments[..., 2:4]
+		vector = p1 - p2
+		unitv = vector / np.sqrt((vector**2).sum(-1))[..., None]
+		v1 = p1 - coords # Vectors from ball to line ends.
+		v2 = p2 - coords
+
+		# See if velocity vector is between vectors from ball to line ends.
+		proj_v1_v2 = (v1*v2).sum(-1)
+		within_edges = ((proj_v1_v2 < (v1*relative).sum(-1)) &
+			(proj_v1_v2 < (v2*relative).sum(-1)))
+
+		# Projections on the line normal [-unitv[1], unitv[0]]
+		proj_distance_normal = v1[..., 1]*unitv[..., 0] - v1[..., 0]*unitv[..., 1]
+		proj_velocity_normal = (relative[..., 1]*unitv[..., 0] -
+			relative[..., 0]*unitv[..., 1])
+		same_direction = proj_distance_normal*proj_velocity_normal > 0
+		close = (np.abs(proj_velocity_normal) >
+			np.abs(proj_distance_normal) - radius)
+
+	return within_edges & same_direction & close
+
+def segment_hit_rows(segments, wall_velocity, coords, velocity, radius):
+	# Scalar form of segment_hits for one mover, in plain floats. For the
+	# few dozen lines of one game this is much faster than array calls.
+	# segments is a list of [x1, y1, x2, y2] lines and wall_velocity a list
+	# of their [vx, vy]; coords, velocity and radius are floats.
+	# Returns the list of rows the mover is about to hit. The tests are the
+	# same float operations in the same order as in segment_hits, so both
+	# find the same rows.
+	# A line can only be hit when the mover is closer to it than radius plus
+	# the relative speed (|rx|+|ry| is at least that, 1 is kept for
+	# rounding), so lines with a bounding box further away are skipped
+	# before the projections are worked out.
+	x, y = coords
+	vx, vy = velocity
+	sqrt = math.sqrt
+	rows = []
+	for row, (x1, y1, x2, y2) in enumerate(segments):
+		wx, wy = wall_velocity[row]
+		rx = vx - wx
+		ry = vy - wy
+		reach = radius + abs(rx) + abs(ry) + 1
+		if x1 < x2:
+			if x < x1 - reach or x > x2 + reach:
+				continue
+		elif x < x2 - reach or x > x1 + reach:
+			continue
+		if y1 < y2:
+			if y < y1 - reach or y > y2 + reach:
+				continue
+		elif y < y2 - reach or y > y1 + reach:
+			continue
+
+		dx = x1 - x2
+		dy = y1 - y2
+		length = sqrt(dx*dx + dy*dy)
+		if length == 0:
+			continue # segment_hits gets nan, which hits nothing
+		ux = dx/length
+		uy = dy/length
+		ax = x1 - x # vectors from mover to line ends
+		ay = y1 - y
+		distance_normal = ay*ux - ax*uy
+		velocity_normal = ry*ux - rx*uy
+		if not (distance_normal*velocity_normal > 0 and
+				abs(velocity_normal) > abs(distance_normal) - radius):
+			continue
+		bx = x2 - x
+		by = y2 - y
+		ends = ax*bx + ay*by
+		if ends < ax*rx + ay*ry and ends < bx*rx + by*ry:
+			rows.append(row)
+	return rows
+
+def segment_contacts(segments, coords, velocity, radius):
+	# Swept test of a circle against (M, 4) lines [x1, y1, x2, y2].
+	# The circle starts at coords and moves with velocity relative to the
+	# lines, either one (2,) velocity or (M, 2) with one for each line.
+	# Returns (M,) times (in ticks) when the circle first touches each line,
+	# on its face or on one of its ends, and inf if it never does.
+	# Only contacts where the circle moves towards the line count, so a
+	# circle that just bounced off a line does not hit it again.
+	coords = np.asarray(coords, dtype=float)
+	velocity = np.asarray(velocity, dtype=float)
+	with np.errstate(invalid="ignore", divide="ignore"):
+		p1 = segments[:, 0:2]
+		p2 = segments[:, 2:4]
+		direction = p2 - p1
+		length = np.sqrt((direction**2).sum(1))
+		unit = direction / length[:, None]
+		normal = np.stack([-unit[:, 1], unit[:, 0]], axis=1)
+
+		# face: distance to the line shrinks to the radius
+		offset = coords - p1
+		distance = (offset*normal).sum(1)
+		side = np.where(distance < 0, -1.0, 1.0)
+		distance = distance*side
+		speed = (normal*velocity).sum(1)*side # negative when approaching
+		face = np.maximum((distance - radius)/-speed, 0)
+		along = ((offset + velocity*face[:, None])*unit).sum(1)
+		face = np.where((speed < 0) & (along >= 0) & (along <= length), face, np.inf)
+
+		# ends: distance to an end point shrinks to the radius
+		times = [face]
+		a = (velocity**2).sum(-1)
+		for end in (p1, p2):
+			gap = coords - end
+			b = (gap*velocity).sum(1)
+			c = (gap**2).sum(1) - radius**2
+			root = np.sqrt(b**2 - a*c)
+			time = np.where(c < 0, 0, (-b - root)/a)
+			# ends lose ties against faces so the face normal is used
+			times.append(np.where((b < 0) & (root >= 0), time + 1e-9, np.inf))
+		times = np.fmin.reduce(times)
+
+	return np.where(length > 0, times, np.inf)
+
+def segment_gap(segment, coords):
+	# vector (gx, gy) from the point of a line [x1, y1, x2, y2] closest to
+	# coords to coords, its length, and whether that point is an end of
+	# the line rather than on its face, in plain floats
+	x1, y1, x2, y2 = segment
+	x, y = coords
+	dx = x2 - x1
+	dy = y2 - y1
+	squared = dx*dx + dy*dy
+	along = ((x - x1)*dx + (y - y1)*dy)/squared if squared > 0 else 0.0
+	end = along <= 0 or along >= 1
+	along = 0.0 if along < 0 else 1.0 if along > 1 else along
+	gx = x - (x1 + along*dx)
+	gy = y - (y1 + along*dy)
+	return gx, gy, math.sqrt(gx*gx + gy*gy), end
+
+class segment_grid(object):
+	# Broadphase for collision detection. The field is cut into square cells
+	# and each packed wall line is filed in the cells its bounding box
+	# touches. A mover only needs the lines filed in the cells around it.
+	# Lines of moving walls are filed again only when they change cells.
+
+	def __init__(self, cell=50, width=600, height=300):
+		self.cell = float(cell)
+		self.columns = int(np.ceil(width/self.cell))
+		self.rows = int(np.ceil(height/self.cell))
+		self.cells = [set() for i in range(self.columns*self.rows)]
+		self.ranges = np.zeros((0, 4), dtype=int)
+
+	def cell_ranges(self, left, top, right, bottom):
+		# first and last column and row touched by each box, kept on the grid
+		columns = np.clip(np.floor(np.array([left, right])/self.cell),
+			0, self.columns-1).astype(int)
+		rows = np.clip(np.floor(np.array([top, bottom])/self.cell),
+			0, self.rows-1).astype(int)
+		return np.stack([columns[0], rows[0], columns[1], rows[1]], axis=-1)
+
+	def segment_ranges(self, segments):
+		x = segments[:, 0::2]
+		y = segments[:, 1::2]
+		return self.cell_ranges(x.min(1), y.min(1), x.max(1), y.max(1))
+
+	def file(self, row, cells, add):
+		x0, y0, x1, y1 = cells
+		for y in range(y0, y1+1):
+			for x in range(x0, x1+1):
+				if add:
+					self.cells[y*self.columns+x].add(row)
+				else:
+					self.cells[y*self.columns+x].discard(row)
+
+	def build(self, segments):
+		# files every line from scratch
+		for cell in self.cells:
+			cell.clear()
+		self.ranges = self.segment_ranges(segments)
+		for row, cells in enumerate(self.ranges):
+			self.file(row, cells, True)
+
+	def update(self, segments, rows):
+		# files the given lines again if they moved to other cells
+		if len(rows) == 0:
+			return
+		ranges = self.segment_ranges(segments[rows])
+		changed = np.nonzero((ranges != self.ranges[rows]).any(1))[0]
+		for i in changed:
+			row = rows[i]
+			self.file(row, self.ranges[row], False)
+			self.file(row, ranges[i], True)
+			self.ranges[row] = ranges[i]
+
+	def query(self, left, top, right, bottom):
+		# sorted rows of the lines filed in the cells touching the box
+		x0, y0, x1, y1 = self.cell_ranges(left, top, right, bottom)
+		found = set()
+		for y in range(y0, y1+1):
+			found.update(*self.cells[y*self.columns+x0:y*self.columns+x1+1])
+		return np.array(sorted(found), dtype=int)
+
+class piece_store(object):
+	# This class keeps the state of every game piece in a few numpy arrays.
+	# Pieces are handles holding their row (index) in coords and velocity
+	# and their first row in vertices (the points of their outline).
+	# Because all pieces share the arrays, moving many pieces is one
+	# array operation, and positions and lines are views, not copies.
+
+	def __init__(self, size=16, vertex_slots=6):
+		self.vertex_slots = vertex_slots # room for a pentagon outline
+		self.coords = np.zeros((size, 2))
+		self.velocity = np.zeros((size, 2))
+		self.vertices = np.zeros((size*vertex_slots, 2))
+		self.length = np.zeros(size, dtype=int) # number of outline points
+		self.pieces = []
+		# rows of the pieces moved by advance_active, and of their outlines
+		# (see activate and deactivate)
+		self.set_active(np.zeros(0, dtype=int))
+		# pieces whose outline changed since the view last took them, so it
+		# redraws only those (see touch and take_dirty)
+		self.dirty = np.zeros(size, dtype=bool)
+
+	def add(self, handle):
+		# gives a new piece its row, growing the arrays when they are full
+		index = len(self.pieces)
+		if index == len(self.coords):
+			size = 2*len(self.coords)
+			self.coords = np.resize(self.coords, (size, 2))
+			self.velocity = np.resize(self.velocity, (size, 2))
+			self.vertices = np.resize(self.vertices, (size*self.vertex_slots, 2))
+			self.length = np.resize(self.length, size)
+			self.dirty = np.resize(self.dirty, size)
+			for other in self.pieces:
+				other.bind()
+		self.pieces.append(handle)
+		return index
+
+	def vertex_rows(self, indices):
+		# rows of vertices used by the outlines of the listed pieces
+		rows = [np.arange(self.length[i]) + i*self.vertex_slots for i in indices]
+		return np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+
+	def activate(self, indices):
+		# adds the listed pieces to the ones advance_active moves
+		self.set_active(np.union1d(self.active, np.asarray(indices, dtype=int)))
+
+	def deactivate(self, indices):
+		# takes the listed pieces out of the ones advance_active moves
+		self.set_active(np.setdiff1d(self.active, np.asarray(indices, dtype=int)))
+
+	def set_active(self, active):
+		# active_owners is the place in active of each active outline row
+		self.active = active
+		self.active_vertices = self.vertex_rows(active)
+		self.active_owners = np.searchsorted(active,
+			self.active_vertices//self.vertex_slots)
+
+	def touch(self, indices):
+		# marks the listed pieces as moved, for take_dirty
+		self.dirty[indices] = True
+
+	def take_dirty(self):
+		# rows of the pieces moved since the last call, which are forgotten
+		rows = np.flatnonzero(self.dirty)
+		self.dirty[rows] = False
+		return rows
+
+	def advance_active(self, timestep=1):
+		# moves the active pieces only, so the cost does not grow with the
+		# pieces that stand still (like a field full of portals)
+		# take gathers the few rows faster than fancy indexing
+		active = self.active
+		velocity = self.velocity.take(active, axis=0)
+		if timestep != 1:
+			velocity = velocity*timestep
+		self.coords[active] = self.coords.take(active, axis=0) + velocity
+		rows = self.active_vertices
+		self.vertices[rows] = (self.vertices.take(rows, axis=0) +
+			velocity.take(self.active_owners, axis=0))
+		self.dirty[active[velocity.any(axis=1)]] = True
+
+	def advance(self, indices, vertex_rows, timestep=1):
+		# moves every listed piece (and its outline) by its velocity at once
+		if timestep == 1:
+			self.coords[indices] += self.velocity[indices]
+			self.vertices[vertex_rows] += self.velocity[vertex_rows//self.vertex_slots]
+		else:
+			self.coords[indices] += self.velocity[indices]*timestep
+			self.vertices[vertex_rows] += (self.velocity[vertex_rows//self.vertex_slots]
+				*timestep)
+
+class piece(object):
 	# This class represents individual game pieces.
 	# Other game piece classes inherit from this class
 	# The game class creates instances of piece and represents the overall game.
+	__slots__ = ("store", "index", "init_coords", "init_velocity", "dimensions",
+		"moving", "hit", "radius", "_coords", "_velocity")
+
+	def __init__(self, coords, dimensions, velocity, moving = False, store = None):
+		# state lives in a piece_store shared with the other pieces of a game
+		if store is None:
+			store = piece_store(size=1)
+		self.store = store
+		self.index = store.add(self)
+		self.bind()
 
-	def __init__(self, coords, dimensions, velocity, moving = False):
 		# for coords and velocity we keep a copy of the initial values to reset
 		self.init_coords = np.array(coords, dtype=float) 
-		self.coords = self.init_coords[:]# Center of shape
+		self.coords = self.init_coords # Center of shape
 		self.init_velocity = np.array(velocity, dtype=float)
-		self.velocity = self.init_velocity[:]
+		self.velocity = self.init_velocity
 
 		self.dimensions = np.array(dimensions, dtype=float) # [width/2, height/2]
 		self.get_positions() 
@@ -28,11 +335,54 @@ class piece:
 		are also used to identify lines of rectangular shapes that the ball 
 		may bounce off of.''' 
 
+	def bind(self):
+		# (re)takes views of this piece's rows after the store grows
+		self._coords = self.store.coords[self.index]
+		self._velocity = self.store.velocity[self.index]
+
+	# coords and velocity are views into the store
+	# assigning to them copies the values into the store
+	def get_coords(self):
+		return self._coords
+	def set_coords(self, value):
+		self._coords[:] = value
+	coords = property(get_coords, set_coords)
+
+	def get_velocity(self):
+		return self._velocity
+	def set_velocity(self, value):
+		self._velocity[:] = value
+	velocity = property(get_velocity, set_velocity)
+
+	@property
+	def outline(self):
+		# (n, 2) view of the outline points in the store
+		first = self.index*self.store.vertex_slots
+		return self.store.vertices[first:first+self.store.length[self.index]]
+
+	@property
+	def positions(self):
+		# flat [x1, y1, x2, y2, ...] view of the outline, used by the view
+		return self.outline.reshape(-1)
+
+	@property
+	def vertex_rows(self):
+		return self.store.vertex_rows([self.index])
+
 	def get_positions(self):
 		# Gets four corners of box around shape based on centerpoint and dimensions.
-		x,y = self.coords
-		w,h = self.dimensions
-		self.positions = [x-w, y-h, x+w, y-h, x+w, y+h, x-w, y+h, x-w, y-h]
+		# (in plain floats, the same sums as with numpy scalars)
+		x,y = self.coords.tolist()
+		w,h = np.asarray(self.dimensions, dtype=float).tolist()
+		self.set_outline([x-w, y-h, x+w, y-h, x+w, y+h, x-w, y+h, x-w, y-h])
+
+	def set_outline(self, positions):
+		# writes outline points [x1, y1, x2, y2, ...] into the store
+		first = self.index*self.store.vertex_slots
+		count = len(positions)//2
+		self.store.vertices[first:first+count] = np.reshape(positions, (count, 2))
+		self.store.length[self.index] = count
+		self.store.touch(self.index)
 
 	def move(self, reset=0, coords=None):
 		# called later to update each game piece
@@ -40,20 +390,28 @@ class piece:
 		# then updates positions of shape outline
 		# also used to reset piece when game is reset
 		if reset == 1:
-			self.coords = self.init_coords[:]
-			self.velocity = self.init_velocity[:]
+			self.coords = self.init_coords
+			self.velocity = self.init_velocity
 			self.get_positions()
 		if reset == 2:
-			self.coords = np.array(coords, dtype=float)
+			self.coords = coords
 			self.get_positions()
 
-		self.coords = np.array(self.coords, dtype = float)
-		self.velocity = np.array(self.velocity, dtype = float)
+		# one piece: its rows are moved through the views, as advance would
 		self.coords += self.velocity
+		self.outline[:] += self.velocity
+		self.store.touch(self.index)
+		self.moved()
+
+	def shift(self, offset):
+		# moves the piece and its outline by offset without other updates
+		self.coords += offset
+		self.outline[:] += offset
+		self.store.touch(self.index)
 
-		for i in range(0, len(self.positions), 2):
-			self.positions[i] += self.velocity[0]
-			self.positions[i+1] += self.velocity[1]
+	def moved(self):
+		# called after the piece has moved, used by pieces with behaviour
+		pass
 
 	def check_inscreen(self, bounds):
 		# used by chaotic field, gravity field and portal
@@ -86,16 +444,18 @@ class piece:
 
 class rectangle(piece):
 	# This class adds rectangle specific stuff to piece class
-	def __init__(self, coords, dimensions, velocity, moving=False, change = False):
+	__slots__ = ("change", "collision")
+
+	def __init__(self, coords, dimensions, velocity, moving=False, change = False,
+			store = None):
 		self.moving = moving
-		self.piece = piece.__init__(self, coords, dimensions, velocity, moving=moving)
+		piece.__init__(self, coords, dimensions, velocity, moving=moving,
+			store=store)
 		
 		# change indicates changing the paddle shape to a pentagon
 		self.change = change
 		self.change_profile()
-		
-		self.lines = []
-		self.get_lines()
+		self.collision = None
 
 	def change_profile(self):
 		# changes paddle shape to pentagon
@@ -107,98 +467,66 @@ class rectangle(piece):
 			
 			# new point must go in correct indices
 			# order of points in list affects how view draws shape
+			positions = list(self.positions)
 			if self.change > 0: # indices 4, 5 for left side paddle
-				self.positions.insert(4, x)
-				self.positions.insert(5, y)
+				positions[4:4] = [x, y]
 			elif self.change < 0: # indices 8, 9 for right side paddle
-				self.positions.insert(8, x)
-				self.positions.insert(9, y)
-			
-			self.get_lines() # must get new lines based on changed outline
+				positions[8:8] = [x, y]
+			self.set_outline(positions)
 
-	def get_lines(self):
-		# Gets lines of rectangles sides. 
+	@property
+	def lines(self):
+		# Lines of rectangles sides, as an (n, 4) view of the outline points.
 		# [x1, y1, x2, y2] This is how each line is represented.
 		# Having the coordinates of these lines is useful in collision detection.
-		self.lines = []
-		for i in range(4,len(self.positions)+1, 2):
-			self.lines.append(self.positions[i-4:i])
-
-	def move(self, reset=0, coords=None):
-		# Uses move method of parent class.
-		# Then updates lines since lines are specific to rectangle. 
-		piece.move(self, reset, coords)
-		if reset == 1 or reset ==2:
-			self.get_lines()
-		else:
-			for line in self.lines:
-				line[0:2] += self.velocity
-				line[2:4] += self.velocity
+		outline = self.outline
+		return np.lib.stride_tricks.as_strided(outline,
+			shape=(len(outline)-1, 4), strides=(outline.strides[0],
+			outline.itemsize), writeable=False)
 
 	def hit_check(self, shape, reference = [0, 0]):
 		#Uses projections of ball velocity and lines to find collision.
-
+		# All lines are tested at once by segment_hits. 
+		# If several lines are hit the last one is kept.
 		self.collision = None
-		for line in self.lines:
-
-			# velocity is velocity of projectile(self) relative to wall(shape)
-			velocity = shape.velocity - self.velocity
-		
-			vector = np.array([line[0]-line[2], line[1]-line[3]])
-			unitv = vector/norm(vector)
-			unormal = np.array([-unitv[1], unitv[0]])
-
-			v1 = np.array(line[0:2]) - shape.coords #Vectors from ball to line ends.
-			v2 = np.array(line[2:4]) - shape.coords
-
-			# These projections are used to assess projectile will cross wall
-			# Projections of line end point vectors onto velocity vector and vice versa
-			proj_v1_v2 = np.dot(v1, v2) 
-			proj_v1_velocity = np.dot(v1, velocity)
-			proj_v2_v1 = np.dot(v2,v1)
-			proj_v2_velocity = np.dot(v2, velocity)
-
-			within_edges = False # See if velocity vector is between vectors from ball to line ends.
-			if proj_v1_v2 < proj_v1_velocity and proj_v2_v1 < proj_v2_velocity:
-				within_edges = True
-
-			# These projections used to see how close projectile is to wall
-			proj_distance_normal = np.dot(v1, unormal)
-			proj_velocity_normal = np.dot(velocity, unormal)
-			#See if velocity normal to paddle line exceeds ball distance normal to line.
-			
-			same_direction = False #See if velocity is towards the line
-			if proj_distance_normal*proj_velocity_normal > 0:
-				same_direction = True
-
-			if abs(proj_velocity_normal) > abs(proj_distance_normal)-shape.radius:
-				if within_edges and same_direction:
-					self.collision=line
+		lines = self.lines
+		hits = np.nonzero(segment_hits(lines, self.velocity, shape.coords,
+			shape.velocity, shape.radius))[0]
+		if len(hits):
+			self.collision = lines[hits[-1]]
 
 		return self.collision
 
 class Obstacle(rectangle):
 	# This is the break out wall
-	def __init__(self, coords, dimensions, velocity, moving=False):
+	__slots__ = ()
+
+	def __init__(self, coords, dimensions, velocity, moving=False, store=None):
 		self.moving=moving
-		rectangle.__init__(self, coords, dimensions, velocity, moving=moving)
+		rectangle.__init__(self, coords, dimensions, velocity, moving=moving,
+			store=store)
 
 	def break_out(self):
 		self.dimensions = [0,0] # shrink wall to nothing after collision
 		self.get_positions() # update positions and lines after shrinking wall
-		self.get_lines()
 
 class chaotic_field(rectangle):
-	def __init__(self, coords, dimensions, velocity, moving=False):
+	__slots__ = ("count", "perimeter", "rng")
+
+	def __init__(self, coords, dimensions, velocity, moving=False, store=None,
+			rng=None):
 		self.moving=moving
-		rectangle.__init__(self, coords, dimensions, velocity, moving=moving)
+		rectangle.__init__(self, coords, dimensions, velocity, moving=moving,
+			store=store)
 		self.count = 1
-		self.perimeter = self.positions[0:3]+self.positions[5:6]
+		self.rng = rng if rng is not None else random # game passes its own
+		self.perimeter = self.positions[[0, 1, 2, 5]]
 
 	def random_velocity(self, ball):
 		# checks if ball is within field
 		# counts while ball is within field
 		# changes ball velocity after 20 increments
+		# returns True when it has changed the velocity
 		within = False
 		within = ball.check_inscreen(self.perimeter)
 		
@@ -206,103 +534,431 @@ class chaotic_field(rectangle):
 			self.count += 1
 
 			if self.count%20 == 0:
-				x = random.uniform(-3,3)
-				y = random.uniform(-3,3)
+				x = self.rng.uniform(-3,3)
+				y = self.rng.uniform(-3,3)
 				ball.velocity = np.array([x, y])
+				return True
+		return False
 
 class gravity_field(rectangle):
-	def __init__(self, coords, dimensions, velocity, gravity, moving=False):
-		rectangle.__init__(self, coords, dimensions, velocity, moving=moving)
+	__slots__ = ("gravity", "perimeter")
+
+	def __init__(self, coords, dimensions, velocity, gravity, moving=False,
+			store=None):
+		rectangle.__init__(self, coords, dimensions, velocity, moving=moving,
+			store=store)
 		self.gravity = np.array(gravity, dtype=float)
 
-	def force(self, shape):
+	def force(self, shape, timestep=1):
 		# checks if ball is within field
 		# adds gravity to ball velocity every time step ball is in field
-		self.perimeter = self.positions[0:3] + self.positions[5:6]
+		# returns whether the ball is in the field
+		self.perimeter = self.positions[[0, 1, 2, 5]]
 		within = False
 		within = shape.check_inscreen(self.perimeter)
 		if within:
-			shape.velocity += self.gravity
+			if timestep == 1:
+				shape.velocity += self.gravity
+			else:
+				shape.velocity += self.gravity*timestep
+		return within
 
 class Portal:
-
-	def __init__(self):
+	''' A network of portals (a.k.a. lines) the ball jumps between. By
+	default each portal sends the ball on to the one before it in
+	line_list (the first to the last). link() gives a portal its own
+	exits instead: links are one way, and a portal with several exits
+	picks one at random by weight, with the game's random generator.
+	compile() works out every entry box and jump once and files the boxes
+	in a grid of cells, so finding the portal a ball is in only tests the
+	portals of its cell. Portals do not move; adding or linking portals
+	compiles the network again at the next lookup.'''
+
+	def __init__(self, store=None, rng=None, cell=50, width=600, height=300):
 		# keeps list of portals (a.k.a. lines) to transport between
 		# lines are actually skinny rectangles drawn on canvas
+		self.store = store
 		self.lines = {}
-		self.line_list = self.lines.keys()
+		self.line_list = list(self.lines.keys())
 		self.count = 0
+		self.rng = rng if rng is not None else random # game passes its own
+		self.routes = {} # portal name: [(exit name, weight)], see link
+		self.cell = float(cell)
+		self.columns = int(width//cell) + 1
+		self.rows = int(height//cell) + 1
+		self.compiled = False
 
 	def add_line(self, coords, dimensions):
 		self.count+=1
-		line = piece(coords, dimensions, [0, 0])
+		line = piece(coords, dimensions, [0, 0], store=self.store)
 		name = "portal"+str(self.count)
 		self.lines[name]=line
 		self.line_list.append(name)
+		self.compiled = False
+		return name
+
+	def link(self, entry, exit, weight=1.0):
+		# sends balls from portal entry to portal exit (names), one way
+		# an entry linked to several exits picks one at random by weight
+		if entry == exit:
+			raise ValueError("portal %s cannot lead to itself" % entry)
+		self.routes.setdefault(entry, []).append((exit, float(weight)))
+		self.compiled = False
+
+	def compile(self):
+		# boxes: (P, 4) entry boxes [left, top, right, bottom] in line_list
+		# order, box_list the same as lists for the one ball lookup
+		# exits: for each portal, its exits, their jumps and the running
+		# sum of their weights (out of 1), and first_jumps the first jump
+		# of each as a (P, 2) array for many balls
+		# cells: for each grid cell, the portals whose box reaches it, in
+		# order; table the same padded with P (no portal)
+		number = dict((name, i) for i, name in enumerate(self.line_list))
+		self.box_list = []
+		self.exits = []
+		for i, name in enumerate(self.line_list):
+			line = self.lines[name]
+			self.box_list.append(line.positions[[0, 1, 2, 5]].tolist())
+			targets = []
+			jumps = []
+			bounds = []
+			total = 0.0
+			for exit, weight in self.routes.get(name, [(self.line_list[i-1], 1.0)]):
+				other = self.lines[exit]
+				# lands as far past the exit as the portal is long
+				jump = other.coords - line.coords
+				jump = jump*(1+2*norm(line.dimensions)/norm(jump))
+				total += weight
+				targets.append(number[exit])
+				jumps.append(jump)
+				bounds.append(total)
+			self.exits.append((targets, jumps, [bound/total for bound in bounds]))
+		count = len(self.box_list)
+		self.boxes = np.array(self.box_list, dtype=float).reshape(-1, 4)
+		self.first_jumps = np.array([jumps[0] for targets, jumps, bounds
+			in self.exits]).reshape(-1, 2)
+		self.random_exits = [i for i, (targets, jumps, bounds)
+			in enumerate(self.exits) if len(targets) > 1]
+
+		self.cells = [[] for i in range(self.columns*self.rows)]
+		for i, (left, top, right, bottom) in enumerate(self.box_list):
+			c0, r0 = self.cell_of(left, top)
+			c1, r1 = self.cell_of(right, bottom)
+			for row in range(r0, r1 + 1):
+				for column in range(c0, c1 + 1):
+					self.cells[row*self.columns + column].append(i)
+		width = max([len(cell) for cell in self.cells] + [1])
+		self.table = np.full((len(self.cells), width), count, dtype=int)
+		for i, cell in enumerate(self.cells):
+			self.table[i, :len(cell)] = cell
+		self.compiled = True
+
+	def cell_of(self, x, y):
+		# grid cell (column, row) of a point, the nearest one off the grid
+		column = int(x//self.cell)
+		row = int(y//self.cell)
+		column = 0 if column < 0 else self.columns - 1 if column >= self.columns else column
+		row = 0 if row < 0 else self.rows - 1 if row >= self.rows else row
+		return column, row
+
+	def find(self, x, y):
+		# number of the first portal (in line_list order) whose box has
+		# x, y strictly inside, like check_inscreen, or None
+		if not self.compiled:
+			self.compile()
+		column, row = self.cell_of(x, y)
+		for i in self.cells[row*self.columns + column]:
+			left, top, right, bottom = self.box_list[i]
+			if left < x < right and top < y < bottom:
+				return i
+		return None
+
+	def find_many(self, coords):
+		# find for (N, 2) coords at once, -1 where there is no portal
+		# the balls are tested against the first portal of their cell,
+		# then the ones not in it against the second, and so on, so balls
+		# in cells without portals are dropped at once
+		if not self.compiled:
+			self.compile()
+		coords = np.asarray(coords, dtype=float)
+		columns = np.clip((coords[:, 0]//self.cell).astype(int), 0, self.columns - 1)
+		rows = np.clip((coords[:, 1]//self.cell).astype(int), 0, self.rows - 1)
+		cells = rows*self.columns + columns
+		found = np.full(len(coords), -1, dtype=int)
+		left = np.arange(len(coords))
+		for slot in range(self.table.shape[1]):
+			candidates = self.table[cells[left], slot]
+			left = left[candidates < len(self.boxes)] # cells with more portals
+			if len(left) == 0:
+				break
+			candidates = candidates[candidates < len(self.boxes)]
+			boxes = self.boxes[candidates]
+			x = coords[left, 0]
+			y = coords[left, 1]
+			inside = ((x > boxes[:, 0]) & (x < boxes[:, 2]) &
+				(y > boxes[:, 1]) & (y < boxes[:, 3]))
+			found[left[inside]] = candidates[inside]
+			left = left[~inside]
+		return found
+
+	def jump(self, portal):
+		# offset a ball in portal number portal is moved by
+		targets, jumps, bounds = self.exits[portal]
+		if len(jumps) == 1:
+			return jumps[0]
+		draw = self.rng.random()
+		for jump, bound in zip(jumps, bounds):
+			if draw < bound:
+				return jump
+		return jumps[-1]
+
+	def jump_many(self, portals, rng):
+		# (N, 2) offsets of balls in (N,) portals, exits picked with rng
+		# (a numpy RandomState)
+		jumps = self.first_jumps[portals]
+		for portal in self.random_exits:
+			rows = np.nonzero(portals == portal)[0]
+			if len(rows) == 0:
+				continue
+			targets, exits, bounds = self.exits[portal]
+			picks = np.searchsorted(bounds, rng.random_sample(len(rows)),
+				side="right")
+			jumps[rows] = np.array(exits)[np.minimum(picks, len(exits) - 1)]
+		return jumps
 
 	def transport(self, ball):
-		# loops through portal list
-		# checks if ball is within portal
-		# shifts ball position to next portal in list
-		for i in range(len(self.line_list)):
-			name1 = self.line_list[i]
-			name2 = self.line_list[i-1]
-			line1 = self.lines[name1]
-			line2 = self.lines[name2]
-			perimeter = line1.positions[0:3] + line2.positions[5:6]
-			if ball.check_inscreen(perimeter):
-				new_coords = line2.coords-line1.coords
-				new_coords = new_coords*(1+2*norm(line1.dimensions)/norm(new_coords))
-				new_coords += ball.coords
-				ball.move(reset=2, coords=new_coords) # move method also used to reset positions
+		# checks if ball is within a portal
+		# shifts ball position past the portal's exit
+		# returns True when the ball has been moved
+		x, y = ball.coords.tolist()
+		portal = self.find(x, y)
+		if portal is None:
+			return False
+		new_coords = self.jump(portal) + ball.coords
+		ball.move(reset=2, coords=new_coords) # move method also used to reset positions
+		return True
 
 class circle(piece):
 	# This class adds circle specific stuff to piece class.
-	def __init__(self, coords, dimensions, velocity, moving=False):
+	__slots__ = ()
+
+	def __init__(self, coords, dimensions, velocity, moving=False, store=None):
 		self.moving=moving
-		piece.__init__(self, coords, dimensions, velocity, moving=moving)
+		piece.__init__(self, coords, dimensions, velocity, moving=moving,
+			store=store)
 
 class creature(rectangle):
-	def __init__(self, coords, dimensions, velocity, moving=True):
+	__slots__ = ("count", "rng")
+
+	def __init__(self, coords, dimensions, velocity, moving=True, store=None,
+			rng=None):
 		self.moving = True
-		rectangle.__init__(self, coords, dimensions, velocity, moving=moving)
+		rectangle.__init__(self, coords, dimensions, velocity, moving=moving,
+			store=store)
 		self.count = 0
+		self.rng = rng if rng is not None else random # game passes its own
 
-	def move(self, reset=0):
+	def moved(self):
 		# changes velocity every 200 time steps
 		# reflects off walls and paddles just like ball does
 		# ball reflects off creature sides
-		rectangle.move(self, reset)
-
 		self.count +=1
 		if self.count%200 == 0:
-			x = random.randint(-5,5)
-			y = random.randint(-5,5)
+			x = self.rng.randint(-5,5)
+			y = self.rng.randint(-5,5)
 			self.velocity = np.array([x, y])
 
+class counted_random(random.Random):
+	''' random.Random that counts its draws. game.snapshot only saves the
+	generator state (which makes a new tuple) when it has been used since
+	the last save. Both random and getrandbits are counted, so the numbers
+	drawn are the same as with random.Random.'''
+	def __init__(self, seed=None):
+		self.draws = 0
+		random.Random.__init__(self, seed)
+
+	def random(self):
+		self.draws += 1
+		return random.Random.random(self)
+
+	def getrandbits(self, k):
+		self.draws += 1
+		return random.Random.getrandbits(self, k)
+
+# game attributes made by pack_walls and compile_plan, which depend only on
+# which pieces are in play and the paddle shapes, not on where pieces are
+LAYOUT = ["wall_rows", "wall_keys", "segment_vertices", "segment_owners",
+	"segment_walls", "all_walls", "not_monster", "segments", "grid",
+	"moving_rows", "moving_list", "moving_indices", "sweep_indices",
+	"wall_values", "wall_starts", "wall_handlers", "plan_movers",
+	"plan_effects"]
+# game attributes kept by a snapshot. Dictionaries of pieces in play and
+# the packed walls are kept by reference: reset_pieces and pack_walls make
+# new ones rather than changing them
+SAVED = ["parts", "walls", "moving_parts"] + LAYOUT + ["counter", "hits",
+	"paddle_hits", "score_player1", "score_player2", "obstacle", "pentagon",
+	"switcheroo", "planet", "gate", "bricks", "arena"]
+# attributes of pieces that change during play, as (piece, attribute)
+PIECE_SAVED = [("paddleA", "change"), ("paddleB", "change"),
+	("switcheroo", "count"), ("monster", "count"), ("bumper", "dimensions")]
+
+class game_state:
+	''' One saved state of a game, filled by game.snapshot and put back by
+	game.restore. Its arrays are made once, so saving into an existing
+	game_state does not allocate.'''
+	def __init__(self, match):
+		store = match.store
+		self.coords = np.empty_like(store.coords)
+		self.velocity = np.empty_like(store.velocity)
+		self.vertices = np.empty_like(store.vertices)
+		self.length = np.empty_like(store.length)
+		self.gravity = np.empty_like(match.planet.gravity)
+		self.bricks = None
+		if match.bricks is not None:
+			self.bricks = np.empty_like(match.bricks.alive)
+		self.values = [None]*len(SAVED)
+		self.piece_values = [None]*len(PIECE_SAVED)
+		self.random_state = None
+		self.tick = None # set by snapshot_ring
+
+	def fits(self, match):
+		# False when the store has grown since the arrays were made (or
+		# bricks were put in or taken out)
+		if (self.bricks is None) != (match.bricks is None):
+			return False
+		if self.bricks is not None and self.bricks.shape != match.bricks.alive.shape:
+			return False
+		return self.coords.shape == match.store.coords.shape
+
+class snapshot_ring:
+	''' Snapshots of the last size ticks of a game, in slots made once and
+	reused in turn (tick modulo size).'''
+	def __init__(self, match, size=32):
+		self.match = match
+		self.slots = [game_state(match) for i in range(size)]
+
+	def save(self, tick):
+		# saves the game as it is before tick is played
+		# a slot made before the store grew (or bricks came or went) is
+		# made again by snapshot
+		slot = tick % len(self.slots)
+		state = self.match.snapshot(self.slots[slot])
+		self.slots[slot] = state
+		state.tick = tick
+
+	def restore(self, tick):
+		state = self.slots[tick % len(self.slots)]
+		if state.tick != tick:
+			raise ValueError("tick %d is no longer kept" % tick)
+		self.match.restore(state)
+
+# bits of the input mask given to game.apply_input, one tick per mask
+# [up-bit, down-bit] for each paddle, and a bit to restart the game
+INPUT_BITS = {"paddleA": [1, 2], "paddleB": [4, 8]}
+RESTART = 128
+
+def input_bits(paddle, move):
+	# bits of the input mask for a policy move of paddle
+	# move is -1 for up, 1 for down and 0 to stay still
+	up, down = INPUT_BITS[paddle]
+	if move < 0:
+		return up
+	elif move > 0:
+		return down
+	return 0
+
 class game:
 	''' The purpose of this class is to assemble all instances of game pieces
-	and update them altogether.'''
-	def __init__(self):
-
-		self.ball = circle([300, 150], [5, 5], [-1,1], moving = True)
-		self.paddleA = rectangle([50, 150], [10, 25], [0, 0], moving = True)
-		self.paddleB = rectangle([550, 250], [10, 25], [0,0], moving=True)
-		self.border = rectangle([300, 150], [300, 150], [0,0])
-
-		self.switcheroo = chaotic_field([300, 150], [30, 75], [0,0])
-		self.planet = gravity_field([300, 150], [50, 50], [0, 0], [0, 0.05])
-		self.gate = Portal()
+	and update them altogether. All randomness comes from the game's own
+	random generator, so a game made with the same seed and given the same
+	inputs plays out the same way.'''
+	def __init__(self, seed=None):
+
+		if seed is None:
+			seed = random.randrange(2**32)
+		self.seed = seed
+		self.random = counted_random(seed)
+		# generator state last saved by snapshot and the draws count it had
+		self.random_state = None
+		self.random_draws = -1
+
+		# every piece keeps its coords, velocity and outline in one store
+		self.store = piece_store()
+		store = self.store
+
+		self.ball = circle([300, 150], [5, 5], [-1,1], moving = True, store=store)
+		self.paddleA = rectangle([50, 150], [10, 25], [0, 0], moving = True,
+			store=store)
+		self.paddleB = rectangle([550, 250], [10, 25], [0,0], moving=True,
+			store=store)
+		self.border = rectangle([300, 150], [300, 150], [0,0], store=store)
+
+		self.switcheroo = chaotic_field([300, 150], [30, 75], [0,0], store=store,
+			rng=self.random)
+		self.planet = gravity_field([300, 150], [50, 50], [0, 0], [0, 0.05],
+			store=store)
+		self.gate = Portal(store=store, rng=self.random)
 		self.gate.add_line([400, 250], [20, 3])
 		self.gate.add_line([200, 250], [20, 3])
-		self.monster = creature([120, 200], [15, 15], [1, -1])
-		self.bumper = Obstacle([400, 150], [3,50], [0,0])
+		self.monster = creature([120, 200], [15, 15], [1, -1], store=store,
+			rng=self.random)
+		self.bumper = Obstacle([400, 150], [3,50], [0,0], store=store)
 		self.counter = 1
+		self.fixed_obstacle = None
+		self.fixed_pentagon = None
+
+		# walls added with add_wall, kept in play through resets
+		self.extra_walls = {}
+		# optional pong_forces.force_grid acting on the ball everywhere, on
+		# top of the obstacle (see set_forces)
+		self.forces = None
+		# optional pong_bricks.brick_field, put back at every reset
+		self.bricks = None
+		self.base_bricks = None # set_bricks field, when a level has none
+		# optional pong_multiball.ball_set of extra balls (see set_balls)
+		self.balls = None
+		# optional pong_levels.level_library: when set, every reset picks
+		# one of its levels instead of an obstacle; arenas are the pieces
+		# made for each level picked so far, arena the one in play
+		self.levels = None
+		self.arenas = {}
+		self.arena = None
+		# above this many wall lines, a segment_grid picks the lines to test
+		self.grid_threshold = 512
+		self.grid = None
+		self.moving_rows = None
+		# LAYOUT values of each obstacle (or level, by the hash of its file)
+		# and paddle shape played so far, see use_layout
+		self.layouts = {}
+		# rows of the ball and paddles after a reset (see reset_movers)
+		self.reset_rows = None
+		# the moving_indices or sweep_indices the store moves now
+		# (see activate_movers)
+		self.active_rows = None
+
+		# swept collision finds the exact time of impact instead of looking
+		# one step ahead, so the ball cannot pass through walls when it is
+		# fast or when timestep (ticks of motion per update) is large
+		self.swept = False
+		self.timestep = 1
+		self.max_bounces = 8
+
+		# "scalar" tests the ball against the wall lines in plain floats
+		# (segment_hit_rows), "numpy" with arrays (segment_hits); both give
+		# the same game, scalar is faster for one game
+		self.backend = "scalar"
 
 		self.init_main_pieces() # create dictionaries to group game pieces
 		self.init_obstacles() # create obstacle dictionary to choose obstacle
 
 		self.hits = 0 
+		self.paddle_hits = 0 # all paddle hits, never reset
+		# counts events that change the path of the ball (collisions, portal
+		# jumps, chaotic field kicks, entering gravity, resets), so something
+		# that predicts the path (like pong_ai.predictor) knows when to
+		# predict again; never saved or restored, only goes up
+		self.trajectory_changes = 0
+		self.in_gravity = False
 		
 		self.score_player1 = 0
 		self.score_player2 = 0
@@ -317,6 +973,8 @@ class game:
 		keys = ["paddleA", "paddleB", "border"]
 		values = [self.paddleA, self.paddleB, self.border]
 		self.walls = dict(zip(keys, values))
+		self.parts.update(self.extra_walls)
+		self.walls.update(self.extra_walls)
 
 		keys = ["paddleA", "paddleB", "zball"]
 		values = [self.paddleA, self.paddleB, self.ball]
@@ -337,37 +995,264 @@ class game:
 		# updates dictionaries according to obstacle selection
 		# if random number is even, paddle shapes change to pentagons
 
-		options = self.obstacles.keys()
-		lottery = random.randint(0,len(options)-1)
+		# fixed_obstacle and fixed_pentagon, when set, replace the lottery
+		# (used by benchmarks that look at one obstacle at a time)
+
+		options = list(self.obstacles.keys())
+		if self.levels is not None:
+			options = self.levels.names
+		lottery = self.random.randint(0,len(options)-1)
 		choice = options[lottery] # select obstacle
-		if lottery%2 == 0: # change paddle shape if lottery is even
+		pentagon = lottery%2 == 0
+		if self.fixed_obstacle is not None:
+			choice = self.fixed_obstacle
+		if self.fixed_pentagon is not None:
+			pentagon = self.fixed_pentagon
+		self.obstacle = choice # kept for statistics (see pong_tournament)
+		self.pentagon = pentagon
+		if pentagon: # change paddle shape if lottery is even
 			self.paddleA.change = 1
 			self.paddleB.change = -1
 			self.paddleA.change_profile()
 			self.paddleB.change_profile()
 
-		if choice == "gate": # update dictionaries based on selected obstacle
+		# the game's own fields, portals and bricks, unless a level has its own
+		self.switcheroo = self.obstacles["switcheroo"]
+		self.planet = self.obstacles["planet"]
+		self.gate = self.obstacles["gate"]
+		self.bricks = self.base_bricks
+		self.arena = None
+
+		if self.levels is not None:
+			# a level's pieces are made the first time it is picked only
+			if choice not in self.arenas:
+				self.arenas[choice] = self.levels.arena(choice, self)
+			self.arena = self.arenas[choice]
+			self.arena.apply(self)
+		elif choice == "gate": # update dictionaries based on selected obstacle
 			self.parts.update(self.gate.lines)
 		elif choice == "monster":
 			self.parts["monster"] = self.monster
 			self.moving_parts["monster"] = self.monster
 			self.walls["monster"] = self.monster
 		elif choice == "bumper":
-			x = random.randint(200, 400)
+			x = self.random.randint(200, 400)
 			y = 150
 			self.bumper.dimensions = [3, 50]
 			self.bumper.move(coords=[x,y], reset=2)
 			self.parts["bumper"] = self.obstacles["bumper"]
 			self.walls["bumper"] = self.obstacles["bumper"]
 		elif choice == "planet":
-			x = random.randint(200, 400)
-			y = random.randint(100, 200)
+			x = self.random.randint(200, 400)
+			y = self.random.randint(100, 200)
 			if y%2: self.planet.gravity[1] = -0.05
 			self.planet.move(coords=[x, y], reset=2)
 			self.parts["planet"] = self.obstacles[choice]
 		else:
 			self.parts[choice] = self.obstacles[choice]
 
+		# walls dictionary and paddle shapes have changed
+		# a level's layout is its arena's, the walls are that arena's pieces
+		key = choice if self.arena is None else self.arena
+		self.use_layout((key, pentagon, len(self.parts)))
+
+	def use_layout(self, key):
+		# packs the walls and compiles the plan, or takes them from the last
+		# time the same pieces were in play (key) and only copies the line
+		# ends; a layout with a grid is packed again, as the grid files the
+		# lines by where they are
+		layout = self.layouts.get(key)
+		if layout is None:
+			self.pack_walls()
+			if self.grid is None:
+				self.layouts[key] = [getattr(self, name) for name in LAYOUT]
+			return
+		for name, value in zip(LAYOUT, layout):
+			setattr(self, name, value)
+		self.refresh_walls()
+
+	def pack_walls(self):
+		# packs the lines of every wall into one (M, 4) array for segment_hits
+		# wall_rows keeps which rows belong to which wall, in walls order
+		# segment_vertices are the store rows of the two ends of each line
+		# rebuilt only when walls change; refresh_walls copies the new ends
+		# segment_walls is the position of each line's wall in wall_keys
+		self.wall_rows = {}
+		self.wall_keys = list(self.walls.keys())
+		ends = []
+		owners = []
+		walls = []
+		slots = self.store.vertex_slots
+		for number, key in enumerate(self.wall_keys):
+			value = self.walls[key]
+			count = self.store.length[value.index] - 1
+			first = value.index*slots
+			self.wall_rows[key] = slice(len(ends), len(ends)+count)
+			ends.extend([first+i, first+i+1] for i in range(count))
+			owners.extend([value.index]*count)
+			walls.extend([number]*count)
+		self.segment_vertices = np.array(ends, dtype=int).reshape(-1, 2)
+		self.segment_owners = np.array(owners, dtype=int)
+		self.segment_walls = np.array(walls, dtype=int)
+		self.all_walls = np.ones(len(self.wall_keys), dtype=bool)
+		self.not_monster = np.array([key != "monster" for key in self.wall_keys])
+		self.segments = np.zeros((len(ends), 4))
+		self.grid = None # the old grid has the old lines, made again below
+		self.refresh_walls()
+
+		# broadphase grid, only worth it when there are many lines
+		# moving_rows are lines of moving walls, filed again every tick
+		if len(self.segments) > self.grid_threshold:
+			self.grid = segment_grid()
+			self.grid.build(self.segments)
+			moving = [self.wall_rows[key] for key, value in self.walls.items()
+				if value.moving]
+			self.moving_rows = np.concatenate([np.arange(rows.start, rows.stop)
+				for rows in moving]) if moving else np.zeros(0, dtype=int)
+
+		# store rows of the pieces moved each tick, made active in the store
+		# by activate_movers so they move in one go
+		self.moving_list = [part for part in self.parts.values() if part.moving]
+		self.moving_indices = [part.index for part in self.moving_list]
+		# with swept collision the ball and monster are moved by sweep
+		self.sweep_indices = [part.index for part in self.moving_list
+			if part not in self.moving_parts.values() or part in (self.paddleA,
+			self.paddleB)]
+
+		self.compile_plan()
+
+	def compile_plan(self):
+		# works out once what every tick does with the pieces now in play,
+		# so update_pieces, collide and hit_wall need no dictionary copies or
+		# key comparisons; made again by pack_walls when the obstacle changes
+		# wall_values and wall_starts: each wall and its first packed line
+		# wall_handlers: what happens when a wall is hit, besides bouncing
+		# plan_movers: (item, walls it bounces off, last of them) for the
+		# ball and the monster, in moving_parts order
+		# plan_effects: the obstacle effect on the ball, if any, then the
+		# extra balls
+		self.wall_values = [self.walls[key] for key in self.wall_keys]
+		self.wall_starts = [self.wall_rows[key].start for key in self.wall_keys]
+		self.wall_handlers = []
+		for key, value in zip(self.wall_keys, self.wall_values):
+			if key == "paddleA" or key == "paddleB":
+				self.wall_handlers.append(self.paddle_hit)
+			elif isinstance(value, Obstacle):
+				self.wall_handlers.append(self.break_wall)
+			else:
+				self.wall_handlers.append(None)
+
+		self.plan_movers = []
+		for key, item in self.moving_parts.items():
+			if key == "paddleA" or key == "paddleB":
+				continue
+			# the monster does not bounce off itself
+			allowed = self.all_walls if item == self.ball else self.not_monster
+			self.plan_movers.append((item, allowed, np.nonzero(allowed)[0][-1]))
+
+		# an obstacle brings one of these, a level any of them
+		names = self.parts.keys()
+		self.plan_effects = []
+		if "switcheroo" in names:
+			self.plan_effects.append(self.kick_ball)
+		if "portal1" in names or "portal2" in names:
+			self.plan_effects.append(self.jump_ball)
+		if "planet" in names:
+			self.plan_effects.append(self.pull_ball)
+		if self.forces is not None:
+			self.plan_effects.append(self.push_ball)
+		if self.bricks is not None:
+			self.plan_effects.append(self.hit_bricks) # with the final velocity
+		if self.balls is not None:
+			self.plan_effects.append(self.move_balls)
+
+	def activate_movers(self):
+		# makes the store's active pieces those moved each tick, which change
+		# with the layout (after a reset or restore) and with swept
+		rows = self.sweep_indices if self.swept else self.moving_indices
+		if rows is self.active_rows:
+			return
+		self.store.deactivate(np.setdiff1d(self.store.active, rows))
+		self.store.activate(rows)
+		self.active_rows = rows
+
+	def refresh_walls(self):
+		# copies the line ends of every wall from the store, without allocating
+		np.take(self.store.vertices, self.segment_vertices, axis=0,
+			out=self.segments.reshape(-1, 2, 2))
+		if self.grid is not None:
+			self.grid.update(self.segments, self.moving_rows)
+
+	def add_wall(self, key, wall):
+		# adds an extra wall (like another bumper) for the rest of the game
+		self.extra_walls[key] = wall
+		self.parts[key] = wall
+		self.walls[key] = wall
+		self.layouts = {}
+		self.pack_walls()
+
+	def find_hits(self, item):
+		# rows of the packed wall lines item is about to hit, in order
+		# tested with segment_hit_rows or segment_hits, as backend says
+		# with a grid, only lines near the item are tested: a line can only
+		# be hit if it is closer than radius plus the relative speed
+		rows = None
+		velocities = None
+		if self.grid is not None:
+			velocities = self.segment_velocities()
+			speeds = np.sqrt((velocities**2).sum(1))
+			reach = item.radius + norm(item.velocity) + speeds.max() + 1
+			x, y = item.coords
+			rows = self.grid.query(x-reach, y-reach, x+reach, y+reach)
+			if len(rows) == 0:
+				return rows
+
+		if self.backend == "scalar":
+			# the velocities of the lines' walls only, not the whole store
+			if rows is None:
+				segments = self.segments.tolist()
+				owners = self.segment_owners
+			else:
+				segments = self.segments[rows].tolist()
+				owners = self.segment_owners[rows]
+			speeds = self.store.velocity.take(owners, axis=0).tolist()
+			hits = segment_hit_rows(segments, speeds,
+				item.coords.tolist(), item.velocity.tolist(), float(item.radius))
+			return hits if rows is None else rows[hits]
+
+		if rows is None:
+			return np.nonzero(segment_hits(self.segments,
+				self.segment_velocities(), item.coords, item.velocity,
+				item.radius))[0]
+		hits = segment_hits(self.segments[rows], velocities[rows], item.coords,
+			item.velocity, item.radius)
+		return rows[hits]
+
+	def segment_velocities(self):
+		# velocity of each packed line, taken from the wall it belongs to
+		return self.store.velocity[self.segment_owners]
+
+	def steer_paddle(self, paddle, up, down, velocity=2):
+		# sets paddle velocity from up/down commands
+		# used by controls (keyboard) and by headless scripted inputs
+		# uses paddle center and height to check if paddle is on screen
+		y = self.parts[paddle].coords[1]
+		height = self.parts[paddle].dimensions[1]
+
+		if up and y>(0+height):
+			self.parts[paddle].velocity = [0, -velocity]
+
+		elif down and y<(300-height):
+			self.parts[paddle].velocity = [0, velocity]
+
+		else:
+			self.parts[paddle].velocity = [0, 0]
+
+	def apply_input(self, mask, velocity=2):
+		# steers both paddles from an input mask (see INPUT_BITS)
+		for paddle, (up, down) in INPUT_BITS.items():
+			self.steer_paddle(paddle, mask & up, mask & down, velocity)
+
 	def update_score(self):
 		# Updates score when ball is behind paddle.
 		# Returns True to the top level run loop to indicate game reset
@@ -388,71 +1273,313 @@ class game:
 		self.walls = {}
 		self.moving_parts = {}
 		self.init_main_pieces()
-		for part in self.parts.values():
-			if part.moving == True:
-				part.move(reset=1) # update positions of each game piece.
+		self.reset_movers() # update positions of each game piece.
 		self.choose_obstacle()
+		if self.bricks is not None:
+			self.bricks.reset()
+		self.trajectory_changes += 1
+		self.in_gravity = False
 		if new_game!=0:
 			self.score_player1 = 0
 			self.score_player2 = 0
 
+	def reset_movers(self):
+		# moves every moving part back to its start and one step on, as
+		# move(reset=1) does; the ball and paddles always end up in the
+		# same rows of the store, so these are saved the first time and
+		# copied back in one go after that
+		main = [self.ball, self.paddleA, self.paddleB]
+		for part in self.parts.values():
+			if part.moving == True and part not in main:
+				part.move(reset=1)
+		store = self.store
+		if self.reset_rows is None:
+			for part in main:
+				part.move(reset=1)
+			indices = np.array([part.index for part in main])
+			vertex_rows = (indices[:, None]*store.vertex_slots +
+				np.arange(store.vertex_slots)).reshape(-1)
+			self.reset_rows = (indices, vertex_rows, store.coords[indices],
+				store.velocity[indices], store.vertices[vertex_rows],
+				store.length[indices])
+			return
+		indices, vertex_rows, coords, velocity, vertices, length = self.reset_rows
+		store.coords[indices] = coords
+		store.velocity[indices] = velocity
+		store.vertices[vertex_rows] = vertices
+		store.length[indices] = length
+		store.touch(indices)
+
+	def hit_wall(self, item, number, line, handle=True):
+		# what happens when item (ball or monster) hits a line of the wall
+		# at position number in wall_keys
+		# handle=False only bounces, without the wall's handler
+		value = self.wall_values[number]
+		item.hit = value
+		item.reflect2(line) # reflects ball (or monster)
+		if item == self.ball:
+			self.trajectory_changes += 1
+		handler = self.wall_handlers[number]
+		if handler is not None and handle:
+			handler(item, value)
+
+	def paddle_hit(self, item, paddle):
+		# keeps track of paddle hits
+		# after five paddle hits, increases ball velocity
+		if item == self.ball:
+			self.hits+=1
+			self.paddle_hits+=1
+			if self.hits == 5:
+				self.hits = 0
+				self.ball.velocity *= 1.5
+
+	def break_wall(self, item, wall):
+		# collision wall is break out wall, so call break_out() method
+		wall.break_out()
+		self.refresh_walls()
+
+	def collide(self, item, allowed, last_wall):
+		# one step look ahead collision of item against the walls
+		# allowed are the walls item can hit and last_wall the last of them
+		# returns the collision of the last wall checked (or None)
+
+		# one test of the item against all the packed wall lines
+		hit_rows = self.find_hits(item)
+		if len(hit_rows) == 0:
+			return None # nothing hit, most ticks
+
+		# walls are visited in order, but only the ones with hit lines
+		# last_line is the collision of the last wall checked, if any
+		checked = -1
+		last_line = None
+		while len(hit_rows):
+			hit_rows = np.asarray(hit_rows, dtype=int)
+			walls = self.segment_walls[hit_rows]
+			later = (walls > checked) & allowed[walls]
+			if not later.any():
+				break
+			checked = walls[later].min()
+			value = self.wall_values[checked]
+			# the last hit line of the wall is the collision, like hit_check
+			row = hit_rows[walls == checked][-1]
+			value.collision = value.lines[row - self.wall_starts[checked]]
+			if checked == last_wall:
+				last_line = value.collision
+			if self.counter < 1:
+				self.counter+=1
+				self.hit_wall(item, checked, value.collision)
+				# item velocity and wall velocity changed, test again
+				hit_rows = self.find_hits(item)
+		return last_line
+
+	def sweep(self, item, allowed):
+		# moves item through the whole time step, bouncing off every wall
+		# line it touches on the way at the exact time of impact
+		# walls keep moving at their velocity during the step, so the test
+		# uses the item velocity relative to each line
+		# a ball wedged between two walls touches both at once: the line
+		# just hit (last) only counts again when item moves towards it,
+		# item is pushed out of the line after each bounce, and each
+		# wall's handler (like the paddle speed up) runs once per step
+		remaining = float(self.timestep)
+		last = None
+		handled = set()
+		for bounce in range(self.max_bounces+1):
+			rows = np.nonzero(allowed[self.segment_walls])[0]
+			velocities = self.segment_velocities()
+			if self.grid is not None:
+				speed = np.sqrt((velocities**2).sum(1)).max()
+				reach = item.radius + (norm(item.velocity)+speed)*remaining + 1
+				x, y = item.coords
+				near = self.grid.query(x-reach, y-reach, x+reach, y+reach)
+				rows = near[allowed[self.segment_walls[near]]]
+			if len(rows) == 0:
+				break
+			# lines where they are at this point of the step
+			elapsed = self.timestep - remaining
+			segments = self.segments[rows] + np.tile(velocities[rows]*elapsed, 2)
+			relative = item.velocity - velocities[rows]
+			times = segment_contacts(segments, item.coords, relative, item.radius)
+			if last is not None:
+				again = np.nonzero(rows == last)[0]
+				if len(again):
+					gx, gy, gap, end = segment_gap(segments[again[0]].tolist(),
+						item.coords.tolist())
+					rx, ry = relative[again[0]].tolist()
+					if rx*gx + ry*gy >= 0:
+						times[again[0]] = np.inf
+			first = np.argmin(times)
+			if times[first] > remaining:
+				break
+			item.shift(item.velocity*times[first])
+			remaining -= times[first]
+			if bounce == self.max_bounces:
+				# still hitting walls: stop here rather than pass through them
+				return
+			row = rows[first]
+			number = self.segment_walls[row]
+			value = self.wall_values[number]
+			value.collision = value.lines[row - self.wall_starts[number]]
+			# an end of the line (a corner) turns item round along the
+			# line from the end to item, not along the face's normal,
+			# which would send a ball beside a corner back into it
+			segment = segments[first].tolist()
+			x, y = item.coords.tolist()
+			gx, gy, gap, end = segment_gap(segment, (x, y))
+			line = value.collision
+			if end and gap > 0:
+				line = [x - gy, y + gx, x + gy, y - gx]
+			self.hit_wall(item, number, line, number not in handled)
+			handled.add(number)
+			last = row
+			# out of any overlap with the line, where it is at this time
+			if 0 < gap < item.radius:
+				scale = (item.radius - gap)/gap
+				item.shift([gx*scale, gy*scale])
+		item.shift(item.velocity*remaining)
+
+	def snapshot(self, state=None):
+		# saves the whole game state (see game_state), for rollback
+		# pass a game_state to reuse it; a new one is made otherwise
+		if state is None or not state.fits(self):
+			state = game_state(self)
+		store = self.store
+		np.copyto(state.coords, store.coords)
+		np.copyto(state.velocity, store.velocity)
+		np.copyto(state.vertices, store.vertices)
+		np.copyto(state.length, store.length)
+		np.copyto(state.gravity, self.planet.gravity)
+		if self.bricks is not None:
+			np.copyto(state.bricks, self.bricks.alive)
+		values = state.values
+		for i, name in enumerate(SAVED):
+			values[i] = getattr(self, name)
+		values = state.piece_values
+		for i, (name, attribute) in enumerate(PIECE_SAVED):
+			values[i] = getattr(getattr(self, name), attribute)
+		if self.random.draws != self.random_draws:
+			self.random_state = self.random.getstate()
+			self.random_draws = self.random.draws
+		state.random_state = self.random_state
+		return state
+
+	def restore(self, state):
+		# puts back a state saved by snapshot
+		# walls added by add_wall after the snapshot are not taken out
+		store = self.store
+		np.copyto(store.coords, state.coords)
+		np.copyto(store.velocity, state.velocity)
+		np.copyto(store.vertices, state.vertices)
+		np.copyto(store.length, state.length)
+		store.dirty[:] = True
+		for name, value in zip(SAVED, state.values):
+			setattr(self, name, value)
+		# the planet and bricks may be a level's, so after the pieces
+		np.copyto(self.planet.gravity, state.gravity)
+		if self.bricks is not None and state.bricks is not None:
+			self.bricks.restore(state.bricks)
+		for (name, attribute), value in zip(PIECE_SAVED, state.piece_values):
+			setattr(getattr(self, name), attribute, value)
+		if (state.random_state is not self.random_state or
+				self.random.draws != self.random_draws):
+			self.random.setstate(state.random_state)
+			self.random_state = state.random_state
+			self.random_draws = self.random.draws
+		self.refresh_walls() # segments are shared, take the ends again
+		self.trajectory_changes += 1
+
+	def apply_obstacles(self):
+		# these are obstacle specific methods for gravity, chaotic field and
+		# portal, picked by compile_plan
+		for effect in self.plan_effects:
+			effect()
+
+	# obstacle effects on the ball
+	# events that change the path of the ball are counted
+	def kick_ball(self):
+		if self.switcheroo.random_velocity(self.ball):
+			self.trajectory_changes += 1
+
+	def jump_ball(self):
+		if self.gate.transport(self.ball):
+			self.trajectory_changes += 1
+
+	def pull_ball(self):
+		within = self.planet.force(self.ball, self.timestep)
+		if within and not self.in_gravity:
+			self.trajectory_changes += 1
+		self.in_gravity = within
+
+	def push_ball(self):
+		# force field: one lookup of the grid at the ball
+		x, y = self.ball.coords.tolist()
+		ax, ay = self.forces.sample(x, y)
+		self.ball.velocity += [ax*self.timestep, ay*self.timestep]
+
+	def hit_bricks(self):
+		# bounces the ball off the first brick in its way and breaks it
+		x, y = self.ball.coords.tolist()
+		vx, vy = self.ball.velocity.tolist()
+		axis = self.bricks.bounce(x, y, vx*self.timestep, vy*self.timestep,
+			self.ball.dimensions[0])
+		if axis is not None:
+			velocity = self.ball.velocity # view into the store
+			velocity[axis] = -velocity[axis]
+			self.trajectory_changes += 1
+
+	def move_balls(self):
+		# every extra ball in one go, while the walls are still where the
+		# ball was tested against them
+		self.balls.step(self)
+
+	def set_bricks(self, bricks):
+		# puts a pong_bricks.brick_field in play (None takes it out)
+		# a level with its own bricks uses those while it is in play
+		self.bricks = bricks
+		self.base_bricks = bricks
+		self.layouts = {} # the plans made so far lack it
+		self.compile_plan()
+
+	def set_forces(self, forces):
+		# puts a pong_forces.force_grid in play (None takes it out), kept
+		# through resets; moving its sources is not undone by restore
+		self.forces = forces
+		self.layouts = {} # the plans made so far lack it
+		self.compile_plan()
+
+	def set_balls(self, balls):
+		# puts a pong_multiball.ball_set in play (None takes it out), kept
+		# through resets; like the force field it is not kept by snapshot
+		self.balls = balls
+		self.layouts = {} # the plans made so far lack it
+		self.compile_plan()
+
 	def update_pieces(self):
 		''' This method loops through the game pieces to call the "move" method
 		for each one. Then it loops through them again to check for collision. 
 		'''	
 		
-		# ball_stuff is list of objects that can reflet off walls
-		# usually just ball or ball and monster is in ball_stuff
-		ball_stuff = self.moving_parts.copy()
-		del ball_stuff["paddleA"]
-		del ball_stuff["paddleB"]
-
+		# plan_movers are the objects that can reflect off walls, usually
+		# just ball or ball and monster, with the walls each can hit
+		# (see compile_plan)
 		collision_line = None
 
-		for item in ball_stuff.values():
-	
-			x1, y1 = item.coords
-			# check_items is walls that can be reflected off of
-			# if the item from ball_stuff is the monster, 
-			# we want to leave monster out of check_items
-			if item == self.ball:
-				check_items = self.walls.copy()
+		for item, allowed, last_wall in self.plan_movers:
+			if self.swept:
+				self.sweep(item, allowed)
 			else:
-				check_items = self.walls.copy()
-				del check_items["monster"]
-
-			for key, value in check_items.items():
-				# this is where collision detection occurs
-				collision_line = value.hit_check(item) # saves collision wall
-				if value.collision != None and self.counter < 1:
-					self.counter+=1
-					item.hit = value
-					item.reflect2(collision_line) # reflects ball (or monster)
-					# keeps track of paddle hits
-					# after five paddle hits, increases ball velocity
-					if item == self.ball:
-						if key == "paddleA" or key == "paddleB":
-							self.hits+=1
-							if self.hits == 5:
-								self.hits = 0
-								self.ball.velocity *= 1.5
-					# checks if collision wall is break out wall
-					# then call break_out() method
-					if key == "bumper":
-						self.bumper.break_out()
-
-		if collision_line == None:
+				collision_line = self.collide(item, allowed, last_wall)
+
+		if collision_line is None:
 			self.counter = 0
 
-		# these are obstacle specific methods for gravity, chaotic field and portal				
-		names = self.parts.keys()
-		if "switcheroo" in names:
-			self.switcheroo.random_velocity(self.ball)
-		elif "portal1" in names or "portal2" in names:
-			self.gate.transport(self.ball)
-		elif "planet" in names:
-			self.planet.force(self.ball)
+		self.apply_obstacles()
 
-		for part in self.parts.values():
-			if part.moving == True:
-				part.move() # update positions of each game piece.
\ No newline at end of file
+		# update positions of every moving piece in one go, then let pieces
+		# like the monster react to having moved
+		# (swept items have already moved)
+		self.activate_movers()
+		self.store.advance_active(self.timestep)
+		for part in self.moving_list:
+			part.moved()
+		self.refresh_walls() # keep packed lines in step with walls
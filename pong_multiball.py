@@ -0,0 +1,282 @@
+from __future__ import print_function
+
+import numpy as np
+from pong_model import segment_hits
+from pong_batch import reflect
+
+''' Multiball. A ball_set keeps any number of extra balls in arrays, the
+live ones in the first count rows. Every tick they are all tested against
+the game's packed wall lines in one segment_hits call, and the portals,
+gravity, chaotic field, force field and scoring act on all of them with
+masks, so a tick costs a few array passes whatever the number of balls.
+Balls are added at the end of the arrays and taken out by moving the last
+live balls into the holes, so nothing is rebuilt when balls come and go.'''
+
+# per ball arrays, grown and reordered together
+ARRAYS = ["coords", "velocity", "counter", "hits", "kicks"]
+
+class ball_set:
+	''' Extra balls played alongside game.ball by game.set_balls. They
+	follow the rules of the ball (bounces, paddle speed up, breaking the
+	bumper, obstacles, scoring) but a point scored by one does not reset
+	the game: the ball is taken out and its player gets the point. When
+	keep is above zero, taken out balls are replaced by new ones from the
+	middle, so keep balls stay in play. seed is for the chaotic field
+	kicks and new balls only: the game's own random generator is never
+	used, so the game's ball plays out as it would without them. radius
+	is how close a ball gets to a wall line and to a brick before it
+	bounces; None (the default) takes the game ball's (its radius for the
+	walls, half its size for the bricks, as game.hit_bricks does).'''
+	def __init__(self, capacity=1024, radius=None, keep=0, speed=2.0, seed=None):
+		self.coords = np.zeros((capacity, 2))
+		self.velocity = np.zeros((capacity, 2))
+		self.counter = np.zeros(capacity, dtype=int) # game.counter of each ball
+		self.hits = np.zeros(capacity, dtype=int) # game.hits of each ball
+		self.kicks = np.ones(capacity, dtype=int) # chaotic_field.count of each ball
+		self.count = 0
+		self.radius = radius
+		self.keep = keep
+		self.speed = speed # of new balls from launch
+		self.rng = np.random.RandomState(seed)
+		self.spawned = 0
+		self.retired = 0
+		self.paddle_hits = 0
+
+	def grow(self, size):
+		# makes room for at least size balls, keeping the live ones
+		capacity = max(2*len(self.coords), size)
+		for name in ARRAYS:
+			old = getattr(self, name)
+			new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+			new[:self.count] = old[:self.count]
+			setattr(self, name, new)
+		self.kicks[self.count:] = 1
+
+	def spawn(self, coords, velocity):
+		# adds balls at (N, 2) coords with (N, 2) velocity (or one of each)
+		# returns the rows they were put in
+		coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+		velocity = np.asarray(velocity, dtype=float).reshape(-1, 2)
+		added = max(len(coords), len(velocity))
+		first = self.count
+		if first + added > len(self.coords):
+			self.grow(first + added)
+		rows = slice(first, first + added)
+		self.coords[rows] = coords
+		self.velocity[rows] = velocity
+		self.counter[rows] = 0
+		self.hits[rows] = 0
+		self.kicks[rows] = 1
+		self.count += added
+		self.spawned += added
+		return np.arange(first, first + added)
+
+	def launch(self, count, coords=(300, 150)):
+		# adds count balls at coords going left or right at speed, up to
+		# 45 degrees off the horizontal
+		angle = self.rng.uniform(-np.pi/4, np.pi/4, count)
+		angle += np.pi*self.rng.randint(2, size=count)
+		velocity = self.speed*np.stack([np.cos(angle), np.sin(angle)], axis=1)
+		return self.spawn(np.tile(np.asarray(coords, dtype=float), (count, 1)),
+			velocity)
+
+	def retire(self, mask):
+		# takes out the live balls where mask (count,) is True
+		# the last live balls are moved into the holes, so only as many
+		# rows are copied as balls taken out
+		count = self.count
+		taken = np.nonzero(mask)[0]
+		left = count - len(taken)
+		holes = taken[taken < left]
+		tail = np.arange(left, count)[~mask[left:count]]
+		for name in ARRAYS:
+			array = getattr(self, name)
+			array[holes] = array[tail]
+		self.count = left
+		self.retired += len(taken)
+
+	def clear(self):
+		self.retired += self.count
+		self.count = 0
+
+	def step(self, match):
+		# one tick of every ball: bounces, obstacle effects, moving, scoring
+		# called by the game (see game.move_balls) while the walls are
+		# where they were at the start of the tick
+		if self.count:
+			self.collide(match)
+			self.apply_obstacles(match)
+			live = slice(0, self.count)
+			self.coords[live] += self.velocity[live]*match.timestep
+			self.score(match)
+		if self.count < self.keep:
+			self.launch(self.keep - self.count)
+
+	def collide(self, match):
+		# game.collide for every ball at once: each ball bounces off the
+		# last hit line of the first wall it hits, if it did not bounce in
+		# the tick before (counter), like the game's ball
+		live = slice(0, self.count)
+		coords = self.coords[live]
+		velocity = self.velocity[live]
+		segments = match.segments
+		wall_velocity = match.segment_velocities()
+		walls = match.segment_walls
+		radius = match.ball.radius if self.radius is None else self.radius
+
+		# a ball can only hit a line closer than radius plus their relative
+		# speed, so only the pairs where the ball is in the line's box grown
+		# by that much are tested, most balls are near no line at all
+		reach = np.abs(velocity).sum(1) + radius + 1
+		grown = np.abs(wall_velocity).sum(1)
+		left = np.minimum(segments[:, 0], segments[:, 2]) - grown
+		right = np.maximum(segments[:, 0], segments[:, 2]) + grown
+		top = np.minimum(segments[:, 1], segments[:, 3]) - grown
+		bottom = np.maximum(segments[:, 1], segments[:, 3]) + grown
+		x = coords[:, 0]
+		y = coords[:, 1]
+		near = (((x + reach)[:, None] > left) & ((x - reach)[:, None] < right) &
+			((y + reach)[:, None] > top) & ((y - reach)[:, None] < bottom))
+		ball, row = np.nonzero(near)
+		hit = segment_hits(segments[row, None], wall_velocity[row, None],
+			coords[ball], velocity[ball], radius)[:, 0]
+		ball = ball[hit]
+		row = row[hit]
+
+		# the game's counter goes back to zero when the last wall is not hit
+		last = np.zeros(self.count, dtype=bool)
+		last[ball[walls[row] == len(match.wall_keys) - 1]] = True
+		ready = self.counter[ball] < 1
+		ball = ball[ready]
+		row = row[ready]
+		self.counter[ball] = 1
+		self.counter[live][~last] = 0
+		if len(ball) == 0:
+			return
+
+		# first wall first, then the last line of that wall: sorted by
+		# ball then priority, the last pair of each ball is its bounce
+		priority = (len(match.wall_keys) - walls[row])*len(segments) + row
+		order = np.lexsort((priority, ball))
+		ball = ball[order]
+		row = row[order]
+		ends = np.append(ball[1:] != ball[:-1], True)
+		balls = ball[ends]
+		row = row[ends]
+		velocity[balls] = reflect(velocity[balls], segments[row])
+		# unlike reflect2 the wall is not stopped: with this many balls a
+		# paddle would hardly ever get to move
+
+		number = walls[row]
+		for wall in np.unique(number).tolist():
+			handler = match.wall_handlers[wall]
+			if handler == match.paddle_hit:
+				paddle = balls[number == wall]
+				self.hits[paddle] += 1
+				self.paddle_hits += len(paddle)
+				fast = paddle[self.hits[paddle] == 5]
+				self.hits[fast] = 0
+				velocity[fast] *= 1.5
+			elif handler is not None:
+				# a broken wall changes the path of the game's ball too
+				handler(None, match.wall_values[wall])
+				match.trajectory_changes += 1
+
+	def apply_obstacles(self, match):
+		# the obstacle in play acts on every ball inside it, as
+		# game.apply_obstacles does on the game's ball
+		live = slice(0, self.count)
+		coords = self.coords[live]
+		velocity = self.velocity[live]
+		names = match.parts
+		if "switcheroo" in names:
+			inside = self.within(match.switcheroo.perimeter, coords)
+			kicks = self.kicks[live]
+			kicks[inside] += 1
+			kicked = np.nonzero(inside & (kicks % 20 == 0))[0]
+			velocity[kicked] = self.rng.uniform(-3, 3, (len(kicked), 2))
+		if "portal1" in names or "portal2" in names:
+			# one lookup of the portal network for every ball
+			portals = match.gate.find_many(coords)
+			inside = np.nonzero(portals >= 0)[0]
+			if len(inside):
+				# like Portal.transport, which moves the ball one step too
+				coords[inside] += (match.gate.jump_many(portals[inside], self.rng) +
+					velocity[inside])
+		if "planet" in names:
+			inside = self.within(match.planet.positions[[0, 1, 2, 5]], coords)
+			velocity[inside] += match.planet.gravity*match.timestep
+		if match.forces is not None:
+			velocity += match.forces.sample_many(coords)*match.timestep
+		if match.bricks is not None:
+			radius = match.ball.dimensions[0] if self.radius is None else self.radius
+			self.hit_bricks(match.bricks, match.timestep, radius)
+
+	def within(self, bounds, coords):
+		# vectorized piece.check_inscreen: centers strictly inside bounds
+		left, top, right, bottom = bounds
+		x = coords[:, 0]
+		y = coords[:, 1]
+		return (x > left) & (x < right) & (y > top) & (y < bottom)
+
+	def hit_bricks(self, bricks, timestep, radius):
+		# bounces the balls that can reach the brick field this tick off
+		# their first brick, one brick_field.bounce each
+		if bricks.standing == 0:
+			return
+		live = slice(0, self.count)
+		reach = np.abs(self.velocity[live]).max(1)*timestep + radius
+		x = self.coords[live, 0]
+		y = self.coords[live, 1]
+		near = ((x + reach > bricks.left) &
+			(x - reach < bricks.left + bricks.columns*bricks.width) &
+			(y + reach > bricks.top) &
+			(y - reach < bricks.top + bricks.rows*bricks.height))
+		rows = np.nonzero(near)[0]
+		if len(rows) == 0:
+			return
+		for row, (x, y), (vx, vy) in zip(rows.tolist(),
+				self.coords[rows].tolist(), self.velocity[rows].tolist()):
+			axis = bricks.bounce(x, y, vx*timestep, vy*timestep, radius)
+			if axis is not None:
+				self.velocity[row, axis] = -self.velocity[row, axis]
+
+	def score(self, match):
+		# balls behind a paddle give their point and are taken out
+		# score_player1 is the points of paddleB, like update_score
+		x = self.coords[:self.count, 0]
+		left = x < 30
+		right = x > 570
+		scored = left | right
+		if scored.any():
+			match.score_player1 += int(left.sum())
+			match.score_player2 += int(right.sum())
+			self.retire(scored)
+
+if __name__ == "__main__":
+	import sys
+	import time
+	from pong_model import game
+	from pong_headless import headless
+	from pong_render import framebuffer
+	# ticks per second of a game against the number of balls, one core
+	ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+	for count in [100, 1000, 4000, 10000]:
+		for obstacle in ["bumper", "switcheroo", "planet", "gate"]:
+			match = game(seed=1)
+			match.fixed_obstacle = obstacle
+			match.reset_pieces(new_game=1)
+			balls = ball_set(keep=count, seed=1)
+			match.set_balls(balls)
+			runner = headless(match)
+			start = time.time()
+			runner.run(ticks)
+			elapsed = time.time() - start
+			screen = framebuffer()
+			start = time.time()
+			for i in range(20):
+				screen.draw(match)
+			drawn = (time.time() - start)/20
+			print("%5d balls %-10s %6.0f ticks/s (%.2f ms), frame %.2f ms, "
+				"%d taken out" % (count, obstacle, ticks/elapsed,
+				elapsed/ticks*1000, drawn*1000, balls.retired))
@@ -0,0 +1,470 @@
+from __future__ import print_function
+
+import asyncio
+import random
+import struct
+import zlib
+import numpy as np
+from pong_model import *
+from pong_loop import scheduler, clock
+from pong_headless import track_ball
+
+''' Network play over UDP (needs python 3 for asyncio). The server runs the
+only real game and the clients just send their input masks and draw what
+the server sends back.
+
+The server sends snapshots: the positions of every piece, quantized to
+1/QUANTUM pixel, as a difference from the last snapshot the client has
+acknowledged and compressed with zlib. Pieces that did not move cost next
+to nothing, and a lost packet only means the next snapshot is a difference
+from an older one. Clients draw the game a little in the past
+(interpolation seconds) and blend the two snapshots around that time, so
+movement looks smooth even though snapshots come at a lower rate than
+ticks.'''
+
+HELLO, WELCOME, INPUT, SNAPSHOT, BYE = range(5)
+# kind, paddle (255 for a spectator), seed, seconds per tick
+WELCOME_HEADER = struct.Struct("<BBQd")
+# kind, input sequence number, last snapshot tick received, input mask
+INPUT_PACKET = struct.Struct("<BIIB")
+# kind, tick, tick of the base snapshot (0 if none), last input sequence
+# applied, scores, pieces in play (bit i for part name i)
+SNAPSHOT_HEADER = struct.Struct("<BIIIHHQ")
+QUANTUM = 32 # positions travel as int16 in 1/32 pixel
+HISTORY = 64 # snapshots kept by both sides to take differences against
+PADDLES = ["paddleA", "paddleB"]
+
+def all_parts(match):
+	# every piece that can be in match.parts, by name
+	parts = {"zball": match.ball, "paddleA": match.paddleA,
+		"paddleB": match.paddleB, "border": match.border}
+	for name, obstacle in match.obstacles.items():
+		if name != "gate": # the gate is in parts through its lines
+			parts[name] = obstacle
+	parts.update(match.gate.lines)
+	parts.update(match.extra_walls)
+	return parts
+
+def pack_state(match):
+	# int16 array of the coords and outlines of every piece in the store
+	# followed by the length of each outline
+	store = match.store
+	count = len(store.pieces)
+	values = np.concatenate([store.coords[:count].ravel(),
+		store.vertices[:count*store.vertex_slots].ravel()])
+	return np.concatenate([np.round(values*QUANTUM),
+		store.length[:count]]).astype(np.int16)
+
+def unpack_state(match, state, later=None, alpha=0.0):
+	# writes a packed state into the store of match
+	# with later, the positions are blended: alpha 0 is state, 1 is later
+	store = match.store
+	count = len(store.pieces)
+	values = state[:-count].astype(float)
+	if later is not None:
+		values += (later[:-count] - values)*alpha
+	values /= QUANTUM
+	store.coords[:count] = values[:count*2].reshape(count, 2)
+	store.vertices[:count*store.vertex_slots] = values[count*2:].reshape(-1, 2)
+	store.length[:count] = state[-count:]
+	store.dirty[:count] = True
+
+def parts_mask(match, names):
+	# bit i is set when names[i] is in play
+	mask = 0
+	for i, name in enumerate(names):
+		if name in match.parts:
+			mask |= 1 << i
+	return mask
+
+class snapshot:
+	''' A decoded snapshot kept by a client.'''
+	def __init__(self, tick, state, parts, scores):
+		self.tick = tick
+		self.state = state
+		self.parts = parts
+		self.scores = scores
+
+class remote:
+	''' What the server knows about one client.'''
+	def __init__(self, address, paddle):
+		self.address = address
+		self.paddle = paddle # "paddleA", "paddleB" or None for a spectator
+		self.mask = 0
+		self.sequence = 0 # newest input received
+		self.applied = 0 # newest input used by a tick
+		self.acked = 0 # newest snapshot tick the client has
+		self.sent = {} # tick: packed state of snapshots sent
+		self.last_heard = clock()
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.snapshots = 0
+		self.full_snapshots = 0
+
+class server(asyncio.DatagramProtocol):
+	''' Runs the game at a fixed tick (like top_level) for up to two players
+	and any number of spectators, and sends a snapshot to every client at
+	snapshot_rate per second. Players are given the free paddle when they
+	say hello. The game stands still while nobody is connected.'''
+	def __init__(self, seed=None, tick=0.005, snapshot_rate=30, timeout=5.0):
+		self.match = game(seed=seed)
+		self.names = sorted(all_parts(self.match))
+		self.clock = scheduler(tick=tick, frame=1.0/snapshot_rate)
+		self.timeout = timeout # seconds of silence before a client is dropped
+		self.tick = 0
+		self.clients = {}
+		self.departed = [] # clients that left, kept for report
+		self.transport = None
+
+	def connection_made(self, transport):
+		self.transport = transport
+
+	def send(self, client, data):
+		self.transport.sendto(data, client.address)
+		client.bytes_sent += len(data)
+
+	def datagram_received(self, data, address):
+		kind = data[0]
+		client = self.clients.get(address)
+		if kind == HELLO:
+			if client is None:
+				taken = [other.paddle for other in self.clients.values()]
+				free = [paddle for paddle in PADDLES if paddle not in taken]
+				client = remote(address, free[0] if free else None)
+				self.clients[address] = client
+			paddle = PADDLES.index(client.paddle) if client.paddle else 255
+			self.send(client, WELCOME_HEADER.pack(WELCOME, paddle,
+				self.match.seed, self.clock.tick) + "\n".join(self.names).encode())
+		if client is None:
+			return
+		client.bytes_received += len(data)
+		client.last_heard = clock()
+		if kind == INPUT:
+			kind, sequence, acked, mask = INPUT_PACKET.unpack(data)
+			if sequence > client.sequence: # older inputs arrived too late
+				client.sequence = sequence
+				client.mask = mask
+			if acked > client.acked and acked in client.sent:
+				client.acked = acked
+		elif kind == BYE:
+			self.departed.append(self.clients.pop(address))
+
+	def step(self):
+		# one tick, like top_level.step, with the inputs of both players
+		self.tick += 1
+		mask = 0
+		for client in self.clients.values():
+			if client.paddle is not None:
+				up, down = INPUT_BITS[client.paddle]
+				mask |= client.mask & (up | down) # only its own paddle
+			client.applied = client.sequence
+		self.match.update_pieces()
+		self.match.apply_input(mask)
+		if self.match.update_score():
+			self.match.reset_pieces()
+
+	def send_snapshots(self):
+		# sends every client the current state, as a difference from the
+		# last snapshot it acknowledged when we still have that one
+		state = pack_state(self.match)
+		parts = parts_mask(self.match, self.names)
+		for client in list(self.clients.values()):
+			if clock() - client.last_heard > self.timeout:
+				self.departed.append(self.clients.pop(client.address))
+				continue
+			base = client.sent.get(client.acked)
+			if base is None:
+				base_tick = 0
+				body = state
+				client.full_snapshots += 1
+			else:
+				base_tick = client.acked
+				body = state - base # int16 arithmetic wraps, and so does the sum
+			self.send(client, SNAPSHOT_HEADER.pack(SNAPSHOT, self.tick, base_tick,
+				client.applied, self.match.score_player1, self.match.score_player2,
+				parts) + zlib.compress(body.tobytes()))
+			client.snapshots += 1
+
+			client.sent[self.tick] = state
+			for tick in [tick for tick in client.sent if tick < client.acked]:
+				del client.sent[tick]
+			if len(client.sent) > HISTORY:
+				del client.sent[min(client.sent)]
+
+	async def run(self, duration=None):
+		# game loop: fixed ticks and snapshots at their own rate
+		start = clock()
+		self.clock.reset()
+		while duration is None or clock() - start < duration:
+			if not self.clients:
+				await asyncio.sleep(0.05)
+				self.clock.reset()
+				continue
+			for i in range(self.clock.advance()):
+				self.step()
+			# tick 0 is never sent, base tick 0 means no base
+			if self.clock.frame_due() and self.tick:
+				self.send_snapshots()
+			await asyncio.sleep(self.clock.next_delay()/1000.0)
+
+	def report(self, seconds):
+		# bandwidth of every client as seen by the server
+		result = {}
+		for client in list(self.clients.values()) + self.departed:
+			result["%s:%d" % client.address[:2]] = {"paddle": client.paddle,
+				"snapshots": client.snapshots, "full_snapshots": client.full_snapshots,
+				"kbytes_per_second_out": client.bytes_sent/1000.0/seconds,
+				"kbytes_per_second_in": client.bytes_received/1000.0/seconds}
+		return result
+
+class client(asyncio.DatagramProtocol):
+	''' Sends input to a server and keeps a copy of the game (a game with the
+	server's seed) whose store is overwritten with the snapshots received,
+	so the usual board can draw it. The paddle is moved by policy (as in
+	pong_headless) or, with a Tkinter parent, by the keyboard: either set
+	of keys moves the paddle the server gave us. loss drops that fraction
+	of incoming snapshots on purpose, to test the game on a bad network.'''
+	def __init__(self, policy=None, parent=None, interpolation=0.1, frame=1/60.0,
+			loss=0.0):
+		self.policy = policy
+		self.parent = parent
+		self.interpolation = interpolation # seconds we draw behind the server
+		self.frame = frame
+		self.loss = loss
+		self.random = random.Random()
+		self.transport = None
+		self.match = None # copy of the game, made when the server welcomes us
+		self.paddle = None
+		self.field = None
+		self.director = None
+		self.running = True
+
+		self.snapshots = {} # tick: snapshot
+		self.latest = 0 # newest snapshot tick decoded
+		self.offset = None # server time minus our clock
+		self.drawn = None # parts and scores of the state last drawn
+		self.sequence = 0
+		self.sent_times = {} # input sequence: time it was sent
+		self.latencies = [] # seconds from sending an input to seeing it used
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.received = 0
+		self.undecodable = 0
+
+	def connection_made(self, transport):
+		self.transport = transport
+
+	def send(self, data):
+		self.transport.sendto(data)
+		self.bytes_sent += len(data)
+
+	def datagram_received(self, data, address):
+		self.bytes_received += len(data)
+		kind = data[0]
+		if kind == WELCOME and self.match is None:
+			kind, paddle, seed, tick = WELCOME_HEADER.unpack_from(data)
+			self.welcome(paddle, seed, tick,
+				data[WELCOME_HEADER.size:].decode().split("\n"))
+		elif kind == SNAPSHOT and self.match is not None:
+			if self.random.random() < self.loss:
+				return
+			self.receive(data)
+
+	def welcome(self, paddle, seed, tick, names):
+		self.paddle = PADDLES[paddle] if paddle < len(PADDLES) else None
+		self.tick_seconds = tick
+		self.match = game(seed=seed)
+		self.names = names
+		self.pieces = all_parts(self.match)
+		if self.parent is not None:
+			from pong_view import board
+			from pong_control import controls
+			self.director = controls(self.parent, self.match)
+			self.director.quit.config(command=self.stop)
+			self.parent.protocol("WM_DELETE_WINDOW", self.stop)
+			self.field = board(self.parent, self.match)
+
+	def receive(self, data):
+		# decodes a snapshot against the base snapshot it names
+		kind, tick, base_tick, applied, score1, score2, parts = (
+			SNAPSHOT_HEADER.unpack_from(data))
+		body = np.frombuffer(zlib.decompress(data[SNAPSHOT_HEADER.size:]),
+			dtype=np.int16)
+		if base_tick:
+			base = self.snapshots.get(base_tick)
+			if base is None:
+				self.undecodable += 1
+				return
+			body = base.state + body
+		self.snapshots[tick] = snapshot(tick, body, parts, (score1, score2))
+		if len(self.snapshots) > HISTORY:
+			del self.snapshots[min(self.snapshots)]
+		self.latest = max(self.latest, tick)
+		self.received += 1
+
+		now = clock()
+		# newest input the server has used: input to state latency
+		if applied in self.sent_times:
+			self.latencies.append(now - self.sent_times[applied])
+		for sequence in [s for s in self.sent_times if s <= applied]:
+			del self.sent_times[sequence]
+		# server time follows the earliest arrivals, slowly letting go of
+		# old ones in case the server fell behind
+		sample = tick*self.tick_seconds - now
+		if self.offset is None or sample > self.offset:
+			self.offset = sample
+		else:
+			self.offset -= 0.0005
+
+	def send_input(self):
+		mask = 0
+		if self.paddle is not None:
+			up, down = INPUT_BITS[self.paddle]
+			if self.policy is not None:
+				move = self.policy(self.match, self.paddle) if self.latest else 0
+				mask = up if move < 0 else down if move > 0 else 0
+			elif self.director is not None:
+				keys = self.director.get_mask()
+				ups = INPUT_BITS["paddleA"][0] | INPUT_BITS["paddleB"][0]
+				downs = INPUT_BITS["paddleA"][1] | INPUT_BITS["paddleB"][1]
+				mask = (up if keys & ups else 0) | (down if keys & downs else 0)
+		self.sequence += 1
+		self.sent_times[self.sequence] = clock()
+		if len(self.sent_times) > 1000: # the server is not answering
+			del self.sent_times[min(self.sent_times)]
+		self.send(INPUT_PACKET.pack(INPUT, self.sequence, self.latest, mask))
+
+	def render(self):
+		# puts the state of interpolation seconds ago into the copy of the game
+		if not self.snapshots:
+			return
+		target = (clock() + self.offset - self.interpolation)/self.tick_seconds
+		ticks = sorted(self.snapshots)
+		before = [tick for tick in ticks if tick <= target]
+		after = [tick for tick in ticks if tick > target]
+		first = self.snapshots[before[-1] if before else ticks[0]]
+		second = self.snapshots[after[0]] if after and before else None
+		if (second is not None and second.parts == first.parts and
+				second.scores == first.scores): # no blending across resets
+			alpha = (target - first.tick)/float(second.tick - first.tick)
+			unpack_state(self.match, first.state, second.state, alpha)
+		else:
+			unpack_state(self.match, first.state)
+
+		if self.drawn != (first.parts, first.scores):
+			self.match.parts = dict((name, self.pieces[name])
+				for i, name in enumerate(self.names) if first.parts >> i & 1)
+			self.match.score_player1, self.match.score_player2 = first.scores
+			if self.field is not None:
+				self.field.initUI()
+			self.drawn = (first.parts, first.scores)
+		elif self.field is not None:
+			self.field.update_UI()
+
+	def stop(self):
+		self.running = False
+
+	async def run(self, duration=None):
+		# says hello until welcomed, then sends input and draws every frame
+		start = clock()
+		while self.running and (duration is None or clock() - start < duration):
+			if self.match is None:
+				self.send(bytes([HELLO]))
+				await asyncio.sleep(0.2)
+				continue
+			self.send_input()
+			self.render()
+			if self.parent is not None:
+				self.parent.update()
+			await asyncio.sleep(self.frame)
+		if self.transport is not None:
+			self.send(bytes([BYE]))
+			self.transport.close()
+
+	def report(self, seconds):
+		latencies = np.array(self.latencies)*1000
+		if len(latencies) == 0:
+			latencies = np.array([np.nan])
+		return {"paddle": self.paddle, "snapshots": self.received,
+			"undecodable": self.undecodable,
+			"kbytes_per_second_in": self.bytes_received/1000.0/seconds,
+			"kbytes_per_second_out": self.bytes_sent/1000.0/seconds,
+			"bytes_per_snapshot": self.bytes_received/max(self.received, 1),
+			"input_latency_ms": {"p50": float(np.percentile(latencies, 50)),
+				"p99": float(np.percentile(latencies, 99)),
+				"max": float(latencies.max())},
+			"interpolation_ms": self.interpolation*1000}
+
+async def connect(player, host, port):
+	loop = asyncio.get_running_loop()
+	await loop.create_datagram_endpoint(lambda: player, remote_addr=(host, port))
+	return player
+
+async def serve(host, address, port):
+	# runs a server until it is stopped
+	loop = asyncio.get_running_loop()
+	await loop.create_datagram_endpoint(lambda: host, local_addr=(address, port))
+	await host.run()
+
+async def join(player, host, port):
+	# runs a client until it quits, returns its report
+	await connect(player, host, port)
+	start = clock()
+	await player.run()
+	return {"clients": [player.report(clock() - start)]}
+
+async def local_test(seconds=5.0, players=2, loss=0.0, seed=None):
+	# server and bot clients talking over localhost, returns their reports
+	loop = asyncio.get_running_loop()
+	host = server(seed=seed)
+	transport, protocol = await loop.create_datagram_endpoint(lambda: host,
+		local_addr=("127.0.0.1", 0))
+	port = transport.get_extra_info("sockname")[1]
+	bots = [await connect(client(policy=track_ball, loss=loss), "127.0.0.1", port)
+		for i in range(players)]
+	await asyncio.gather(host.run(seconds), *[bot.run(seconds) for bot in bots])
+	reports = {"server": host.report(seconds),
+		"clients": [bot.report(seconds) for bot in bots]}
+	transport.close()
+	return reports
+
+def print_report(report):
+	print("%-8s %6s %6s %8s %8s %10s %10s" % ("paddle", "snaps", "kB/s in",
+		"kB/s out", "B/snap", "input p50", "input p99"))
+	for result in report["clients"]:
+		print("%-8s %6d %6.1f %8.2f %8.0f %8.1fms %8.1fms" % (result["paddle"],
+			result["snapshots"], result["kbytes_per_second_in"],
+			result["kbytes_per_second_out"], result["bytes_per_snapshot"],
+			result["input_latency_ms"]["p50"], result["input_latency_ms"]["p99"]))
+	for address, result in sorted(report.get("server", {}).items()):
+		print("server to %s: %d snapshots, %d full, %.1f kB/s" % (address,
+			result["snapshots"], result["full_snapshots"],
+			result["kbytes_per_second_out"]))
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(description="Pong over the network")
+	parser.add_argument("mode", choices=["server", "client", "test"])
+	parser.add_argument("host", nargs="?", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=5050)
+	parser.add_argument("--seed", type=int)
+	parser.add_argument("--bot", action="store_true",
+		help="client paddle follows the ball instead of the keyboard")
+	parser.add_argument("--seconds", type=float, default=5.0,
+		help="length of the test")
+	parser.add_argument("--loss", type=float, default=0.0,
+		help="fraction of snapshots the test clients drop")
+	args = parser.parse_args()
+
+	if args.mode == "server":
+		asyncio.run(serve(server(seed=args.seed), args.host, args.port))
+	elif args.mode == "client":
+		if args.bot:
+			player = client(policy=track_ball)
+		else:
+			import tkinter
+			player = client(parent=tkinter.Tk())
+		print_report(asyncio.run(join(player, args.host, args.port)))
+	else:
+		print_report(asyncio.run(local_test(args.seconds, loss=args.loss,
+			seed=args.seed)))
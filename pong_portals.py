@@ -0,0 +1,86 @@
+from __future__ import print_function
+
+import random
+import numpy as np
+
+''' Portal networks. network() fills a game's Portal with many portal
+pairs and routes: both ways, one way, and exits picked at random by
+weight. The Portal compiles its boxes and jumps into arrays and a grid of
+cells, so one ball is looked up in its cell and many balls in one array
+test, however many portals there are.'''
+
+def network(gate, pairs=12, seed=None, left=150, right=450, top=20, bottom=280):
+	# adds pairs of portals at random places between left and right,
+	# top and bottom; every third pair goes one way only, and every third
+	# sends the ball on to its partner or, half as often, to any portal
+	# returns the names of the new portals
+	# the new portals are in play from the next reset with the gate chosen
+	rng = random.Random(seed)
+	names = []
+	for pair in range(pairs):
+		ends = []
+		for end in range(2):
+			size = [15, 3] if rng.random() < 0.5 else [3, 15]
+			coords = [rng.uniform(left, right), rng.uniform(top, bottom)]
+			ends.append(gate.add_line(coords, size))
+		first, second = ends
+		if pair % 3 == 1:
+			gate.link(first, second) # second keeps the default exit
+		elif pair % 3 == 2:
+			gate.link(first, second, 2.0)
+			gate.link(first, rng.choice([name for name in gate.line_list
+				if name != first]), 1.0)
+			gate.link(second, first)
+		else:
+			gate.link(first, second)
+			gate.link(second, first)
+		names.extend(ends)
+	return names
+
+def brute_find(gate, x, y):
+	# the portal a point is in, testing every portal in turn
+	for i, name in enumerate(gate.line_list):
+		left, top, right, bottom = gate.lines[name].positions[[0, 1, 2, 5]]
+		if left < x < right and top < y < bottom:
+			return i
+	return None
+
+if __name__ == "__main__":
+	import sys
+	import time
+	from pong_model import game
+	from pong_headless import headless
+	# cost of finding the portal of one ball and of many balls against
+	# the number of portals, checked against testing every portal
+	balls = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+	rng = np.random.RandomState(0)
+	for pairs in [1, 10, 30, 100]:
+		match = game(seed=1)
+		network(match.gate, pairs - 1, seed=pairs)
+		gate = match.gate
+		gate.compile()
+		points = rng.uniform([100, 0], [500, 300], (20000, 2))
+		# points in portals too, or most lookups would find nothing
+		boxes = gate.boxes[rng.randint(len(gate.boxes), size=len(points)//2)]
+		points[:len(boxes)] = rng.uniform(boxes[:, 0:2], boxes[:, 2:4])
+		point_list = points.tolist()
+		start = time.time()
+		found = [gate.find(x, y) for x, y in point_list]
+		one = (time.time() - start)/len(point_list)
+		start = time.time()
+		expected = [brute_find(gate, x, y) for x, y in point_list[:2000]]
+		loop = (time.time() - start)/2000
+		many = gate.find_many(points)
+		start = time.time()
+		for i in range(20):
+			gate.find_many(points[:balls])
+		many_time = (time.time() - start)/20
+		wrong = sum(a != b for a, b in zip(found, expected))
+		wrong += sum((-1 if a is None else a) != b for a, b in zip(found, many))
+
+		match.fixed_obstacle = "gate"
+		match.reset_pieces(new_game=1)
+		result = headless(match).run(5000)
+		print("%4d portals: one ball %.1f us (loop %.1f us), %d balls %.3f ms, "
+			"%d wrong, game %.0f ticks/s" % (len(gate.line_list), one*1e6,
+			loop*1e6, balls, many_time*1000, wrong, result["ticks_per_second"]))
@@ -0,0 +1,267 @@
+from __future__ import print_function
+
+import subprocess
+import numpy as np
+
+''' Drawing without Tkinter. A framebuffer draws the outlines of the pieces
+in play and the standing bricks (the same positions and colours board
+uses) into a numpy RGB image, all lines of a frame in one vectorized pass.
+Frames can be written to a memory-mapped raw file or piped to a video
+encoder (ffmpeg).'''
+
+# palette of the colours used by shape_style, and of the bricks (as Tk
+# draws them in board)
+COLORS = ["white", "red", "yellow", "green", "blue", "orange"]
+PALETTE = np.array([(255, 255, 255), (255, 0, 0), (255, 255, 0), (0, 255, 0),
+	(0, 0, 255), (255, 165, 0)], dtype=np.uint8)
+BRICK = COLORS.index("orange")
+SMOOTH_STEPS = 8 # points per corner of a smoothed outline
+
+def shape_style(name, shape):
+	# colour name and smoothing of a piece, used by board and framebuffer
+	# the name of the piece class picks the colour (and smoothing for the
+	# ball), portals and monster are recognised by their key
+	is_smooth = 0
+	color = "white"
+	if shape.__class__.__name__ == 'circle':
+		is_smooth = 1
+		color = "white"
+	if shape.__class__.__name__ == 'Obstacle':
+		color = "red"
+	if shape.__class__.__name__ == 'chaotic_field':
+		color = "yellow"
+	if name[0:6] == "portal":
+		color = "green"
+	if name[0:7] == 'monster':
+		color = "blue"
+	return color, is_smooth
+
+def smooth_weights(corners, steps=SMOOTH_STEPS):
+	# matrix turning the corners of a closed outline into the points of the
+	# curve Tk draws with smooth=1: one parabola per corner, from the middle
+	# of one side to the middle of the next, with the corner as control point
+	t = np.linspace(0, 1, steps)[:, None]
+	weights = np.zeros((corners, steps, corners))
+	for i in range(corners):
+		weights[i, :, i-1] += (1-t[:, 0])**2/2
+		weights[i, :, i] += (1-t[:, 0])**2/2 + 2*(1-t[:, 0])*t[:, 0] + t[:, 0]**2/2
+		weights[i, :, (i+1) % corners] += t[:, 0]**2/2
+	weights = weights.reshape(-1, corners)
+	return np.concatenate([weights, weights[:1]]) # closed, like the outline
+
+class framebuffer:
+	''' An RGB image (height, width, 3) of uint8 that is drawn into again
+	for every frame. draw() can also draw into another array of the same
+	shape, like the next frame of a raw_writer, to avoid a copy.'''
+	def __init__(self, width=600, height=300, background=(0, 0, 0)):
+		self.width = width
+		self.height = height
+		# empty image copied in to clear a frame (much faster than
+		# broadcasting the background colour every frame)
+		self.blank = np.zeros((height, width, 3), dtype=np.uint8)
+		self.blank[:] = background
+		self.pixels = self.blank.copy()
+		self.smooth = {} # smooth_weights by number of corners
+		self.rings = {} # pixel offsets of a ball outline by radius
+
+	def draw(self, match, out=None):
+		# draws every piece in play and the standing bricks, returns the image
+		if out is None:
+			out = self.pixels
+		np.copyto(out, self.blank)
+		outlines = []
+		colors = []
+		lines = []
+		line_colors = []
+		for name, shape in match.parts.items():
+			color, is_smooth = shape_style(name, shape)
+			points = shape.outline
+			if is_smooth:
+				corners = len(points) - 1
+				if corners not in self.smooth:
+					self.smooth[corners] = smooth_weights(corners)
+				points = np.dot(self.smooth[corners], points[:-1])
+			outlines.append(points)
+			colors.append(COLORS.index(color))
+		if outlines:
+			# one list of points for all outlines, without the lines that
+			# would join the end of one outline to the start of the next
+			sizes = np.array([len(points) for points in outlines])
+			points = np.concatenate(outlines)
+			segments = np.concatenate([points[:-1], points[1:]], axis=1)
+			joins = np.cumsum(sizes)[:-1] - 1
+			keep = np.ones(len(segments), dtype=bool)
+			keep[joins] = False
+			lines.append(segments[keep])
+			line_colors.append(np.repeat(colors, sizes - 1))
+		bricks = getattr(match, "bricks", None)
+		if bricks is not None:
+			# the four sides of each standing brick, in the same pass
+			boxes = bricks.boxes()[0]
+			left, top, right, bottom = boxes.astype(float).T
+			sides = np.stack([
+				np.stack([left, top, right, top], axis=1),
+				np.stack([right, top, right, bottom], axis=1),
+				np.stack([right, bottom, left, bottom], axis=1),
+				np.stack([left, bottom, left, top], axis=1)], axis=1)
+			lines.append(sides.reshape(-1, 4))
+			line_colors.append(np.full(4*len(boxes), BRICK, dtype=int))
+		if lines:
+			self.lines(out, np.concatenate(lines), np.concatenate(line_colors))
+		balls = getattr(match, "balls", None)
+		if balls is not None and balls.count:
+			# drawn the size of the game's ball
+			self.dots(out, balls.coords[:balls.count], match.ball.dimensions[0])
+		return out
+
+	def dots(self, out, centers, radius, color=0):
+		# draws a ring of radius around each of (N, 2) centers, all rings
+		# in one pass (the extra balls of a pong_multiball.ball_set)
+		# the pixels are marked in a mask, so pixels of rings that overlap
+		# are coloured once, one channel at a time
+		if radius not in self.rings:
+			angle = np.linspace(0, 2*np.pi, int(8*radius), endpoint=False)
+			ring = np.rint(radius*np.stack([np.cos(angle), np.sin(angle)], 1))
+			self.rings[radius] = np.unique(ring.astype(int), axis=0)
+			self.mask = np.zeros(self.width*self.height, dtype=bool)
+		ring = self.rings[radius]
+		middle = np.rint(centers).astype(int)
+		x = middle[:, 0]
+		y = middle[:, 1]
+		# rings clear of the edges need no test, each is its flat center
+		# plus the flat offsets of the ring
+		reach = np.abs(ring).max()
+		clear = ((x >= reach) & (x < self.width - reach) & (y >= reach) &
+			(y < self.height - reach))
+		flat = (y[clear]*self.width + x[clear])[:, None]
+		spots = [(flat + ring[:, 1]*self.width + ring[:, 0]).ravel()]
+		edge = ~clear
+		if edge.any():
+			xs = (x[edge, None] + ring[:, 0]).ravel()
+			ys = (y[edge, None] + ring[:, 1]).ravel()
+			inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+			spots.append(ys[inside]*self.width + xs[inside])
+		mask = self.mask
+		mask.fill(False)
+		for spot in spots:
+			mask[spot] = True
+		marked = np.flatnonzero(mask)
+		pixels = out.reshape(-1, 3)
+		for channel, value in enumerate(PALETTE[color].tolist()):
+			pixels[:, channel][marked] = value
+
+	def lines(self, out, segments, colors):
+		# draws (M, 4) lines [x1, y1, x2, y2] in (M,) colours (PALETTE index)
+		# each line gets one point per pixel along its longer side
+		x1, y1, x2, y2 = segments.T
+		dx = x2 - x1
+		dy = y2 - y1
+		steps = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(int) + 1
+		line = np.repeat(np.arange(len(segments)), steps)
+		first = np.cumsum(steps) - steps
+		t = ((np.arange(len(line)) - first[line]) /
+			np.maximum(steps - 1, 1)[line].astype(float))
+		xs = np.rint(x1[line] + dx[line]*t).astype(int)
+		ys = np.rint(y1[line] + dy[line]*t).astype(int)
+		inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+		pixels = out.reshape(-1, 3) # out is contiguous, so this is a view
+		pixels[ys[inside]*self.width + xs[inside]] = PALETTE[colors[line[inside]]]
+
+class raw_writer:
+	''' Frames in a memory-mapped file of raw RGB (height, width, 3) images,
+	one after the other. next_frame() gives the array of the next frame
+	so it can be drawn into directly. The file grows by blocks of frames
+	and is cut to the frames written by close().'''
+	def __init__(self, path, width=600, height=300, block=256):
+		self.path = path
+		self.shape = (height, width, 3)
+		self.block = block
+		self.count = 0
+		self.frames = None
+		open(path, "wb").close()
+		self.grow()
+
+	def grow(self):
+		# makes the file longer by block frames and maps it again
+		capacity = self.block if self.frames is None else len(self.frames) + self.block
+		if self.frames is not None:
+			self.frames.flush()
+		with open(self.path, "r+b") as f:
+			f.truncate(capacity*int(np.prod(self.shape)))
+		self.frames = np.memmap(self.path, dtype=np.uint8, mode="r+",
+			shape=(capacity,) + self.shape)
+
+	def next_frame(self):
+		if self.count == len(self.frames):
+			self.grow()
+		frame = self.frames[self.count]
+		self.count += 1
+		return frame
+
+	def write(self, image):
+		self.next_frame()[:] = image
+
+	def close(self):
+		self.frames.flush()
+		del self.frames
+		with open(self.path, "r+b") as f:
+			f.truncate(self.count*int(np.prod(self.shape)))
+
+class encoder_writer:
+	''' Pipes frames to ffmpeg, which must be installed, to make a video.'''
+	def __init__(self, path, width=600, height=300, fps=60):
+		self.process = subprocess.Popen(["ffmpeg", "-loglevel", "error", "-y",
+			"-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "%dx%d" % (width, height),
+			"-r", str(fps), "-i", "-", "-pix_fmt", "yuv420p", path],
+			stdin=subprocess.PIPE)
+		self.count = 0
+
+	def write(self, image):
+		self.process.stdin.write(np.ascontiguousarray(image).data)
+		self.count += 1
+
+	def close(self):
+		self.process.stdin.close()
+		self.process.wait()
+
+def read_frames(path, width=600, height=300):
+	# maps a raw file written by raw_writer as a (frames, height, width, 3) array
+	return np.memmap(path, dtype=np.uint8, mode="r").reshape(-1, height, width, 3)
+
+if __name__ == "__main__":
+	import argparse
+	import time
+	from pong_model import game
+	from pong_headless import headless
+	parser = argparse.ArgumentParser(description="Renders a headless game")
+	parser.add_argument("output", help="raw RGB file, or a video with --encode")
+	parser.add_argument("--ticks", type=int, default=6000)
+	parser.add_argument("--every", type=int, default=3,
+		help="ticks between frames (3 ticks of 5 ms is about 60 fps)")
+	parser.add_argument("--encode", action="store_true",
+		help="pipe the frames to ffmpeg instead of writing raw frames")
+	parser.add_argument("--seed", type=int)
+	args = parser.parse_args()
+
+	runner = headless(game(seed=args.seed))
+	screen = framebuffer()
+	if args.encode:
+		writer = encoder_writer(args.output, fps=int(round(1/(0.005*args.every))))
+	else:
+		writer = raw_writer(args.output)
+	drawing = 0.0
+	start = time.time()
+	for tick in range(args.ticks):
+		runner.tick()
+		if tick % args.every == 0:
+			begin = time.time()
+			if args.encode:
+				writer.write(screen.draw(runner.match))
+			else:
+				screen.draw(runner.match, out=writer.next_frame())
+			drawing += time.time() - begin
+	writer.close()
+	elapsed = time.time() - start
+	print("%d frames in %.2f s (%.0f frames/s drawn, %.1fx real time)" % (
+		writer.count, elapsed, writer.count/drawing if drawing else 0,
+		args.ticks*0.005/elapsed))
@@ -0,0 +1,121 @@
+from __future__ import print_function
+
+import mmap
+import struct
+import time
+import numpy as np
+from pong_model import *
+
+''' Recordings of matches. A recording is a small header (game seed and
+settings) followed by one byte per tick: the input mask given to
+game.apply_input, with the RESTART bit set on ticks where the players
+restarted the game. Since the game's randomness comes from its seed, this
+is all it takes to play the match again exactly.'''
+
+MAGIC = b"PONGRE"
+VERSION = 1
+HEADER = struct.Struct("<6sBBdQ") # magic, version, flags, timestep, seed
+SWEPT = 1 # flag bit
+
+class recorder:
+	''' Writes a recording of a match as it is played. Inputs are buffered
+	and written in blocks, so recording costs almost nothing per tick.
+	The header has no room for levels or extra balls, so a match with
+	either is refused rather than recorded as another game.'''
+	def __init__(self, path, match, block=4096):
+		if match.levels is not None or match.balls is not None:
+			raise ValueError("a match with levels or extra balls cannot be "
+				"recorded")
+		self.file = open(path, "wb")
+		flags = SWEPT if match.swept else 0
+		self.file.write(HEADER.pack(MAGIC, VERSION, flags, match.timestep,
+			match.seed))
+		self.buffer = bytearray()
+		self.block = block
+
+	def record(self, mask):
+		# adds the input mask of one tick
+		self.buffer.append(mask)
+		if len(self.buffer) >= self.block:
+			self.flush()
+
+	def flush(self):
+		self.file.write(bytes(self.buffer))
+		self.file.flush()
+		self.buffer = bytearray()
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+def read_recording(path):
+	# maps a recording into memory
+	# returns the header values and a numpy view of the input masks
+	with open(path, "rb") as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	magic, version, flags, timestep, seed = HEADER.unpack_from(data, 0)
+	if magic != MAGIC or version != VERSION:
+		raise ValueError("%s is not a recording this version can play" % path)
+	count = len(data) - HEADER.size
+	inputs = np.frombuffer(data, dtype=np.uint8, count=count, offset=HEADER.size)
+	settings = {"seed": seed, "swept": bool(flags & SWEPT), "timestep": timestep}
+	return settings, inputs
+
+class player:
+	''' Plays a recording again without Tkinter. step() runs one tick,
+	seek() goes to any tick (going back starts over from the seed) and
+	play() runs to the end as fast as possible.'''
+	def __init__(self, path):
+		self.settings, self.inputs = read_recording(path)
+		self.restart()
+
+	def restart(self):
+		self.match = game(seed=self.settings["seed"])
+		self.match.swept = self.settings["swept"]
+		self.match.timestep = self.settings["timestep"]
+		self.tick = 0
+
+	def step(self):
+		# same steps as top_level.step, with the recorded input
+		mask = int(self.inputs[self.tick])
+		self.match.update_pieces()
+		self.match.apply_input(mask)
+		if self.match.update_score():
+			self.match.reset_pieces()
+		if mask & RESTART:
+			self.match.reset_pieces(new_game=1)
+		self.tick += 1
+
+	def seek(self, tick):
+		tick = min(tick, len(self.inputs))
+		if tick < self.tick:
+			self.restart()
+		while self.tick < tick:
+			self.step()
+
+	def play(self):
+		# plays the rest of the recording and reports the speed
+		start = time.time()
+		first = self.tick
+		self.seek(len(self.inputs))
+		elapsed = time.time() - start
+		ticks = self.tick - first
+		return {"ticks": ticks, "seconds": elapsed,
+			"ticks_per_second": ticks/elapsed if elapsed > 0 else float("inf"),
+			"score_player1": self.match.score_player1,
+			"score_player2": self.match.score_player2}
+
+if __name__ == "__main__":
+	import sys
+	if len(sys.argv) < 2:
+		print("usage: pong_replay.py recording [tick]")
+		sys.exit(1)
+	replay = player(sys.argv[1])
+	if len(sys.argv) > 2:
+		replay.seek(int(sys.argv[2]))
+		print("tick %d: ball at %s, score %d - %d" % (replay.tick,
+			replay.match.ball.coords, replay.match.score_player1,
+			replay.match.score_player2))
+	else:
+		print("%(ticks)d ticks in %(seconds).2f s (%(ticks_per_second).0f ticks/s), "
+			"score %(score_player1)d - %(score_player2)d" % replay.play())
@@ -0,0 +1,124 @@
+from __future__ import print_function
+
+import time
+from pong_model import *
+from pong_loop import clock
+
+''' Rollback for network play. The local player's input is used at once,
+and the remote player's input is guessed (the same as the last one we
+know) until it arrives. When it arrives and the guess was wrong, the game
+goes back to the snapshot of that tick and plays the ticks since again with
+the right input, so both players see the same game without waiting for
+each other.'''
+
+PADDLES = ["paddleA", "paddleB"]
+
+class rollback:
+	''' Runs a game that can go back up to size ticks. Every tick is saved in
+	a snapshot_ring before it is played. set_input gives the real input of
+	a paddle for a tick, in tick order; ticks without it use the last known
+	input of that paddle. update() plays the next tick, after playing
+	again from the first tick that was played with a wrong guess.'''
+	def __init__(self, match=None, size=32):
+		if match is None:
+			match = game()
+		self.match = match
+		self.size = size
+		self.ring = snapshot_ring(match, size)
+		self.tick = 0 # next tick to play
+		self.known = [-1]*len(PADDLES) # last tick with real input, per paddle
+		self.last_input = [0]*len(PADDLES) # newest real input, the guess
+		self.inputs = [[0]*len(PADDLES) for i in range(size)] # used per tick
+		self.wrong = None # first tick played with a wrong guess
+		self.rollbacks = 0
+		self.resimulated = 0
+		self.resimulation_seconds = []
+
+	def set_input(self, paddle, tick, bits):
+		# real input bits (see INPUT_BITS) of paddle for tick
+		# inputs already known are ignored, so they can be sent again
+		number = PADDLES.index(paddle)
+		if tick <= self.known[number]:
+			return
+		if tick != self.known[number] + 1:
+			raise ValueError("input for tick %d of %s came before tick %d" % (
+				tick, paddle, self.known[number] + 1))
+		if tick < self.tick - self.size:
+			raise ValueError("tick %d is no longer kept" % tick)
+		used = self.inputs[tick % self.size]
+		if tick < self.tick and used[number] != bits:
+			if self.wrong is None or tick < self.wrong:
+				self.wrong = tick
+		used[number] = bits
+		self.known[number] = tick
+		self.last_input[number] = bits
+
+	def input_mask(self, tick):
+		# input of both paddles for tick, guessing the unknown ones
+		used = self.inputs[tick % self.size]
+		mask = 0
+		for number in range(len(PADDLES)):
+			if tick > self.known[number]:
+				used[number] = self.last_input[number]
+			mask |= used[number]
+		return mask
+
+	def play(self):
+		# saves then plays one tick, like the headless runner
+		self.ring.save(self.tick)
+		mask = self.input_mask(self.tick)
+		self.match.update_pieces()
+		self.match.apply_input(mask)
+		if self.match.update_score():
+			self.match.reset_pieces()
+		self.tick += 1
+
+	def update(self):
+		# plays the next tick, first correcting wrong guesses
+		# returns the number of ticks played again
+		count = 0
+		if self.wrong is not None:
+			start = clock()
+			target = self.tick
+			self.ring.restore(self.wrong)
+			self.tick = self.wrong
+			self.wrong = None
+			while self.tick < target:
+				self.play()
+				count += 1
+			self.rollbacks += 1
+			self.resimulated += count
+			self.resimulation_seconds.append(clock() - start)
+		self.play()
+		return count
+
+if __name__ == "__main__":
+	import sys
+	import numpy as np
+	from pong_headless import track_ball
+	# plays paddleB with a delay of some ticks, as a remote player would be
+	delay = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+	ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+	runner = rollback(game(seed=1))
+	pending = []
+	start = time.time()
+	for tick in range(ticks):
+		for paddle in PADDLES:
+			up, down = INPUT_BITS[paddle]
+			move = track_ball(runner.match, paddle)
+			bits = up if move < 0 else down if move > 0 else 0
+			if paddle == "paddleA":
+				runner.set_input(paddle, tick, bits)
+			else:
+				pending.append((tick, bits))
+		if len(pending) > delay:
+			runner.set_input("paddleB", *pending.pop(0))
+		runner.update()
+	elapsed = time.time() - start
+	times = np.array(runner.resimulation_seconds)*1000
+	print("%d ticks in %.2f s, %d rollbacks, %.1f ticks played again per "
+		"rollback" % (ticks, elapsed, runner.rollbacks,
+		runner.resimulated/float(max(runner.rollbacks, 1))))
+	if len(times):
+		print("rollback time: p50 %.3f ms, p99 %.3f ms" % (np.percentile(times, 50),
+			np.percentile(times, 99)))
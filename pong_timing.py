@@ -0,0 +1,111 @@
+from __future__ import print_function
+
+import json
+from collections import deque
+import numpy as np
+from pong_loop import clock
+
+# phases timed by default, as (attribute of top_level, method names)
+PHASES = [
+	("match", ["update_pieces", "update_score", "reset_pieces"]),
+	("director", ["get_input"]),
+	("field", ["update_UI", "initUI"]),
+]
+# parts of update_pieces, timed when sub_phases is on
+SUB_PHASES = [("match", ["collide", "sweep", "apply_obstacles", "refresh_walls"])]
+
+# histogram bins in seconds, from 1 microsecond to 1 second
+BINS = np.logspace(-6, 0, 25)
+
+class timer:
+	''' Times phases of the game loop. instrument() replaces methods of an
+	object with timed versions, on that object only, and remove() puts
+	them back. When the timer is not in use nothing is replaced, so it
+	costs nothing. Each phase keeps a rolling window of durations for
+	histograms, and every call is kept as a Chrome trace event (up to
+	max_events) for export().'''
+	def __init__(self, window=1000, max_events=200000, clock=clock):
+		self.window = window
+		self.clock = clock
+		self.origin = clock()
+		self.durations = {}
+		self.events = deque(maxlen=max_events)
+		self.wrapped = []
+		self.last_frame = None
+
+	def instrument(self, target, names):
+		# times the given methods of target (those that exist)
+		for name in names:
+			method = getattr(target, name, None)
+			if method is None:
+				continue
+			setattr(target, name, self.timed(name, method))
+			self.wrapped.append((target, name))
+
+	def instrument_loop(self, loop, sub_phases=False):
+		# times the usual phases of a top_level (or headless) loop
+		phases = PHASES + (SUB_PHASES if sub_phases else [])
+		for attribute, names in phases:
+			if hasattr(loop, attribute):
+				self.instrument(getattr(loop, attribute), names)
+
+	def remove(self):
+		# puts back the original methods
+		for target, name in self.wrapped:
+			delattr(target, name)
+		self.wrapped = []
+
+	def timed(self, name, method):
+		def timed_method(*args, **kwargs):
+			start = self.clock()
+			try:
+				return method(*args, **kwargs)
+			finally:
+				self.add(name, start, self.clock())
+		return timed_method
+
+	def add(self, name, start, end):
+		# records one call of a phase
+		if name not in self.durations:
+			self.durations[name] = deque(maxlen=self.window)
+		self.durations[name].append(end - start)
+		self.events.append((name, start, end))
+
+	def frame(self):
+		# marks a redraw, frame time is the time between redraws
+		now = self.clock()
+		if self.last_frame is not None:
+			self.add("frame", self.last_frame, now)
+		self.last_frame = now
+
+	def histogram(self, name):
+		# counts of recent durations of a phase in the BINS (seconds)
+		counts, edges = np.histogram(list(self.durations.get(name, [])), BINS)
+		return counts, edges
+
+	def summary(self):
+		# milliseconds statistics of the recent calls of every phase
+		result = {}
+		for name, durations in self.durations.items():
+			values = np.array(durations)*1000
+			result[name] = {"count": len(values), "mean_ms": values.mean(),
+				"p50_ms": np.percentile(values, 50),
+				"p99_ms": np.percentile(values, 99), "max_ms": values.max()}
+		return result
+
+	def overlay_text(self):
+		# short text for the on-canvas overlay
+		frames = self.durations.get("frame")
+		if not frames:
+			return ""
+		values = np.array(frames)
+		return "%.0f fps  %.1f ms  p99 %.1f ms" % (1/values.mean(),
+			values.mean()*1000, np.percentile(values, 99)*1000)
+
+	def export(self, path):
+		# writes the recorded calls as Chrome trace events (chrome://tracing)
+		events = [{"name": name, "ph": "X", "pid": 1, "tid": 1,
+			"ts": (start - self.origin)*1e6, "dur": (end - start)*1e6}
+			for name, start, end in self.events]
+		with open(path, "w") as f:
+			json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
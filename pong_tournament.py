@@ -0,0 +1,205 @@
+from __future__ import print_function
+
+import copy
+import multiprocessing
+import random
+import time
+from pong_model import *
+from pong_headless import headless, idle, track_ball, script
+from pong_ai import predictor
+
+''' Bot against bot tournaments. Every pair of entrants plays a number of
+matches on both sides, each match in its own headless game with its own
+seed. Matches are spread over a pool of worker processes and the results
+come back one match at a time, in the order they finish, so they can be
+shown or saved while the tournament is still running.'''
+
+# policies every tournament can use by name
+ENTRANTS = {
+	"idle": idle,
+	"track_ball": track_ball,
+	"sweeper": script([1]*30 + [-1]*33 + [0]*5),
+	"predictor": predictor(seed=0),
+}
+
+def play_match(settings):
+	# plays one match in a worker process and returns its result
+	# settings is a dictionary made by schedule(); the policies in it must
+	# be picklable (module level functions or objects like script)
+	match = game(seed=settings["seed"])
+	match.fixed_obstacle = settings["obstacle"]
+	if settings["obstacle"] is not None:
+		match.reset_pieces(new_game=1)
+	# policies are copied so each match starts them afresh, as in a worker
+	runner = headless(match, policyA=copy.deepcopy(settings["policyA"]),
+		policyB=copy.deepcopy(settings["policyB"]))
+
+	# one entry per point: obstacle in play, ticks, paddle hits, winner
+	points = []
+	start_tick = 0
+	start_hits = 0
+	obstacle = match.obstacle
+	pentagon = match.pentagon
+	start = time.time()
+	while runner.ticks < settings["max_ticks"]:
+		# score_player1 goes up when the ball passes paddleA, so it is
+		# the score of the player with paddleB
+		scored_before = match.score_player2
+		if runner.tick():
+			points.append({"obstacle": obstacle, "pentagon": pentagon,
+				"ticks": runner.ticks - start_tick,
+				"paddle_hits": match.paddle_hits - start_hits,
+				"winner": "A" if match.score_player2 > scored_before else "B"})
+			start_tick = runner.ticks
+			start_hits = match.paddle_hits
+			obstacle = match.obstacle
+			pentagon = match.pentagon
+			if max(match.score_player1, match.score_player2) >= settings["points"]:
+				break
+
+	scoreA = match.score_player2
+	scoreB = match.score_player1
+	if scoreA > scoreB:
+		winner = settings["nameA"]
+	elif scoreB > scoreA:
+		winner = settings["nameB"]
+	else:
+		winner = None
+	return {"id": settings["id"], "seed": settings["seed"],
+		"nameA": settings["nameA"], "nameB": settings["nameB"],
+		"scoreA": scoreA, "scoreB": scoreB, "winner": winner,
+		"ticks": runner.ticks, "seconds": time.time() - start, "points": points}
+
+def schedule(entrants, rounds=1, seed=0, points=5, max_ticks=20000,
+		obstacle=None):
+	# list of match settings: every ordered pair of different entrants
+	# plays rounds matches, so each entrant plays both sides
+	# entrants is a dictionary of name: policy
+	rng = random.Random(seed)
+	names = sorted(entrants)
+	matches = []
+	for repeat in range(rounds):
+		for nameA in names:
+			for nameB in names:
+				if nameA == nameB:
+					continue
+				matches.append({"id": len(matches), "seed": rng.randrange(2**32),
+					"nameA": nameA, "policyA": entrants[nameA],
+					"nameB": nameB, "policyB": entrants[nameB],
+					"points": points, "max_ticks": max_ticks, "obstacle": obstacle})
+	return matches
+
+def play(matches, processes=None, chunksize=1):
+	# plays the matches in a pool of processes (one per core by default)
+	# yields each result as soon as its match is over
+	# processes=0 plays them here, one after the other (for debugging)
+	if processes == 0:
+		for settings in matches:
+			yield play_match(settings)
+		return
+	pool = multiprocessing.Pool(processes)
+	try:
+		for result in pool.imap_unordered(play_match, matches, chunksize):
+			yield result
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+class standings:
+	''' Adds up match results as they arrive: wins, losses and points of
+	each entrant, and length of rallies (ticks and paddle hits per point)
+	for each obstacle.'''
+	def __init__(self):
+		self.entrants = {}
+		self.obstacles = {}
+		self.matches = 0
+		self.ticks = 0
+		self.seconds = 0.0
+
+	def add(self, result):
+		self.matches += 1
+		self.ticks += result["ticks"]
+		self.seconds += result["seconds"]
+		sides = [(result["nameA"], result["scoreA"], result["scoreB"]),
+			(result["nameB"], result["scoreB"], result["scoreA"])]
+		for name, scored, conceded in sides:
+			record = self.entrants.setdefault(name, {"played": 0, "wins": 0,
+				"losses": 0, "draws": 0, "scored": 0, "conceded": 0})
+			record["played"] += 1
+			record["scored"] += scored
+			record["conceded"] += conceded
+			if result["winner"] is None:
+				record["draws"] += 1
+			elif result["winner"] == name:
+				record["wins"] += 1
+			else:
+				record["losses"] += 1
+		for point in result["points"]:
+			record = self.obstacles.setdefault(point["obstacle"], {"points": 0,
+				"ticks": 0, "paddle_hits": 0, "won_by_A": 0})
+			record["points"] += 1
+			record["ticks"] += point["ticks"]
+			record["paddle_hits"] += point["paddle_hits"]
+			if point["winner"] == "A":
+				record["won_by_A"] += 1
+
+	def report(self):
+		# lines of text with the standings and the obstacle statistics
+		lines = ["%-12s %6s %5s %5s %5s %7s" % ("entrant", "played", "won",
+			"lost", "drawn", "points")]
+		ranking = sorted(self.entrants.items(),
+			key=lambda item: (-item[1]["wins"], item[0]))
+		for name, record in ranking:
+			lines.append("%-12s %6d %5d %5d %5d %3d-%-3d" % (name,
+				record["played"], record["wins"], record["losses"],
+				record["draws"], record["scored"], record["conceded"]))
+		lines.append("")
+		lines.append("%-12s %6s %11s %11s" % ("obstacle", "points",
+			"ticks/point", "hits/point"))
+		for name, record in sorted(self.obstacles.items()):
+			lines.append("%-12s %6d %11.0f %11.1f" % (name, record["points"],
+				record["ticks"]/float(record["points"]),
+				record["paddle_hits"]/float(record["points"])))
+		return lines
+
+if __name__ == "__main__":
+	import argparse
+	import json
+	parser = argparse.ArgumentParser(description="Bot against bot tournament")
+	parser.add_argument("--rounds", type=int, default=4,
+		help="matches between each ordered pair of entrants")
+	parser.add_argument("--points", type=int, default=5,
+		help="points needed to win a match")
+	parser.add_argument("--max-ticks", type=int, default=20000,
+		help="ticks after which a match stops")
+	parser.add_argument("--obstacle", help="keep this obstacle for every point")
+	parser.add_argument("--processes", type=int, default=None,
+		help="worker processes (default: one per core, 0: no pool)")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--results", help="file to write each match result to")
+	args = parser.parse_args()
+
+	matches = schedule(ENTRANTS, rounds=args.rounds, seed=args.seed,
+		points=args.points, max_ticks=args.max_ticks, obstacle=args.obstacle)
+	table = standings()
+	output = open(args.results, "w") if args.results else None
+	start = time.time()
+	for result in play(matches, processes=args.processes):
+		table.add(result)
+		if output is not None:
+			output.write(json.dumps(result) + "\n")
+		print("match %3d: %-11s %d - %d %-11s (%d ticks)" % (result["id"],
+			result["nameA"], result["scoreA"], result["scoreB"],
+			result["nameB"], result["ticks"]))
+	elapsed = time.time() - start
+	if output is not None:
+		output.close()
+
+	print("")
+	for line in table.report():
+		print(line)
+	print("\n%d matches, %d ticks in %.1f s (%.0f ticks/s, %.1f worker seconds)" % (
+		table.matches, table.ticks, elapsed, table.ticks/elapsed, table.seconds))
@@ -1,5 +1,10 @@
 
-from Tkinter import *
+try:
+    from Tkinter import *
+except ImportError: # python 3
+    from tkinter import *
+import numpy as np
+from pong_render import shape_style
 
 class board(Frame):
     def __init__(self, parent, game):
@@ -10,6 +15,30 @@ class board(Frame):
         self.canvas.grid(row=0, column = 0, columnspan = 8)
         
         self.game = game # reference to game to access model info
+
+        # canvas items are kept for the whole game and reused after reset
+        # items of pieces that are not in play are hidden, not deleted
+        self.images = {}
+        self.shapes = {}
+        self.names = {} # shape names by their row in the model's store
+        # canvas items of standing bricks by brick index, and the field and
+        # reset they were drawn for (see draw_bricks)
+        self.brick_items = {}
+        self.bricks_drawn = None
+        # oval items of the extra balls (pong_multiball), made as needed and
+        # hidden rather than deleted when there are fewer balls
+        self.ball_items = []
+        self.balls_shown = 0
+
+        # score labels are made once, initUI only changes their text
+        self.label_p1_score_value = Label(self.parent, text='  %s  '
+                 %self.game.score_player1)
+        self.label_p1_score_value.grid(row = 1, column = 2)
+
+        self.label_p2_score_value = Label(self.parent, text='  %s  '
+                 %self.game.score_player2)
+        self.label_p2_score_value.grid(row = 1, column = 4)
+
         self.initUI()
         
         self.label_p1 = Label(self.parent, text = "Player 1")
@@ -20,27 +49,34 @@ class board(Frame):
 
     def initUI(self):
         # makes dictionary of images of each shape
-
-        # Clears canvas and view dictionaries so initUI can be used to reset view
-        self.canvas.delete("all") 
-        self.images = {} 
-        self.shapes = {}
+        # used again after reset: existing images are moved, not remade
 
         # This is where the shapes dictionary is remade after reset
-        # Then the images dictionary is made using the shapes dictionary and the draw_shape method
+        # Then the images dictionary is updated using the shapes dictionary
         self.shapes = self.game.parts
+        self.names = {}
         for key, value in self.shapes.items():
-            pic = self.draw_shape(key, value)
-            self.images[key] = pic
+            if key in self.images:
+                self.canvas.itemconfig(self.images[key], state="normal")
+            else:
+                self.images[key] = self.draw_shape(key, value)
+            self.names[value.index] = key
 
-        #Recreates labels with updated score after reset
-        self.label_p1_score_value = Label(self.parent,text='  %s  '
+        # shapes shown again may have moved while they were hidden
+        self.game.store.touch(list(self.names))
+
+        # hides images of pieces that left the game (like the last obstacle)
+        for key in self.images:
+            if key not in self.shapes:
+                self.canvas.itemconfig(self.images[key], state="hidden")
+
+        self.update_UI()
+
+        # Updates labels with score after reset
+        self.label_p1_score_value.config(text='  %s  '
                  %self.game.score_player1)
-        self.label_p1_score_value.grid(row = 1, column = 2)
-        
-        self.label_p2_score_value = Label(self.parent,text='  %s  ' 
+        self.label_p2_score_value.config(text='  %s  '
                  %self.game.score_player2)
-        self.label_p2_score_value.grid(row = 1, column = 4)
 
     def draw_shape(self, name, shape):
         # used by initUI and updateUI methods to draw individual shapes
@@ -48,21 +84,9 @@ class board(Frame):
         # tkinter create_line method draws lines that outline shape
         # circle is drawn as rectangle with rounded corners.
         # keyword smooth rounds rectangle corners.
-        is_smooth = 0
-        color = "white"
-
-        # checks name of game piece to choose color
-        if shape.__class__.__name__ == 'circle':
-            is_smooth = 1
-            color = "white"
-        if shape.__class__.__name__ == 'Obstacle':
-            color = "red"
-        if shape.__class__.__name__ == 'chaotic_field':
-            color = "yellow"
-        if name[0:6] ==  "portal":
-            color = "green"
-        if name[0:7] == 'monster':
-            color = "blue"
+        # colour and smoothing come from shape_style (shared with the
+        # framebuffer in pong_render)
+        color, is_smooth = shape_style(name, shape)
 
         # calls canvas method to create image
         image = self.canvas.create_line(*shape.positions, 
@@ -70,6 +94,70 @@ class board(Frame):
         return image
 
     def update_UI(self):
-        # updates images dictionary based on shapes dictionary
-        for name in self.images:
-            self.canvas.coords(self.images[name], *self.shapes[name].positions)
\ No newline at end of file
+        # updates images of shapes that moved since they were last drawn
+        # the model's store marks the pieces that move, so shapes that
+        # stand still are not looked at
+        for index in self.game.store.take_dirty().tolist():
+            name = self.names.get(index)
+            if name is not None:
+                self.canvas.coords(self.images[name],
+                    *self.shapes[name].positions)
+
+        # broken bricks leave the canvas, a reset field is drawn again
+        bricks = self.game.bricks
+        if bricks is None:
+            if self.brick_items:
+                self.canvas.delete("brick")
+                self.brick_items = {}
+                self.bricks_drawn = None
+        elif self.bricks_drawn != (bricks, bricks.resets):
+            self.draw_bricks(bricks)
+        else:
+            for index in bricks.take_broken():
+                self.canvas.delete(self.brick_items.pop(index))
+
+        balls = self.game.balls
+        count = balls.count if balls is not None else 0
+        if count or self.balls_shown:
+            self.draw_balls(balls, count)
+
+    def draw_balls(self, balls, count):
+        # moves one oval item to each extra ball, hides the items left over
+        # the balls are taken out by moving others into their rows, so the
+        # items are not tied to a ball, every shown item is moved
+        while len(self.ball_items) < count:
+            self.ball_items.append(self.canvas.create_oval(0, 0, 0, 0,
+                outline="white", tags="balls"))
+        if count:
+            # drawn the size of the game's ball
+            coords = balls.coords[:count]
+            size = self.game.ball.dimensions[0]
+            boxes = np.concatenate([coords - size, coords + size],
+                axis=1).tolist()
+            for item, box in zip(self.ball_items, boxes):
+                self.canvas.coords(item, *box)
+        for item in self.ball_items[count:self.balls_shown]:
+            self.canvas.itemconfig(item, state="hidden")
+        for item in self.ball_items[self.balls_shown:count]:
+            self.canvas.itemconfig(item, state="normal")
+        self.balls_shown = count
+
+    def draw_bricks(self, bricks):
+        # draws every standing brick of a brick field again
+        self.canvas.delete("brick")
+        self.brick_items = {}
+        boxes, indices = bricks.boxes()
+        for index, box in zip(indices.tolist(), boxes.tolist()):
+            self.brick_items[index] = self.canvas.create_rectangle(*box,
+                outline="orange", tags="brick")
+        bricks.take_broken()
+        self.bricks_drawn = (bricks, bricks.resets)
+
+    def show_overlay(self, text):
+        # draws text (like frame rate) in the top left corner of the canvas
+        # the text item is made the first time and changed after that
+        if getattr(self, "overlay", None) is None:
+            self.overlay = self.canvas.create_text(8, 8, anchor="nw",
+                fill="gray", text=text)
+        else:
+            self.canvas.itemconfig(self.overlay, text=text)
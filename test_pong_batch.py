@@ -0,0 +1,50 @@
+from __future__ import print_function
+
+import numpy as np
+import pytest
+from pong_model import game
+from pong_batch import world, OWNER, SWITCHEROO, WALL_BUMPER, WALL_MONSTER, \
+	PADDLE_A, PADDLE_B
+
+''' Tests of the batched world against the model, run with pytest.'''
+
+# (paddle, its center, ball coords, ball velocity) where the ball is about
+# to hit the paddle's side and the border in the same tick
+CORNERS = [
+	("paddleA", [50, 30], [70.5, 11], [-2, -2]),
+	("paddleB", [550, 270], [529.5, 289], [2, 2]),
+]
+
+@pytest.mark.parametrize("paddle, center, coords, velocity", CORNERS)
+def test_corner_hit_like_model(paddle, center, coords, velocity):
+	# one collision step of a game and of a world of one game from the same
+	# pieces: the ball bounces off the same wall in both
+	match = game(seed=1)
+	match.fixed_obstacle = "switcheroo" # no obstacle wall
+	match.fixed_pentagon = False
+	match.reset_pieces(new_game=1)
+	match.parts[paddle].move(reset=2, coords=center)
+	match.parts[paddle].velocity = [0, 0]
+	match.ball.coords = coords
+	match.ball.velocity = velocity
+	match.refresh_walls()
+	match.counter = 0
+	hits = match.find_hits(match.ball)
+	assert len(set(match.segment_walls[hits].tolist())) == 2 # paddle and border
+	for item, allowed, last_wall in match.plan_movers:
+		match.collide(item, allowed, last_wall)
+
+	games = world(1, seed=1)
+	games.obstacle[:] = SWITCHEROO
+	games.paddle_shapes(np.arange(1), 0)
+	games.active[:, (OWNER == WALL_BUMPER) | (OWNER == WALL_MONSTER)] = False
+	body = PADDLE_A if paddle == "paddleA" else PADDLE_B
+	games.centers[0, body] = center
+	games.ball_coords[0] = coords
+	games.ball_velocity[0] = velocity
+	games.counter[:] = 0
+	games.collide()
+
+	assert np.array_equal(games.ball_velocity[0], match.ball.velocity)
+	# the paddle took the hit, so the ball turned round along x
+	assert match.ball.velocity[0] == -velocity[0]
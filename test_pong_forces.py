@@ -0,0 +1,19 @@
+from __future__ import print_function
+
+import numpy as np
+from pong_forces import source, attractor, vortex, force_grid
+
+''' Tests of the force fields, run with pytest.'''
+
+def test_plain_source_adds_nothing():
+	# a source of no particular kind is a zero field, so a grid with one
+	# pulls the same as the grid without it
+	sources = [attractor([200, 100], 3000.0), vortex([400, 200], 20.0)]
+	grid = force_grid(sources)
+	expected = grid.sample_many([[50, 60], [210, 95], [590, 290]])
+	grid.add(source([300, 150], 1000.0))
+	assert np.array_equal(grid.sample_many([[50, 60], [210, 95], [590, 290]]),
+		expected)
+	ax, ay = source([300, 150], 1.0).acceleration(np.ones((2, 3)), np.ones((2, 3)))
+	assert ax.shape == ay.shape == (2, 3)
+	assert not ax.any() and not ay.any()
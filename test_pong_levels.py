@@ -0,0 +1,30 @@
+from __future__ import print_function
+
+import os
+import shutil
+from pong_model import game
+from pong_levels import level_library
+
+''' Tests of the level files, run with pytest.'''
+
+def test_identical_levels_keep_their_own_walls(tmpdir):
+	# copies of one level file have the same hash (and share its cached
+	# arrays), but each is made of its own pieces, so the packed walls of
+	# one must never be used with another in play
+	directory = str(tmpdir)
+	for name in ["one", "two", "three"]:
+		shutil.copy(os.path.join("levels", "corridor.json"),
+			os.path.join(directory, name + ".json"))
+	levels = level_library(directory)
+	match = game(seed=5)
+	match.levels = levels
+	match.reset_pieces(new_game=1)
+	played = set()
+	for reset in range(40):
+		match.reset_pieces()
+		played.add(match.obstacle)
+		owners = set(match.segment_owners.tolist())
+		walls = set(wall.index for wall in match.walls.values())
+		assert owners == walls, (reset, match.obstacle)
+	assert len(played) == 3
+	assert levels.loads == {"compiled": 1, "cached": 2}
@@ -0,0 +1,196 @@
+from __future__ import print_function
+
+import json
+import warnings
+import numpy as np
+import pytest
+import pong_bench
+from pong_model import game, piece, piece_store, segment_hits, segment_hit_rows
+from pong_headless import headless
+
+''' Tests of the model, run with pytest.'''
+
+# (seed, timestep, obstacle) of games where a ball wedged between a paddle
+# and the border used to speed up without end and leave the field
+WEDGED = [(7, 1, "planet"), (7, 4, "planet"), (7, 8, "monster")]
+
+@pytest.mark.parametrize("seed, timestep, obstacle", WEDGED)
+def test_swept_ball_stays_in_field(seed, timestep, obstacle):
+	match = game(seed=seed)
+	match.swept = True
+	match.timestep = timestep
+	match.fixed_obstacle = obstacle
+	match.reset_pieces(new_game=1)
+	runner = headless(match)
+	with warnings.catch_warnings():
+		warnings.simplefilter("error") # an overflow fails the test
+		for tick in range(20000):
+			runner.tick()
+			x, y = match.ball.coords
+			assert np.isfinite(x) and np.isfinite(y), tick
+			assert 0 <= x <= 600 and 0 <= y <= 300, (tick, x, y)
+
+# the benchmark scenarios, see pong_bench
+SCENARIOS = [(obstacle, pentagon)
+	for name, obstacle, pentagon in pong_bench.SCENARIOS]
+
+@pytest.fixture(scope="module")
+def golden():
+	with open(pong_bench.GOLDEN) as f:
+		return json.load(f)
+
+@pytest.mark.parametrize("name, obstacle, pentagon", pong_bench.SCENARIOS)
+def test_golden_trace(golden, name, obstacle, pentagon):
+	# the ball still follows the trace stored by pong_bench --update-golden
+	points = np.array(pong_bench.trace(obstacle, pentagon))
+	assert points.shape == np.shape(golden[name])
+	assert np.abs(points - golden[name]).max() < 1e-6
+
+@pytest.mark.parametrize("obstacle, pentagon", SCENARIOS)
+def test_packed_lines_match_hit_check(obstacle, pentagon):
+	# before every tick, the packed lines segment_hits finds for the ball
+	# are the lines each wall's own hit_check finds
+	runner = pong_bench.make_runner(obstacle, pentagon, backend="numpy")
+	match = runner.match
+	ball = match.ball
+	compared = 0
+	for tick in range(pong_bench.TICKS):
+		hits = np.nonzero(segment_hits(match.segments, match.segment_velocities(),
+			ball.coords, ball.velocity, ball.radius))[0]
+		for key, wall in match.walls.items():
+			expected = wall.hit_check(ball)
+			rows = match.wall_rows[key]
+			found = hits[(hits >= rows.start) & (hits < rows.stop)]
+			if expected is None:
+				assert len(found) == 0, (tick, key)
+			else:
+				assert len(found), (tick, key)
+				assert np.array_equal(match.segments[found[-1]], expected), (tick, key)
+				compared += 1
+		runner.tick()
+	assert compared # the ball did hit walls
+
+@pytest.mark.parametrize("obstacle, pentagon", SCENARIOS)
+def test_backends_play_the_same_game(obstacle, pentagon):
+	# the scalar and numpy backends side by side: every piece's coords and
+	# velocity, and the scores, the same after every tick
+	first = pong_bench.make_runner(obstacle, pentagon, backend="scalar")
+	second = pong_bench.make_runner(obstacle, pentagon, backend="numpy")
+	a = first.match
+	b = second.match
+	for tick in range(pong_bench.TICKS):
+		first.tick()
+		second.tick()
+		assert np.array_equal(a.store.coords, b.store.coords), tick
+		assert np.array_equal(a.store.velocity, b.store.velocity), tick
+		assert (a.score_player1, a.score_player2) == (b.score_player1,
+			b.score_player2), tick
+
+def random_lines(rng, count):
+	# count lines in and around the field with random velocities, a few
+	# of them of zero length
+	segments = rng.uniform(-20, 620, (count, 4))
+	segments[:, 1::2] *= 0.5
+	short = rng.rand(count) < 0.3
+	segments[short, 2:4] = segments[short, 0:2] + rng.uniform(-15, 15,
+		(short.sum(), 2))
+	points = rng.rand(count) < 0.1
+	segments[points, 2:4] = segments[points, 0:2]
+	wall_velocity = rng.uniform(-2, 2, (count, 2))
+	wall_velocity[rng.rand(count) < 0.5] = 0
+	return segments, wall_velocity
+
+def both_backends(segments, wall_velocity, coords, velocity, radius):
+	# rows hit by the scalar and by the numpy backend
+	scalar = segment_hit_rows(segments.tolist(), wall_velocity.tolist(),
+		list(coords), list(velocity), radius)
+	hits = np.nonzero(segment_hits(segments, wall_velocity, coords, velocity,
+		radius))[0]
+	return scalar, hits.tolist()
+
+@pytest.mark.parametrize("seed", range(20))
+def test_backends_find_the_same_lines(seed):
+	# random balls against random lines, with balls placed near lines so
+	# a good share of them hit something
+	rng = np.random.RandomState(seed)
+	segments, wall_velocity = random_lines(rng, 40)
+	hit = 0
+	for test in range(500):
+		velocity = rng.uniform(-6, 6, 2)
+		radius = float(rng.choice([5.0, 10.0, 20.0]))
+		row = rng.randint(len(segments))
+		coords = (segments[row, 0:2] + rng.rand()*(segments[row, 2:4] -
+			segments[row, 0:2]) + rng.uniform(-30, 30, 2))
+		scalar, hits = both_backends(segments, wall_velocity, coords, velocity,
+			radius)
+		assert scalar == hits, (test, coords, velocity, radius)
+		hit += len(hits) > 0
+	assert hit > 50
+
+@pytest.mark.parametrize("seed", range(5))
+def test_backends_agree_on_zero_length_lines(seed):
+	# a line with both ends at one point is never hit by either backend,
+	# even by a ball right on it
+	rng = np.random.RandomState(seed)
+	points = rng.uniform(0, 300, (20, 2))
+	segments = np.hstack([points, points])
+	wall_velocity = rng.uniform(-2, 2, (20, 2))
+	for coords in np.vstack([points, points + rng.uniform(-8, 8, (20, 2))]):
+		scalar, hits = both_backends(segments, wall_velocity, coords,
+			rng.uniform(-6, 6, 2), 10.0)
+		assert scalar == hits == []
+
+@pytest.mark.parametrize("seed", range(5))
+def test_backends_agree_on_touching_balls(seed):
+	# balls that already touch a line, on its face or at one of its ends,
+	# moving towards it, along it or away from it
+	rng = np.random.RandomState(seed)
+	segments, wall_velocity = random_lines(rng, 30)
+	radius = 10.0
+	for row in range(len(segments)):
+		start = segments[row, 0:2]
+		direction = segments[row, 2:4] - start
+		length = np.sqrt((direction**2).sum())
+		if length == 0:
+			continue
+		normal = np.array([-direction[1], direction[0]])/length
+		for place in [0.0, 0.5, 1.0, rng.rand()]:
+			for side in [-1, 1]:
+				coords = start + place*direction + side*radius*normal
+				for velocity in [-side*normal*3, side*normal*3, direction/length*3,
+						rng.uniform(-6, 6, 2)]:
+					scalar, hits = both_backends(segments, wall_velocity, coords,
+						velocity, radius)
+					assert scalar == hits, (row, place, side, velocity)
+
+def test_store_advances_active_pieces_only():
+	# advance_active moves the active pieces and their outlines, as
+	# advance would, and leaves the others where they are
+	store = piece_store(size=2)
+	pieces = [piece([10*i, 5*i], [2, 3], [1, -i], store=store) for i in range(7)]
+	store.activate([5, 1, 3])
+	store.deactivate([3])
+	store.activate([6])
+	assert store.active.tolist() == [1, 5, 6]
+	coords = store.coords.copy()
+	outlines = [part.outline.copy() for part in pieces]
+	store.advance_active(timestep=2)
+	for part, outline in zip(pieces, outlines):
+		moved = 2*part.velocity if part.index in (1, 5, 6) else 0
+		assert np.array_equal(part.coords, coords[part.index] + moved)
+		assert np.array_equal(part.outline, outline + moved)
+
+def test_store_marks_moved_pieces():
+	# take_dirty gives the pieces moved since it was last called: the ball
+	# every tick, never the border
+	match = game(seed=3)
+	match.fixed_obstacle = "planet"
+	match.reset_pieces(new_game=1)
+	runner = headless(match)
+	match.store.take_dirty()
+	for tick in range(200):
+		runner.tick()
+		dirty = match.store.take_dirty().tolist()
+		assert match.ball.index in dirty, tick
+		assert match.border.index not in dirty, tick
+	assert len(match.store.take_dirty()) == 0
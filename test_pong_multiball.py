@@ -0,0 +1,32 @@
+from __future__ import print_function
+
+import numpy as np
+import pytest
+from pong_model import game
+from pong_headless import headless, idle
+from pong_multiball import ball_set
+
+''' Tests of the extra balls against the game's ball, run with pytest.'''
+
+# obstacles whose effects do not use the random generators (the chaotic
+# field kicks the extra balls with their own)
+@pytest.mark.parametrize("obstacle", ["planet", "bumper", "gate"])
+def test_extra_ball_follows_the_ball(obstacle):
+	# an extra ball started where the game's ball is, going its way, takes
+	# the same path off the walls, paddles and obstacle until a point
+	match = game(seed=3)
+	match.fixed_obstacle = obstacle
+	match.fixed_pentagon = False
+	match.reset_pieces(new_game=1)
+	balls = ball_set(seed=1)
+	match.set_balls(balls)
+	balls.spawn(match.ball.coords.copy(), match.ball.velocity.copy())
+	runner = headless(match, policyA=idle, policyB=idle)
+	bounces = match.trajectory_changes
+	for tick in range(3000):
+		if runner.tick():
+			break
+		assert balls.count == 1, tick
+		assert np.allclose(balls.coords[0], match.ball.coords), tick
+		assert np.allclose(balls.velocity[0], match.ball.velocity), tick
+	assert match.trajectory_changes > bounces # the ball did bounce
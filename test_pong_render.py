@@ -0,0 +1,33 @@
+from __future__ import print_function
+
+import numpy as np
+from pong_model import game
+from pong_levels import level_library
+from pong_render import framebuffer, PALETTE, BRICK
+
+''' Tests of the framebuffer against what board draws, run with pytest.'''
+
+def brick_edges(boxes, width=600, height=300):
+	# mask of the pixels on the sides of the given brick boxes, in the frame
+	mask = np.zeros((height + 1, width + 1), dtype=bool)
+	for left, top, right, bottom in np.rint(boxes).astype(int).tolist():
+		mask[[top, bottom], left:right+1] = True
+		mask[top:bottom+1, [left, right]] = True
+	return mask[:height, :width]
+
+def test_bricks_are_drawn_until_broken(tmpdir):
+	# like board, the frames of a breakout level show the standing bricks
+	# and leave out the broken ones (bricks are drawn last, in their own
+	# colour, so the pixels of that colour are exactly their sides)
+	match = game(seed=2)
+	match.levels = level_library("levels", cache=str(tmpdir))
+	match.fixed_obstacle = "breakout"
+	match.reset_pieces(new_game=1)
+	bricks = match.bricks
+	screen = framebuffer()
+	for broken in [0, 10, len(bricks.alive)]:
+		bricks.alive[:broken] = False
+		drawn = (screen.draw(match) == PALETTE[BRICK]).all(axis=2)
+		expected = brick_edges(bricks.boxes()[0])
+		assert np.array_equal(drawn, expected), broken
+	assert not drawn.any()
@@ -0,0 +1,38 @@
+from __future__ import print_function
+
+import os
+import numpy as np
+import pytest
+from pong_model import game
+from pong_headless import headless
+from pong_multiball import ball_set
+from pong_levels import level_library
+from pong_replay import recorder, player
+
+''' Tests of recordings, run with pytest.'''
+
+def test_replay_plays_the_recorded_game(tmpdir):
+	path = os.path.join(str(tmpdir), "match.rec")
+	match = game(seed=11)
+	runner = headless(match, recorder=recorder(path, match))
+	runner.run(3000)
+	runner.recorder.close()
+	replay = player(path)
+	replay.play()
+	assert np.array_equal(replay.match.store.coords, match.store.coords)
+	assert (replay.match.score_player1, replay.match.score_player2) == (
+		match.score_player1, match.score_player2)
+
+def test_levels_and_balls_are_not_recorded(tmpdir):
+	# the header keeps the seed and inputs only, so these would be played
+	# again as another game
+	path = os.path.join(str(tmpdir), "match.rec")
+	match = game(seed=11)
+	match.set_balls(ball_set(keep=3, seed=match.seed))
+	with pytest.raises(ValueError):
+		recorder(path, match)
+	match = game(seed=11)
+	match.levels = level_library("levels", cache=str(tmpdir))
+	with pytest.raises(ValueError):
+		recorder(path, match)
+	assert not os.path.exists(path)